@@ -4,6 +4,7 @@
 import jshbot.botmanager as botmanager # Basically everything
 import jshbot.jbce as jbce # Custom exceptions
 import jshbot.parser as parser
+import jshbot.syntaxmanager as syntaxmanager # Command syntaxes
 import jshbot.configmanager as configmanager
 
 # Database
@@ -11,6 +12,11 @@ import jshbot.tagmanager as tagmanager
 import jshbot.soundtagmanager as soundtagmanager
 import jshbot.usermanager as usermanager
 import jshbot.servermanager as servermanager
+import jshbot.storagemanager as storagemanager
+import jshbot.records as records
+import jshbot.blobmanager as blobmanager
+import jshbot.indexmanager as indexmanager
+import jshbot.statsmanager as statsmanager
 
 # Utilities (Wiki, Wolfram|Alpha, Imgur, etc.)
 import jshbot.decider as decider
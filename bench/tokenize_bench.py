@@ -0,0 +1,31 @@
+"""Times splitting 2000 character messages into arguments, before and after tokenize.
+
+Run from the repository with: python bench/tokenize_bench.py
+"""
+import os, sys, types, random, timeit
+
+# Same as tests/conftest.py: register the repository as the jshbot package
+package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+package = types.ModuleType('jshbot')
+package.__path__ = [package_directory]
+sys.modules['jshbot'] = package
+sys.path.insert(0, os.path.join(package_directory, 'tests'))
+
+from test_parser import split_arguments_before, split_arguments
+
+LENGTH = 2000
+RUNS = 200
+
+def get_messages():
+    random.seed(24)
+    plain = ' '.join(random.choice(['word', 'tag', 'x' * 10]) for _ in range(LENGTH // 4))[:LENGTH]
+    quoted = ' '.join('"{}"'.format('w ' * 5) for _ in range((LENGTH + 1) // 13))
+    escapes = '"' + 'a\\"' * ((LENGTH - 2) // 3) + '"'
+    return [('plain', plain), ('quoted', quoted), ('escapes', escapes)]
+
+if __name__ == '__main__':
+    for name, message in get_messages():
+        assert split_arguments_before(message) == split_arguments(message)
+        for label, function in (('before', split_arguments_before), ('tokenize', split_arguments)):
+            seconds = min(timeit.repeat(lambda: function(message), number=RUNS, repeat=3)) / RUNS
+            print("{:8} {:5} characters  {:8}  {:.3f} ms".format(name, len(message), label, seconds * 1000))
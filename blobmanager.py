@@ -0,0 +1,175 @@
+import os, os.path, sys, mmap, struct, hashlib, threading
+
+from jshbot.configmanager import data_directory
+
+# Content-addressed store for tag texts. Texts are appended to one file and read back through
+# a memory map, so they don't sit in servers data. Records only keep a reference to their text,
+# an (offset, length, hash) tuple, and identical texts (even across servers) are stored once.
+
+HEADER = struct.Struct('<I16s') # Length of the text, then its hash
+
+def get_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+class blob_store:
+    """Append-only file of texts, each one prefixed with its length and hash.
+
+    Nothing is ever overwritten, so the references handed out stay valid until compact.
+    A blob cut short by a crash is dropped when the file is opened again.
+
+    Texts are read and stored from the event loop while compact runs on the writer thread,
+    so everything that touches the file or the mapping holds the lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.mapping = None
+        self.refs = {} # hash: (offset, length, hash)
+        self.size = 0
+        self.missing = set() # Hashes records asked for that aren't in the file
+        self.stored_since = None # Hashes handed out by store since begin_compaction
+        self.lock = threading.Lock()
+        self.open()
+
+    def open(self):
+        self.file = open(self.path, 'a+b')
+        self.refs = {}
+        self.size = 0
+        self.remap()
+        file_size = len(self.mapping) if self.mapping is not None else 0
+        while self.size + HEADER.size <= file_size:
+            length, digest = HEADER.unpack_from(self.mapping, self.size)
+            offset = self.size + HEADER.size
+            if offset + length > file_size: # Cut short
+                break
+            key = sys.intern(digest.hex())
+            self.refs[key] = (offset, length, key)
+            self.size = offset + length
+        if self.size < file_size:
+            print("Dropping {} byte(s) of incomplete tag text at the end of {}".format(file_size - self.size, self.path))
+            self.mapping.close()
+            self.mapping = None
+            self.file.truncate(self.size)
+            self.remap()
+
+    def remap(self):
+        """Maps the file again to see what was appended since the last mapping."""
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        self.file.flush()
+        if os.fstat(self.file.fileno()).st_size > 0: # Empty files can't be mapped
+            self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        self.file.close()
+
+    def store(self, text):
+        """Returns the reference to the given text, appending it first if it's new."""
+        data = text.encode('utf-8')
+        digest = get_hash(data)
+        key = digest.hex()
+        with self.lock:
+            if self.stored_since is not None:
+                self.stored_since.add(key)
+            if key in self.refs:
+                return self.refs[key]
+            # On disk before any record refers to it
+            self.file.write(HEADER.pack(len(data), digest) + data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            key = sys.intern(key)
+            self.refs[key] = (self.size + HEADER.size, len(data), key)
+            self.size += HEADER.size + len(data)
+            return self.refs[key]
+
+    def get_ref(self, key):
+        """Returns the reference for the given hash. Texts that went missing read as empty."""
+        with self.lock:
+            if key in self.refs:
+                return self.refs[key]
+            self.missing.add(key)
+        print("=== ERROR: Tag text {} is missing from {}, so the tag will be empty".format(key, self.path))
+        return (0, 0, key)
+
+    def get_text(self, ref):
+        with self.lock:
+            offset, length, key = self.refs.get(ref[2], ref) # Goes by the hash in case compact moved it
+            if length == 0:
+                return ''
+            if self.mapping is None or offset + length > len(self.mapping):
+                self.remap()
+            return self.mapping[offset:offset + length].decode('utf-8')
+
+    def begin_compaction(self):
+        """Starts keeping track of stored texts, which compact keeps whether or not they are live."""
+        with self.lock:
+            self.stored_since = set()
+
+    def end_compaction(self):
+        with self.lock:
+            self.stored_since = None
+
+    def copy_blobs(self, source, target, refs, keep_keys, copied):
+        for offset, length, key in refs:
+            if key in keep_keys and key not in copied:
+                source.seek(offset - HEADER.size)
+                target.write(source.read(HEADER.size + length))
+                copied.add(key)
+
+    def compact(self, live_keys):
+        """Rewrites the file with only the given hashes, and returns how many bytes were reclaimed.
+
+        Texts stored since begin_compaction are kept too. Most of the copying happens without
+        the lock, so texts can still be read and stored meanwhile. References handed out before
+        still read fine, but should be swapped for new ones from get_ref.
+        """
+        temporary_path = self.path + '.tmp'
+        copied = set()
+        with self.lock:
+            refs = list(self.refs.values())
+            self.file.flush()
+        source = open(self.path, 'rb') # Own handle, since the mapping can be remapped meanwhile
+        target = open(temporary_path, 'wb')
+        try:
+            self.copy_blobs(source, target, refs, live_keys, copied)
+            with self.lock: # Catch up on whatever was stored in the meantime, then swap the files
+                self.copy_blobs(source, target, list(self.refs.values()), live_keys | (self.stored_since or set()), copied)
+                target.flush()
+                os.fsync(target.fileno())
+                target.close()
+                source.close()
+                old_size = self.size
+                self.close()
+                os.replace(temporary_path, self.path)
+                self.open()
+                return old_size - self.size
+        finally:
+            source.close()
+            target.close()
+            self.end_compaction()
+
+    def get_info(self):
+        return "Tag texts: {} ({} bytes)\nMissing tag texts: {}\n".format(len(self.refs), self.size, len(self.missing))
+
+store = None
+
+def get_store():
+    """Returns the tag text store, opening it the first time it is needed."""
+    global store
+    if store is None:
+        store = blob_store(data_directory + '/tag_texts.blob')
+    return store
+
+def store_text(text):
+    return get_store().store(text)
+
+def get_ref(key):
+    return get_store().get_ref(key)
+
+def get_text(ref):
+    return get_store().get_text(ref)
@@ -3,7 +3,7 @@ BOT_DATE = "April 19th, 2016"
 
 import discord, asyncio, sys, os.path, urllib.request, time
 
-from jshbot import configmanager, servermanager, parser
+from jshbot import configmanager, servermanager, indexmanager, parser
 from jshbot.jbce import bot_exception
 
 # This is necessary?
@@ -19,6 +19,7 @@ bot_turned_on_date = time.strftime("%c")
 bot_turned_on_precise = int(time.time())
 
 last_responses_dictionary = {}
+member_indexes = {} # server_id: indexmanager.name_index of the member names in the client cache
 
 async def cycle_loop():
     """Cycles through the avatars and statuses."""
@@ -54,6 +55,7 @@ def on_ready():
     # Grab client ID
     global client_id
     client_id = client.user.id
+    servermanager.invalidate_acl() # The bot is an admin everywhere
 
     # Set bot name
     try:
@@ -90,6 +92,9 @@ def on_ready():
     except discord.HTTPException:
         print("=== ERROR: General HTTP exception thrown - you might be changing colors too fast?")
     
+    # Start writing out servers data in the background
+    asyncio.ensure_future(servermanager.flush_loop())
+
     print("Updating servers information...")
     for server in client.servers:
         update_server(server, update_all=True, force_write=False)
@@ -106,12 +111,15 @@ async def get_response(message, send_typing=True):
     if (message.content and message.content[0] in configmanager.config['command_invokers'] and message.author.id != client.user.id): # Valid invoker from not the bot
         is_private = (type(message.channel) is discord.PrivateChannel)
         if parser.is_command(message.content.partition(' ')[0][1:].lower(), private=is_private): # Valid command
+            acl = servermanager.get_acl(message.server.id) if not is_private else None
             if is_private or (not is_private and # Private - skip checks. Not private - do server checks.
-                    not servermanager.is_banned(server_id=message.server.id, user_id=message.author.id) and # Author is not banned
-                    (not servermanager.is_muted(server_id=message.server.id, channel_id=message.channel.id) or # Server or channel is not muted or
-                    (servermanager.is_admin(message.server.id, message.author.id) and message.content[1:].startswith('admin')))): # Admin is unmuting bot
+                    not acl.is_banned(message.author.id) and # Author is not banned
+                    (not acl.is_muted(message.channel.id) or # Server or channel is not muted or
+                    (acl.is_admin(message.author.id) and message.content[1:].startswith('admin')))): # Admin is unmuting bot
                 try:
                     global last_responses_dictionary
+                    if not is_private: # Users get a record once they use the bot (see lazy_users)
+                        track_user(message.server, message.author)
                     if send_typing:
                         await client.send_typing(message.channel)
                     return await parser.parse(
@@ -161,6 +169,7 @@ def interrupt_broadcast(server_id, channel_id, text):
 
 @client.async_event
 def disconnect_bot():
+    yield from servermanager.wait_for_write() # Don't lose anything still waiting on the flusher
     yield from client.logout()
 
 async def update_color_role(server_id, user_id, color):
@@ -191,6 +200,41 @@ def has_role_permissions(server_id):
             return True
     return False
 
+def get_member(server_id, user_id):
+    """Returns the member from the client cache, or None if they (or the server) can't be found."""
+    server = discord.utils.get(client.servers, id=server_id)
+    if server is None:
+        return None
+    return discord.utils.get(server.members, id=user_id)
+
+def get_member_index(server):
+    """Returns the index over the names of the members of the server, building it if this is the first lookup.
+
+    Kept current by the member events, so lookups don't have to go through every member.
+    """
+    try:
+        return member_indexes[server.id]
+    except KeyError:
+        index = indexmanager.name_index()
+        index.add_all((member.id, (member.name,)) for member in server.members)
+        member_indexes[server.id] = index
+        return index
+
+def update_member_index(server, member, removed=False):
+    """Refreshes the indexed name of the member, if the server has an index yet."""
+    if server.id in member_indexes:
+        if removed:
+            member_indexes[server.id].remove(member.id)
+        else:
+            member_indexes[server.id].add(member.id, (member.name,))
+
+def find_member_ids(server_id, name):
+    """Returns the IDs of every member in the client cache with the given name."""
+    server = discord.utils.get(client.servers, id=server_id)
+    if server is None:
+        return []
+    return sorted(get_member_index(server).find(name))
+
 def get_voice_channel(server_id, voice_channel_id):
     server = discord.utils.get(client.servers, id=server_id)
     return discord.utils.get(server.channels, id=voice_channel_id)
@@ -203,7 +247,7 @@ async def update_bot():
     status = configmanager.config['bot_status'] if len(configmanager.config['bot_status']) <= 1000 else ''
     for server in client.servers:
         #print("DEBUG: Updating bot in server {}".format(str(server)))
-        servermanager.update_user(server.id, client_id, 
+        servermanager.update_user(server.id, client_id, force_write=False, # The flusher picks it up
                 **{'nickname':nickname, 'status':status, 'last_seen':'behind you', 'last_game':'',
                         'color':'#{}'.format(configmanager.config['bot_color'])})
         update_user(server, server.me)
@@ -226,8 +270,8 @@ def update_server(server, update_all=False, force_write=False):
         for channel in server.channels:
             update_channel(server, channel, force_write)
         for user in server.members:
-            update_user(server, user, force_write)
-    servermanager.write_data()
+            if is_tracked(server, user):
+                update_user(server, user, force_write)
 
 def update_channel(server, channel, force_write=False):
     servermanager.update_channel(
@@ -239,17 +283,38 @@ def update_channel(server, channel, force_write=False):
             voice=str(channel.type) == 'voice',
             force_write=force_write)
 
-def update_user(server, user, update_seen=False, force_write=False):
+def get_user_fields(user, update_seen=False):
+    """Returns the fields that servermanager.update_user stores for the given user."""
     last_game = ''
     last_seen = ''
     if type(user) is discord.Member and user.game is not None:
         last_game = str(user.game)
     if update_seen:
-        last_seen = time.strftime("%c")
+        last_seen = int(time.time())
+    return {'name':user.name, 'avatar':user.avatar_url, 'discriminator':str(user.discriminator),
+            'joined':user.joined_at, 'last_game':last_game, 'last_seen':last_seen}
+
+def update_user(server, user, update_seen=False, force_write=False):
     servermanager.update_user(
-            server_id=server.id, user_id=user.id, name=user.name,
-            avatar=user.avatar_url, discriminator=str(user.discriminator),
-            joined=str(user.joined_at), last_game=last_game, last_seen=last_seen, force_write=force_write)
+            server_id=server.id, user_id=user.id, force_write=force_write, **get_user_fields(user, update_seen))
+
+def is_tracked(server, user):
+    """Returns whether or not the user should have their record kept up to date.
+
+    With lazy_users set, only users that have used the bot (or were added with track_user) are.
+    """
+    return not servermanager.get_lazy_users() or servermanager.has_user(server.id, user.id)
+
+def track_user(server, user):
+    """Makes sure the user has a record, so that they are kept up to date from now on."""
+    if not servermanager.has_user(server.id, user.id):
+        update_user(server, user)
+
+def track_user_id(server_id, user_id):
+    """Same as track_user, but from IDs. Does nothing if the member isn't in the client cache."""
+    member = get_member(server_id, user_id)
+    if member is not None:
+        track_user(member.server, member)
                                    
 def remove_server(server):
     servermanager.remove_server(server.id)
@@ -274,6 +339,7 @@ def on_channel_update(before, after):
 def on_server_remove(server):
     print("DEBUG: Removing a server")
     servermanager.remove_server(server.id)
+    member_indexes.pop(server.id, None)
 @client.async_event
 def on_server_update(server):
     print("DEBUG: Updating a server")
@@ -281,18 +347,24 @@ def on_server_update(server):
 @client.async_event
 def on_server_join(server):
     print("DEBUG: Joining a server")
+    member_indexes.pop(server.id, None) # Rebuilt from the new members on the next lookup
     update_server(server, update_all=True)
 @client.async_event # Users
 def on_member_remove(member):
     print("DEBUG: Removing a member")
     servermanager.remove_user(member.server.id, member.id)
+    update_member_index(member.server, member, removed=True)
     update_server(member.server)
 @client.async_event
 def on_member_update(before, after):
     #print("DEBUG: Updating a member ({})".format(after.name)) # Prints VERY frequently
-    update_user(after.server, after, update_seen=True)
+    if before.name != after.name:
+        update_member_index(after.server, after)
+    if is_tracked(after.server, after):
+        update_user(after.server, after, update_seen=True)
 @client.async_event
 def on_member_join(member):
     print("DEBUG: Member joining")
+    update_member_index(member.server, member)
     update_server(member.server)
 
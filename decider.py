@@ -1,26 +1,26 @@
 import json, random, asyncio
 
-from jshbot import usermanager, tagmanager, soundtagmanager
+from jshbot import usermanager, tagmanager, soundtagmanager, syntaxmanager
 from jshbot.jbce import bot_exception
 
-commands_dictionary = {'module_commands':['random', 'rand', 'r'],
-                       'shortcut_commands':['roll', 'flip', 'pick'],
-                       'private_module_commands':['random', 'rand', 'r'],
-                       'private_shortcut_commands':['roll', 'flip', 'pick']}
+# See syntaxmanager. Flip, roll, and pick share some option aliases, so their order matters.
+command_syntaxes = [{'command':'random', 'aliases':['rand', 'r'], 'private':True, 'syntaxes':[
+    {'counts':[0, 2], 'usage':'(<"minimum number"> <"maximum number">)', 'function':'respond_number'},
+    {'options':[['tag', 't']], 'optional':[['popular', 'pop']], 'function':'respond_tag'},
+    {'options':[['soundtag', 'st']], 'optional':[['popular', 'pop']], 'function':'respond_sound_tag'},
+    {'options':[['flip', 'f']], 'shortcuts':['flip'], 'function':'respond_flip'},
+    {'options':[['roll', 'r', 'dice', 'd']], 'arguments':(0, 1), 'usage':'(faces)', 'shortcuts':['roll'],
+        'function':'respond_roll'},
+    {'options':[['pick', 'p', 'choose', 'c', 'decide', 'd', 'fluky', 'f']], 'arguments':(0, None),
+        'usage':'<"choice 1"> <"choice 2"> ("choice 3") ("...")', 'shortcuts':['pick'], 'function':'respond_pick'}]}]
+
+commands_dictionary = syntaxmanager.get_commands_dictionary(command_syntaxes)
 commands = []
 for command_list in list(commands_dictionary.values()):
     for command in command_list:
         commands.append(command)
 
-usage_string = """Usage:
-    !random [(<"minimum number"> <"maximum number">)]
-            [-tag|t] [-soundtag|st]
-            [-flip|f]
-            [-roll|r|dice|d (faces)]
-            [-pick|p|choose|c|decide|d|fluky|f <"choice 1"> <"choice 2"> ("choice 3") ("...")]"""
-
-def get_formatted_usage_string():
-    return "\n```\n{}\n```".format(usage_string)
+usage_string = syntaxmanager.get_usage_string(command_syntaxes[0])
 
 help_string = """```
 Description:
@@ -94,53 +94,31 @@ def pick_choice(*args):
         return "You're, uh... not giving me much to work with here."
     return "I pick {}.".format(random.choice(args))
 
-async def get_response(command, options, arguments, arguments_blocks, raw_parameters, server_id, channel_id, voice_channel_id, user_id, is_admin, is_private):
-    """Gets a response from the command and parameters."""
-    
-    to_return = ''
-    num_options = len(options)
-    num_arguments = len(arguments)
-    using_shortcut = command in commands_dictionary['shortcut_commands']
-
-    # Flip a coin
-    if ((command in ['flip'] and num_options == 0 and num_arguments == 0) or
-            (not using_shortcut and num_options == 1 and num_arguments == 0 and options[0] in ['f', 'flip'])):
-        public_info = {}
-        if not is_private: # Bundle server and user ID if we need a name
-            public_info = {'server_id':server_id, 'user_id':user_id}
-        return flip_coin(is_private=is_private, **public_info)
-
-    # Roll dice
-    elif ((command in ['roll'] and num_arguments <= 1) or
-            (not using_shortcut and num_options == 1 and num_arguments <= 1 and options[0] in ['r', 'roll', 'd', 'dice'])):
-        public_info = {}
-        if not is_private:
-            public_info = {'server_id':server_id, 'user_id':user_id}
-        return roll_die(faces=arguments[0] if num_arguments == 1 else 6, is_private=is_private, **public_info)
-
-    # Pick a choice
-    elif ((command in ['pick'] and num_options == 0 and num_arguments >= 0) or
-            (not using_shortcut and num_options == 1 and num_arguments >= 0 and options[0] in ['p', 'pick', 'c', 'choose', 'd', 'decide', 'f', 'fluky'])):
-        return pick_choice(*arguments) # Number of arguments is checked in function
-        
-    # Get a random tag lolwat
-    elif not using_shortcut and num_options == 1 and num_arguments == 0 and options[0] in ['t', 'tag']:
-        return tagmanager.get_random_tag(server_id, user_id)
-
-    # Get a random tag uw0t
-    elif not using_shortcut and num_options == 1 and num_arguments == 0 and options[0] in ['st', 'soundtag']:
-        return await soundtagmanager.get_random_sound_tag(server_id, voice_channel_id, user_id)
-    
-    # Get random number
-    elif not using_shortcut and num_options == 0 and (num_arguments == 0 or num_arguments == 2):
-        public_info = {}
-        if not is_private:
-            public_info = {'server_id':server_id, 'user_id':user_id}
-        if num_arguments == 2:
-            return get_random_number(minimum=arguments[0], maximum=arguments[1], is_private=is_private, **public_info)
-        else:
-            return get_random_number(is_private=is_private, **public_info)
-
-    # Invalid command
-    raise bot_exception(EXCEPT_TYPE, "Invalid syntax", get_formatted_usage_string())
+def get_public_info(context):
+    """Bundles the server and user ID if a name is needed (see flip_coin)."""
+    if context.is_private:
+        return {}
+    return {'server_id':context.server_id, 'user_id':context.user_id}
+
+async def respond_number(context):
+    if len(context.arguments) == 2:
+        return get_random_number(minimum=context.arguments[0], maximum=context.arguments[1],
+                is_private=context.is_private, **get_public_info(context))
+    return get_random_number(is_private=context.is_private, **get_public_info(context))
+
+async def respond_tag(context): # Get a random tag lolwat
+    return tagmanager.get_random_tag(context.server_id, context.user_id, weighted=len(context.options) == 2)
+
+async def respond_sound_tag(context): # Get a random tag uw0t
+    return await soundtagmanager.get_random_sound_tag(context.server_id, context.voice_channel_id, context.user_id,
+            weighted=len(context.options) == 2)
+
+async def respond_flip(context):
+    return flip_coin(is_private=context.is_private, **get_public_info(context))
+
+async def respond_roll(context):
+    return roll_die(faces=context.arguments[0] if context.arguments else 6, is_private=context.is_private,
+            **get_public_info(context))
 
+async def respond_pick(context):
+    return pick_choice(*context.arguments) # Number of arguments is checked in function
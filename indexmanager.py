@@ -0,0 +1,703 @@
+import bisect, re, math, heapq, random
+
+from jshbot import servermanager
+
+# In-memory indexes over servers data. Nothing here is saved; every index is built from
+# servers data the first time it is needed, and kept current by whatever changes the data.
+
+class name_index:
+    """Maps the names and nicknames of users on one server to their user IDs."""
+    __slots__ = ('ids_by_name', 'names_by_id')
+
+    def __init__(self):
+        self.ids_by_name = {}
+        self.names_by_id = {}
+
+    def add(self, user_id, names):
+        """Adds the user under the given names, replacing whatever names they had before."""
+        self.remove(user_id)
+        names = tuple(dict.fromkeys(names)) # A nickname can be the same as the name
+        for name in names:
+            self.ids_by_name.setdefault(name, set()).add(user_id)
+        self.names_by_id[user_id] = names
+
+    def add_all(self, entries):
+        """Adds every (user_id, names) pair from the given iterable."""
+        for user_id, names in entries:
+            self.add(user_id, names)
+
+    def remove(self, user_id):
+        for name in self.names_by_id.pop(user_id, ()):
+            user_ids = self.ids_by_name[name]
+            user_ids.discard(user_id)
+            if not user_ids:
+                del self.ids_by_name[name]
+
+    def find(self, name):
+        """Returns the IDs of every user with the given name or nickname."""
+        return self.ids_by_name.get(name, set())
+
+class name_trie(name_index):
+    """Case-insensitive index over the names, nicknames and aliases of users on one server.
+
+    The lowercased names are kept in a sorted list, so names that share a prefix are next to
+    each other and a prefix search is just a binary search, like walking down a trie. Typos
+    are found by walking down the search text and only trying edits with the characters that
+    actually come next in the names, which stops as soon as no name shares the text so far.
+    """
+    __slots__ = ('keys',)
+
+    def __init__(self):
+        super().__init__()
+        self.keys = []
+
+    def add(self, user_id, names, sort=True):
+        self.remove(user_id)
+        names = tuple(dict.fromkeys(names))
+        for name in names:
+            if name not in self.ids_by_name:
+                if sort:
+                    bisect.insort(self.keys, name)
+                else: # Caller sorts later
+                    self.keys.append(name)
+            self.ids_by_name.setdefault(name, set()).add(user_id)
+        self.names_by_id[user_id] = names
+
+    def add_all(self, entries):
+        """Adds every (user_id, names) pair, sorting the names once at the end instead of for each one."""
+        for user_id, names in entries:
+            self.add(user_id, names, sort=False)
+        self.keys.sort()
+
+    def remove(self, user_id):
+        for name in self.names_by_id.pop(user_id, ()):
+            user_ids = self.ids_by_name[name]
+            user_ids.discard(user_id)
+            if not user_ids:
+                del self.ids_by_name[name]
+                del self.keys[bisect.bisect_left(self.keys, name)]
+
+    def find_prefix(self, prefix, limit=None):
+        """Returns up to limit names that start with the given (lowercase) prefix, in order."""
+        names = []
+        position = bisect.bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            if limit is not None and len(names) >= limit:
+                break
+            names.append(self.keys[position])
+            position += 1
+        return names
+
+    def get_range(self, prefix, low, high):
+        """Returns (low, high) of the names that start with prefix, looking only between low and high."""
+        low = bisect.bisect_left(self.keys, prefix, low, high)
+        if low == high or not self.keys[low].startswith(prefix): # Usually the case for edits
+            return low, low
+        if prefix:
+            high = bisect.bisect_left(self.keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), low, high)
+        return low, high
+
+    def get_children(self, prefix, low, high):
+        """Yields (character, low, high) for every character that comes after prefix in the names
+        between low and high (which all have to start with prefix).
+        """
+        depth = len(prefix)
+        if low < high and len(self.keys[low]) == depth: # The prefix itself is a name
+            low += 1
+        while low < high:
+            character = self.keys[low][depth]
+            end = bisect.bisect_left(self.keys, prefix + chr(ord(character) + 1), low, high)
+            yield character, low, end
+            low = end
+
+    def get_edits(self, text):
+        """Returns {edit: (low, high)} for every insertion, deletion, substitution, or swap of text
+        that some name starts with, along with where those names are.
+
+        Every edit keeps some start of the text as it is, so the start is walked down one character
+        at a time, and only the characters that come next in the names there are tried.
+        """
+        edits = {}
+        def add(edit, low, high):
+            low, high = self.get_range(edit, low, high)
+            if low < high:
+                edits[edit] = (low, high)
+        low, high = 0, len(self.keys)
+        for index in range(len(text) + 1):
+            if low >= high: # No name starts with this much of the text, so no edit after it can match
+                break
+            start, end = text[:index], text[index:]
+            if end:
+                add(start + end[1:], low, high)
+                if len(end) > 1 and end[0] != end[1]:
+                    add(start + end[1] + end[0] + end[2:], low, high)
+            for character, child_low, child_high in self.get_children(start, low, high):
+                add(start + character + end, child_low, child_high)
+                if end and character != end[0]:
+                    add(start + character + end[1:], child_low, child_high)
+            if end:
+                low, high = self.get_range(text[:index + 1], low, high)
+        return edits
+
+    def find_similar(self, text, limit=None):
+        """Returns up to limit names within one edit of the given (lowercase) text.
+
+        Whole names come first, then names that start with something within one edit.
+        """
+        edits = self.get_edits(text)
+        names = sorted(edit for edit, (low, _) in edits.items() if self.keys[low] == edit)
+        found = set(names)
+        for edit in sorted(edits):
+            low, high = edits[edit]
+            for position in range(low, high):
+                if limit is not None and len(names) >= limit:
+                    return names[:limit]
+                if self.keys[position] not in found:
+                    found.add(self.keys[position])
+                    names.append(self.keys[position])
+        return names[:limit]
+
+class substring_index:
+    """Finds the names that contain some text, using an index of the trigrams in every name.
+
+    A name can only contain the text if it contains every trigram of the text, so only the
+    names in the smallest intersection of trigram sets need to be checked. Names are also
+    kept in a sorted list, so everything comes back already sorted.
+    """
+    __slots__ = ('names', 'names_by_gram')
+
+    def __init__(self):
+        self.names = []
+        self.names_by_gram = {}
+
+    def add(self, name):
+        position = bisect.bisect_left(self.names, name)
+        if position < len(self.names) and self.names[position] == name: # Already there
+            return
+        self.names.insert(position, name)
+        for gram in get_trigrams(name):
+            self.names_by_gram.setdefault(gram, set()).add(name)
+
+    def add_all(self, names):
+        """Adds every name in the given iterable, sorting once at the end."""
+        for name in names:
+            self.names.append(name)
+            for gram in get_trigrams(name):
+                self.names_by_gram.setdefault(gram, set()).add(name)
+        self.names.sort()
+
+    def remove(self, name):
+        position = bisect.bisect_left(self.names, name)
+        if position == len(self.names) or self.names[position] != name:
+            return
+        del self.names[position]
+        for gram in get_trigrams(name):
+            names = self.names_by_gram[gram]
+            names.discard(name)
+            if not names:
+                del self.names_by_gram[gram]
+
+    def find(self, text):
+        """Returns every name that contains the given text, sorted."""
+        grams = get_trigrams(text)
+        if not grams: # Too short for trigrams, but matches too many names for an index to help anyway
+            return [name for name in self.names if text in name]
+        candidates = sorted((self.names_by_gram.get(gram, set()) for gram in grams), key=len)
+        found = candidates[0].intersection(*candidates[1:])
+        return sorted(name for name in found if text in name)
+
+class author_index:
+    """Maps the author of every tag (or sound tag) on one server to the sorted names of their tags."""
+    __slots__ = ('names_by_author', 'author_by_name')
+
+    def __init__(self):
+        self.names_by_author = {}
+        self.author_by_name = {}
+
+    def add(self, name, author_id):
+        """Adds the tag under the given author, moving it if it had another author before."""
+        if self.author_by_name.get(name) == author_id:
+            return
+        self.remove(name)
+        bisect.insort(self.names_by_author.setdefault(author_id, []), name)
+        self.author_by_name[name] = author_id
+
+    def remove(self, name):
+        author_id = self.author_by_name.pop(name, None)
+        if author_id is None:
+            return
+        names = self.names_by_author[author_id]
+        del names[bisect.bisect_left(names, name)]
+        if not names:
+            del self.names_by_author[author_id]
+
+    def find(self, author_id):
+        """Returns the sorted names of every tag made by the author."""
+        return self.names_by_author.get(author_id, [])
+
+    def count(self, author_id):
+        return len(self.names_by_author.get(author_id, ()))
+
+class text_index:
+    """Inverted index over the text of every tag on one server, with results ranked by BM25."""
+    __slots__ = ('postings', 'documents', 'total_length')
+    k1 = 1.2 # How quickly repeating a word stops mattering
+    b = 0.75 # How much longer texts get penalized
+
+    def __init__(self):
+        self.postings = {} # term: {name: how many times the term shows up}
+        self.documents = {} # name: (number of terms, unique terms)
+        self.total_length = 0
+
+    def add(self, name, text):
+        """Indexes the text under the given name, replacing whatever was indexed there before."""
+        self.remove(name)
+        terms = tokenize(text)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[name] = count
+        self.documents[name] = (len(terms), tuple(counts))
+        self.total_length += len(terms)
+
+    def remove(self, name):
+        length, terms = self.documents.pop(name, (0, ()))
+        self.total_length -= length
+        for term in terms:
+            names = self.postings[term]
+            del names[name]
+            if not names:
+                del self.postings[term]
+
+    def search(self, text, limit=10):
+        """Returns up to limit (score, name) pairs for the texts that best match the given words."""
+        if not self.documents:
+            return []
+        total = len(self.documents)
+        average_length = self.total_length / total or 1
+        documents = self.documents
+        k1, b = self.k1, self.b
+        scores = {}
+        terms = [term for term in set(tokenize(text)) if term in self.postings]
+        for term in sorted(terms, key=lambda term: len(self.postings[term])): # Rarest first
+            names = self.postings[term]
+            idf = math.log(1 + (total - len(names) + 0.5) / (len(names) + 0.5))
+            if scores and len(names) > total / 2: # Common word, so only rerank what rarer words found
+                matches = [(name, names[name]) for name in scores if name in names]
+            else:
+                matches = names.items()
+            for name, count in matches:
+                weight = count * (k1 + 1) / (count + k1 * (1 - b + b * documents[name][0] / average_length))
+                scores[name] = scores.get(name, 0) + idf * weight
+        return heapq.nlargest(limit, ((score, name) for name, score in scores.items()))
+
+class bk_tree:
+    """Metric tree over names by edit distance, for finding the names closest to a misspelled one.
+
+    Every child is filed under its distance to its parent, so by the triangle inequality a
+    search only needs to visit the children within max_distance of the distance to the parent.
+    Removed names are only marked, and the tree is rebuilt once most of it is removed.
+    """
+    __slots__ = ('root', 'names', 'removed')
+
+    def __init__(self):
+        self.root = None # [name, {distance: child node}]
+        self.names = set() # Everything in the tree, removed or not
+        self.removed = set()
+
+    def add(self, name):
+        if name in self.names:
+            self.removed.discard(name)
+            return
+        self.names.add(name)
+        if self.root is None:
+            self.root = [name, {}]
+            return
+        node = self.root
+        while True:
+            distance = get_edit_distance(name, node[0])
+            if distance in node[1]:
+                node = node[1][distance]
+            else:
+                node[1][distance] = [name, {}]
+                return
+
+    def remove(self, name):
+        if name in self.names:
+            self.removed.add(name)
+            if len(self.removed) * 2 > len(self.names):
+                remaining = list(self.names - self.removed)
+                self.__init__()
+                for name in remaining:
+                    self.add(name)
+
+    def find(self, name, max_distance, limit=None):
+        """Returns up to limit names within max_distance edits of the given name, closest first."""
+        found = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node_name, children = nodes.pop()
+            distance = get_edit_distance(name, node_name)
+            if distance <= max_distance and node_name not in self.removed:
+                found.append((distance, node_name))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        return [node_name for _, node_name in sorted(found)[:limit]]
+
+class tag_sampler:
+    """Picks random tags, either uniformly or weighted by hits.
+
+    Names are kept in an array, and removing one moves the last name into its spot, so a
+    uniform pick is just a random index. Next to it is a Fenwick tree over the weights of
+    that array, so weighted picks and weight changes both take O(log n).
+    """
+    __slots__ = ('names', 'positions', 'weights', 'tree')
+
+    def __init__(self):
+        self.names = []
+        self.positions = {} # name: index in names
+        self.weights = []
+        self.tree = [0] # Fenwick tree (1-based) over weights, with room to grow
+
+    def rebuild(self, capacity):
+        """Builds the tree in O(n), passing each node's sum up to its parent (empty slots included)."""
+        self.tree = [0] * (capacity + 1)
+        self.tree[1:len(self.weights) + 1] = self.weights
+        for index in range(1, capacity + 1):
+            parent = index + (index & -index)
+            if parent <= capacity:
+                self.tree[parent] += self.tree[index]
+
+    def change(self, position, difference):
+        index = position + 1
+        while index < len(self.tree):
+            self.tree[index] += difference
+            index += index & -index
+
+    def add(self, name, weight=1):
+        if name in self.positions:
+            self.set_weight(name, weight)
+            return
+        self.positions[name] = len(self.names)
+        self.names.append(name)
+        self.weights.append(weight)
+        if len(self.names) >= len(self.tree): # Out of room, so double it
+            self.rebuild(len(self.tree) * 2)
+        else:
+            self.change(len(self.names) - 1, weight)
+
+    def add_all(self, entries):
+        """Adds every (name, weight) pair from the given iterable, building the tree once at the end."""
+        for name, weight in entries:
+            if name not in self.positions:
+                self.positions[name] = len(self.names)
+                self.names.append(name)
+                self.weights.append(weight)
+        self.rebuild(len(self.names) * 2)
+
+    def remove(self, name):
+        position = self.positions.pop(name, None)
+        if position is None:
+            return
+        last_name, last_weight = self.names.pop(), self.weights.pop()
+        self.change(len(self.names), -last_weight)
+        if position < len(self.names): # Fill the hole with what was last
+            self.change(position, last_weight - self.weights[position])
+            self.names[position], self.weights[position] = last_name, last_weight
+            self.positions[last_name] = position
+
+    def set_weight(self, name, weight):
+        position = self.positions[name]
+        self.change(position, weight - self.weights[position])
+        self.weights[position] = weight
+
+    def choice(self):
+        """Returns a random name, or None if there are none."""
+        return random.choice(self.names) if self.names else None
+
+    def weighted_choice(self):
+        """Returns a random name picked in proportion to its weight, or None if there are none."""
+        total = self.get_total()
+        if not total:
+            return self.choice()
+        target = random.randrange(total)
+        position = 0
+        step = 1 << (len(self.tree).bit_length() - 1)
+        while step: # Walk down the tree to the first position where the running total passes target
+            if position + step <= len(self.names) and self.tree[position + step] <= target:
+                position += step
+                target -= self.tree[position]
+            step >>= 1
+        return self.names[position]
+
+    def get_total(self):
+        total = 0
+        index = len(self.names)
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+def get_edit_distance(first, second):
+    """Returns the Levenshtein distance between the two strings.
+
+    Uses Myers' bit-vector algorithm: each column of the usual table is packed into the bits of
+    an int, so it takes one pass over the longer string instead of a pass per pair of characters.
+    """
+    if len(first) < len(second):
+        first, second = second, first
+    if not second:
+        return len(first)
+    mask = (1 << len(second)) - 1
+    last_bit = 1 << (len(second) - 1)
+    matches = {} # character: bits set where it shows up in the shorter string
+    for index, character in enumerate(second):
+        matches[character] = matches.get(character, 0) | (1 << index)
+    positive, negative = mask, 0 # Vertical deltas of the current column
+    distance = len(second)
+    for character in first:
+        match = matches.get(character, 0)
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        horizontal_positive = negative | (~(horizontal | positive) & mask)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last_bit:
+            distance += 1
+        elif horizontal_negative & last_bit:
+            distance -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & mask
+        horizontal_negative = (horizontal_negative << 1) & mask
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & mask)
+        negative = horizontal_positive & vertical
+    return distance
+
+def tokenize(text):
+    """Splits text into lowercase words."""
+    return re.findall(r'\w+', text.lower())
+
+def get_trigrams(text):
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+name_indexes = {} # server_id: name_index
+name_tries = {} # server_id: name_trie
+alias_indexes = {} # server_id: name_index of every name users have gone by
+tag_indexes = {} # (server_id, 'tags' or 'sound_tags'): substring_index
+author_indexes = {} # (server_id, 'tags' or 'sound_tags'): author_index
+text_indexes = {} # (server_id, 'tags'): text_index (sound tags have no text)
+suggestion_indexes = {} # (server_id, 'tags' or 'sound_tags'): bk_tree
+samplers = {} # (server_id, 'tags' or 'sound_tags'): tag_sampler
+
+def get_user_names(server_id, user_id):
+    """Returns the name and nickname the user goes by on the given server (whichever are set)."""
+    user_data = servermanager.get_records(servermanager.GLOBAL_ID, 'users').get(user_id)
+    member_data = servermanager.get_record(server_id, 'users', user_id)
+    names = (user_data.get('name') if user_data is not None else None, member_data.get('nickname'))
+    return tuple(dict.fromkeys(name for name in names if name)) # Nicknames can be the same as the name
+
+def get_user_aliases(server_id, user_id):
+    """Returns every name the user has gone by (their current one included)."""
+    user_data = servermanager.get_records(servermanager.GLOBAL_ID, 'users').get(user_id)
+    return tuple(user_data.get('aliases', [])) if user_data is not None else ()
+
+def get_search_names(server_id, user_id):
+    """Returns every name the user can be searched by on the given server, lowercased."""
+    names = [name.lower() for name in get_user_names(server_id, user_id) + get_user_aliases(server_id, user_id) if name]
+    return tuple(sorted(set(names)))
+
+index_types = { # What to build for each kind of index
+    'names':(name_indexes, name_index, get_user_names),
+    'search':(name_tries, name_trie, get_search_names),
+    'aliases':(alias_indexes, name_index, get_user_aliases)
+}
+
+def get_index(server_id, index_kind):
+    """Returns the given kind of index for the server, building it if this is the first lookup."""
+    indexes, index_type, get_names = index_types[index_kind]
+    try:
+        return indexes[server_id]
+    except KeyError:
+        index = index_type()
+        index.add_all((user_id, get_names(server_id, user_id)) for user_id in servermanager.get_records(server_id, 'users'))
+        indexes[server_id] = index
+        return index
+
+def get_name_index(server_id):
+    return get_index(server_id, 'names')
+
+def get_name_trie(server_id):
+    return get_index(server_id, 'search')
+
+def find_user_ids(server_id, name):
+    """Returns the IDs of every user on the server with the given name or nickname."""
+    return get_name_index(server_id).find(name)
+
+def find_alias_ids(server_id, alias):
+    """Returns the IDs of every user on the server that has ever gone by the given name."""
+    return get_index(server_id, 'aliases').find(alias)
+
+def search_users(server_id, text, limit=5):
+    """Returns up to limit (user_id, matched_name) pairs for users whose names are like the given text.
+
+    Case-insensitive prefix matches come first (shortest first), then names that are a typo
+    away (see name_trie.find_similar). Each user shows up once.
+    """
+    trie = get_name_trie(server_id)
+    query = text.strip().lower()
+    if not query:
+        return []
+    results = []
+    seen = set()
+    def add_matches(names):
+        for name in names:
+            for user_id in sorted(trie.find(name)):
+                if user_id not in seen:
+                    seen.add(user_id)
+                    results.append((user_id, name))
+            if len(results) >= limit:
+                return True
+    if not add_matches(sorted(trie.find_prefix(query), key=len)):
+        add_matches(trie.find_similar(query, limit))
+    return results[:limit]
+
+def update_user(server_id, user_id, everywhere=False):
+    """Refreshes the indexed names of the user after their name, nickname or aliases changed.
+
+    Keyword arguments:
+    everywhere -- also refresh every other server they are on (names are shared between servers)
+    """
+    for indexes, _, get_names in index_types.values():
+        if everywhere:
+            server_ids = [indexed_server_id for indexed_server_id, index in indexes.items()
+                    if indexed_server_id == server_id or user_id in index.names_by_id]
+        else:
+            server_ids = [server_id] if server_id in indexes else []
+        for indexed_server_id in server_ids:
+            if servermanager.has_user(indexed_server_id, user_id):
+                indexes[indexed_server_id].add(user_id, get_names(indexed_server_id, user_id))
+            else:
+                indexes[indexed_server_id].remove(user_id)
+
+def remove_user(server_id, user_id):
+    for indexes, _, _ in index_types.values():
+        if server_id in indexes:
+            indexes[server_id].remove(user_id)
+
+def remove_server(server_id):
+    for indexes, _, _ in index_types.values():
+        indexes.pop(server_id, None)
+    for indexes in (tag_indexes, author_indexes, text_indexes, suggestion_indexes, samplers):
+        for server_kind in [server_kind for server_kind in indexes if server_kind[0] == server_id]:
+            del indexes[server_kind]
+
+def get_tag_index(server_id, kind):
+    """Returns the substring index over the tag (or sound tag) names of the server, building it if needed."""
+    try:
+        return tag_indexes[(server_id, kind)]
+    except KeyError:
+        index = substring_index()
+        index.add_all(servermanager.get_records(server_id, kind))
+        tag_indexes[(server_id, kind)] = index
+        return index
+
+def search_tags(server_id, kind, search_text):
+    """Returns the sorted names of every tag (or sound tag) of the server that contains the search text."""
+    return get_tag_index(server_id, kind).find(search_text)
+
+def get_author_index(server_id, kind):
+    """Returns the author index over the tags (or sound tags) of the server, building it if needed."""
+    try:
+        return author_indexes[(server_id, kind)]
+    except KeyError:
+        index = author_index()
+        for tag_name, tag_data in servermanager.get_records(server_id, kind).items():
+            index.add(tag_name, tag_data['author_id'])
+        author_indexes[(server_id, kind)] = index
+        return index
+
+def find_author_tags(server_id, kind, author_id):
+    """Returns the sorted names of every tag (or sound tag) of the server made by the given author."""
+    return get_author_index(server_id, kind).find(author_id)
+
+def count_author_tags(server_id, kind, author_id):
+    """Returns how many tags (or sound tags) of the server were made by the given author."""
+    return get_author_index(server_id, kind).count(author_id)
+
+def get_text_index(server_id):
+    """Returns the full-text index over the tags of the server, building it if needed."""
+    try:
+        return text_indexes[(server_id, 'tags')]
+    except KeyError:
+        index = text_index()
+        for tag_name, tag_data in servermanager.get_records(server_id, 'tags').items():
+            index.add(tag_name, tag_data['tag_text'])
+        text_indexes[(server_id, 'tags')] = index
+        return index
+
+def find_tags(server_id, words, limit=10):
+    """Returns up to limit names of the tags of the server that best match the given words, best first."""
+    return [tag_name for _, tag_name in get_text_index(server_id).search(words, limit)]
+
+def suggest_tags(server_id, kind, tag_name, limit=5):
+    """Returns up to limit names of tags (or sound tags) of the server that are close to the given name."""
+    try:
+        tree = suggestion_indexes[(server_id, kind)]
+    except KeyError:
+        tree = bk_tree()
+        tag_names = list(servermanager.get_records(server_id, kind))
+        random.shuffle(tag_names) # Sorted names make for a lopsided tree
+        for name in tag_names:
+            tree.add(name)
+        suggestion_indexes[(server_id, kind)] = tree
+    return tree.find(tag_name, 1 if len(tag_name) <= 4 else 2, limit)
+
+def get_tag_weight(server_id, kind, tag_name):
+    """Returns how likely the tag is to come up in weighted random picks. New tags still can."""
+    return servermanager.get_hits(server_id, kind, tag_name) + 1
+
+def get_sampler(server_id, kind):
+    """Returns the random tag (or sound tag) sampler of the server, building it if needed."""
+    try:
+        return samplers[(server_id, kind)]
+    except KeyError:
+        sampler = tag_sampler()
+        sampler.add_all((tag_name, get_tag_weight(server_id, kind, tag_name)) for tag_name in servermanager.get_records(server_id, kind))
+        samplers[(server_id, kind)] = sampler
+        return sampler
+
+def get_random_tag(server_id, kind, weighted=False):
+    """Returns the name of a random tag (or sound tag) of the server, or None if there are none.
+
+    Keyword arguments:
+    weighted -- pick tags with more hits more often
+    """
+    sampler = get_sampler(server_id, kind)
+    return sampler.weighted_choice() if weighted else sampler.choice()
+
+def update_tag_hits(server_id, kind, tag_name):
+    """Refreshes the weight of a tag (or sound tag) after its hits changed."""
+    if (server_id, kind) in samplers:
+        samplers[(server_id, kind)].set_weight(tag_name, get_tag_weight(server_id, kind, tag_name))
+
+def add_tag(server_id, kind, tag_name):
+    """Adds a new tag (or sound tag) to every index built for the server."""
+    for indexes in (tag_indexes, suggestion_indexes):
+        if (server_id, kind) in indexes:
+            indexes[(server_id, kind)].add(tag_name)
+    if (server_id, kind) in samplers:
+        samplers[(server_id, kind)].add(tag_name, get_tag_weight(server_id, kind, tag_name))
+    update_tag(server_id, kind, tag_name)
+
+def update_tag(server_id, kind, tag_name):
+    """Refreshes the indexed author (and text) of a tag (or sound tag) after it was modified."""
+    if (server_id, kind) in author_indexes:
+        author_indexes[(server_id, kind)].add(tag_name, servermanager.get_record(server_id, kind, tag_name)['author_id'])
+    if (server_id, kind) in text_indexes:
+        text_indexes[(server_id, kind)].add(tag_name, servermanager.get_record(server_id, kind, tag_name)['tag_text'])
+
+def remove_tag(server_id, kind, tag_name):
+    """Removes a tag (or sound tag) from every index built for the server."""
+    for indexes in (tag_indexes, author_indexes, text_indexes, suggestion_indexes, samplers):
+        if (server_id, kind) in indexes:
+            indexes[(server_id, kind)].remove(tag_name)
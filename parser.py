@@ -1,17 +1,33 @@
-import socket, time, sys, asyncio, random
+import socket, time, sys, asyncio, random, types
 
-from jshbot import configmanager, usermanager, servermanager, tagmanager, soundtagmanager, decider, utilities, botmanager
+from jshbot import configmanager, usermanager, servermanager, tagmanager, soundtagmanager, decider, utilities, botmanager, syntaxmanager
 from jshbot.jbce import bot_exception
 
 EXCEPT_TYPE = "Parse"
 BASE_EXCEPT_TYPE = "Base command"
 
-# These lists get filled when each module is initialized
 base_commands = ['ping', 'help', 'admin']
-module_commands = []
-shortcut_commands = []
-private_module_commands = []
-private_shortcut_commands = []
+base_commands_dictionary = {'module_commands':base_commands,
+                            'shortcut_commands':[],
+                            'private_module_commands':base_commands,
+                            'private_shortcut_commands':[]}
+
+class command_entry:
+    """Where a command goes: the module that handles it, and whether it is a shortcut."""
+    __slots__ = ('module', 'shortcut')
+
+    def __init__(self, module, shortcut=False):
+        self.module = module
+        self.shortcut = shortcut
+
+# Command registry, built once by add_all_commands_init. Commands that can be used in
+# servers and in private messages each get their own read-only view.
+public_commands = types.MappingProxyType({})
+private_commands = types.MappingProxyType({})
+all_commands = types.MappingProxyType({})
+
+# Compiled command syntaxes of the modules that declare them (see syntaxmanager)
+syntaxes = syntaxmanager.syntax_table()
 
 help_string = """```
 Hi, I'm a chat bot! I can only respond to a few commands, but they include:
@@ -72,35 +88,120 @@ Usage:
            [-uptime]
            [-clear]
            [-halt]
+           [-compact]
            [-ip]
            
 Other information:
-    Mute type is either 'server', 'channel', or 'voicechannel'```"""
+    Mute type is either 'server', 'channel', or 'voicechannel'
+    Info type is either 'server', 'channel', 'voicechannel', or 'data'```"""
 }
 
 def add_all_commands_init():
-    """Loads all of the custom module commands into the parser's command list."""
+    """Builds the command registry from the base commands and the commands of every module."""
+    global public_commands, private_commands, all_commands
     print("Adding module commands...")
-    add_commands(usermanager.commands_dictionary)
-    add_commands(tagmanager.commands_dictionary)
-    add_commands(decider.commands_dictionary)
-    add_commands(utilities.commands_dictionary)
-    add_commands(soundtagmanager.commands_dictionary)
+    public, private = {}, {}
+    add_commands(public, private, sys.modules[__name__], base_commands_dictionary)
+    modules = (usermanager, tagmanager, decider, utilities, soundtagmanager)
+    for module in modules:
+        add_commands(public, private, module)
+    syntaxes.compile([module for module in modules if hasattr(module, 'command_syntaxes')])
+    public_commands = types.MappingProxyType(public)
+    private_commands = types.MappingProxyType(private)
+    all_commands = types.MappingProxyType({**private, **public})
+
+def add_commands(public, private, module, commands_dictionary=None):
+    """Registers the commands a module lists in its commands_dictionary to be handled by that module.
 
-def add_commands(commands_dictionary):
-    """Adds the commands in the commands dictionary to total commands."""
-    module_commands.extend(commands_dictionary['module_commands'])
-    shortcut_commands.extend(commands_dictionary['shortcut_commands'])
-    private_module_commands.extend(commands_dictionary['private_module_commands'])
-    private_shortcut_commands.extend(commands_dictionary['private_shortcut_commands'])
+    Two modules can't claim the same command.
+    """
+    if commands_dictionary is None:
+        commands_dictionary = module.commands_dictionary
+    for key, registry, shortcut in (('module_commands', public, False), ('shortcut_commands', public, True),
+            ('private_module_commands', private, False), ('private_shortcut_commands', private, True)):
+        for command in commands_dictionary[key]:
+            if command in registry and registry[command].module is not module:
+                raise bot_exception(EXCEPT_TYPE, "Command '{}' is claimed by both {} and {}".format(
+                        command, registry[command].module.__name__, module.__name__))
+            registry[command] = command_entry(module, shortcut)
 
 def is_command(command, private=False):
     """Determines whether or not the given command is available for processing."""
-    if private: # Check commands depending on whether or not we're in a private message
-        return command in (base_commands + private_module_commands + private_shortcut_commands)
-    else:
-        return command in (base_commands + module_commands + shortcut_commands)
+    return command in (private_commands if private else public_commands)
         
+class lazy_blocks:
+    """Arguments blocks (the rest of the message from where each of the first few arguments starts).
+
+    Only the start of each block is kept, and a block is sliced out the first time it is asked for.
+    """
+    __slots__ = ('text', 'starts', 'blocks')
+
+    def __init__(self, text, starts):
+        self.text = text
+        self.starts = starts
+        self.blocks = [None] * len(starts)
+
+    def __getitem__(self, index):
+        if self.blocks[index] is None:
+            self.blocks[index] = self.text[self.starts[index]:]
+        return self.blocks[index]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self.starts)))
+
+    def __str__(self):
+        return str(list(self))
+
+def tokenize(text, position=0):
+    """Splits text into arguments in one pass, without copying it.
+
+    Arguments are split on spaces, unless they are in quotes (where \\" is a literal quote).
+    Returns the (start, end, quoted) span of each argument, and where the first four arguments
+    start (see lazy_blocks). Quoted spans leave out surrounding whitespace, and empty quoted
+    arguments are skipped.
+    """
+    spans = []
+    block_starts = []
+    length = len(text)
+    while position < length and text[position].isspace():
+        position += 1
+    while position < length:
+        if len(block_starts) < 4:
+            block_starts.append(position)
+        if text[position] == '"': # Search for end quote
+            start = position + 1
+            end = text.find('"', start)
+            while end > start and text[end - 1] == '\\': # Escaped quote
+                end = text.find('"', end + 1)
+            if end == -1:
+                raise bot_exception(EXCEPT_TYPE, "An argument has an unclosed quote")
+            position = end + 1
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if start < end: # No empty string
+                spans.append((start, end, True))
+        else: # Search for next space
+            end = text.find(' ', position)
+            if end == -1:
+                end = length
+            spans.append((position, end, False))
+            position = end + 1
+        while position < length and text[position].isspace():
+            position += 1
+    return spans, block_starts
+
+def get_argument(text, span):
+    """Slices an argument out of the text given its span from tokenize."""
+    start, end, quoted = span
+    if quoted:
+        return text[start:end].replace('\\"', '"')
+    return text[start:end]
+
 def help(command, *args):
     """Gets the help_string from each submodule by command."""
     
@@ -116,16 +217,11 @@ def help(command, *args):
         return "Maybe later."
     elif command == 'yourself':
         return "Why, thank you!"
-    elif command in usermanager.commands:
-        return usermanager.help_string
-    elif command in tagmanager.commands:
-        return tagmanager.help_string
-    elif command in soundtagmanager.commands:
-        return soundtagmanager.help_string
-    elif command in decider.commands:
-        return decider.help_string
-    elif command in utilities.commands:
-        return utilities.get_help_string(command)
+    elif command in all_commands:
+        module = all_commands[command].module
+        if hasattr(module, 'get_help_string'): # Modules with several help strings
+            return module.get_help_string(command)
+        return module.help_string
     return "Sorry, I couldn't find help on that."
     
 async def get_response(command, options, arguments, arguments_blocks, raw_parameters, server_id, channel_id, voice_channel_id, user_id, is_admin, is_private):
@@ -150,11 +246,17 @@ async def get_response(command, options, arguments, arguments_blocks, raw_parame
             raise bot_exception(BASE_EXCEPT_TYPE, "You must be an admin or the bot owner for these commands")
         if len(arguments) == 1 and not is_private:
             if options[0] in ['ban', 'unban']: # All checks here are explicit to enforce strict syntax
-                to_return += servermanager.add_ban(server_id, usermanager.get_user_id(server_id, arguments[0]), add=(options[0] == 'ban'))
+                target_id = usermanager.get_user_id(server_id, arguments[0], exact=True) # No guessing who to ban
+                botmanager.track_user_id(server_id, target_id) # Bans and admins always get a record
+                to_return += servermanager.add_ban(server_id, target_id, add=(options[0] == 'ban'))
+                await servermanager.wait_for_write() # Make sure it sticks before saying so
             elif options[0] in ['add', 'remove']:
                 if not servermanager.is_owner(user_id):
                     raise bot_exception(BASE_EXCEPT_TYPE, "You must be the bot owner for this command")
-                to_return += servermanager.add_admin(server_id, usermanager.get_user_id(server_id, arguments[0]), add=(options[0] == 'add'))
+                target_id = usermanager.get_user_id(server_id, arguments[0], exact=True)
+                botmanager.track_user_id(server_id, target_id)
+                to_return += servermanager.add_admin(server_id, target_id, add=(options[0] == 'add'))
+                await servermanager.wait_for_write()
             elif options[0] in ['mute', 'unmute']:
                 to_mute = options[0] == 'mute'
                 if arguments[0] in ['channel', 'voicechannel']:
@@ -166,6 +268,8 @@ async def get_response(command, options, arguments, arguments_blocks, raw_parame
                     to_return += servermanager.get_channel_info(server_id, channel_id if arguments[0] == 'channel' else voice_channel_id)
                 elif arguments[0] == 'server':
                     to_return += servermanager.get_server_info(server_id)
+                elif arguments[0] == 'data':
+                    to_return += servermanager.get_data_info()
         elif len(arguments) == 0:
             if options[0] == 'version':
                 to_return += '**`{version}`** ({date})'.format(version=botmanager.BOT_VERSION, date=botmanager.BOT_DATE)
@@ -183,7 +287,13 @@ async def get_response(command, options, arguments, arguments_blocks, raw_parame
                     await botmanager.interrupt_broadcast(server_id, channel_id, "Going down...")
                 await botmanager.disconnect_bot()
                 await asyncio.sleep(2)
+                await servermanager.wait_for_write()
                 sys.exit()
+            elif options[0] == 'compact':
+                if not servermanager.is_owner(user_id):
+                    raise bot_exception(BASE_EXCEPT_TYPE, "You must be the bot owner for this command")
+                reclaimed = await servermanager.compact_tag_texts()
+                to_return += "Compacted tag texts, freeing up {} bytes".format(reclaimed)
             elif options[0] == 'source':
                 to_return += random.choice([
                     "It's shit. I'm sorry.", "You want to see what the Matrix is like?",
@@ -248,58 +358,35 @@ async def parse(text, server_id, channel_id, author_id, voice_channel_id, is_pri
             options.append(option_partition)
 
     # Look for arguments
-    arguments = []
-    arguments_blocks = []
-    while text:
-        if len(arguments_blocks) < 4:
-            arguments_blocks.append(text)
-        if text.startswith('"'): # Search for end quote
-            try:
-                text = text[1:]
-                closed_quote_index = 0
-                next_quote_index = text[closed_quote_index:].index('"') # Maybe use do while?
-                while text[closed_quote_index + next_quote_index - 1] == '\\': # Run until proper closed quote found
-                    closed_quote_index += next_quote_index
-                    text = text[:closed_quote_index - 1] + text[closed_quote_index:]
-                    next_quote_index = text[closed_quote_index:].index('"')
-            except ValueError:
-                raise bot_exception(EXCEPT_TYPE, "An argument has an unclosed quote")
-            closed_quote_index += next_quote_index
-            if closed_quote_index > 0: # No null argument
-                to_append = text[:closed_quote_index].strip()
-                if to_append: # No empty string
-                    arguments.append(to_append)
-                text = text[closed_quote_index + 1:].strip()
-            else: # If there is a null argument, remove it
-                text = text[2:].strip()
-        else: # Search for next space
-            argument_partition, _, text = text.partition(' ')
-            arguments.append(argument_partition)
-            text = text.strip()
+    spans, block_starts = tokenize(text)
+    arguments = [get_argument(text, span) for span in spans]
+    arguments_blocks = lazy_blocks(text, block_starts)
     
     # Debug printing
-    print("DEBUG:\n{}\n{}\n{}\n{}\n------".format(command, options, arguments, arguments_blocks))
+    print("DEBUG:\n{}\n{}\n{}\n{}\n------".format(command, options, arguments, block_starts))
     
     # Get proper response
     to_return = ['', False] # Text response, TTS
-    get_response_function = help # Function placeholder
+    entry = (private_commands if is_private else public_commands).get(command)
     
-    # TODO: See if there is an object representation of modules
-    if command in tagmanager.commands: # Tag manager
-        get_response_function = getattr(tagmanager, 'get_response')
-    elif command in soundtagmanager.commands: # Sound tag manager
-        get_response_function = getattr(soundtagmanager, 'get_response')
-    elif command in usermanager.commands: # User manager
-        get_response_function = getattr(usermanager, 'get_response')
-    elif command in decider.commands: # Decider
-        get_response_function = getattr(decider, 'get_response')
-    elif command in utilities.commands: # Utilities
-        get_response_function = getattr(utilities, 'get_response')
-    elif command in base_commands: # Base commands
-        get_response_function = get_response
+    if entry is not None and command in syntaxes: # Declared syntaxes
+        function, shortcut = syntaxes.find(command, options, len(arguments))
+        to_return[0] = await function(syntaxmanager.command_context(
+            command=command,
+            options=options,
+            arguments=arguments,
+            arguments_blocks=arguments_blocks,
+            raw_parameters=raw_parameters,
+            server_id=server_id,
+            channel_id=channel_id,
+            voice_channel_id=voice_channel_id,
+            user_id=author_id,
+            is_admin=is_admin,
+            is_private=is_private,
+            shortcut=shortcut))
     
-    if get_response_function != help: # Found a response function
-        to_return[0] = await get_response_function(
+    elif entry is not None: # Found a response function
+        to_return[0] = await entry.module.get_response(
             command,
             options,
             arguments,
@@ -0,0 +1,268 @@
+import sys, time, calendar, datetime
+
+from jshbot import blobmanager
+
+# Slotted records for the collections in servers data. They act like the dictionaries they
+# replace (record['name'], record.update(...), and so on), but take a fraction of the memory.
+
+# Avatar URLs all start the same way, so the start is kept once and shared by every user
+AVATAR_PREFIXES = ('https://discordapp.com/api/users/', 'https://cdn.discordapp.com/avatars/')
+
+missing = object() # Stands in for fields that were never set
+
+def to_epoch(value):
+    """Converts a date into seconds since the epoch. Strings that aren't dates (like '') are kept as is.
+
+    Understands datetimes (in UTC, like discord.py gives), time.strftime('%c') strings, and str(datetime).
+    """
+    if value is None:
+        return ''
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    elif isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple())
+    try: # Old last seen format (local time)
+        return int(time.mktime(time.strptime(value, '%c')))
+    except (ValueError, TypeError):
+        pass
+    for date_format in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'): # Old joined format (UTC)
+        try:
+            return calendar.timegm(datetime.datetime.strptime(value, date_format).utctimetuple())
+        except (ValueError, TypeError):
+            pass
+    return value
+
+def format_time(value):
+    """Formats a value from to_epoch for people to read."""
+    if isinstance(value, int):
+        return time.strftime('%c', time.localtime(value))
+    return value
+
+class record:
+    """Base class for slotted records.
+
+    Fields that were never set are missing, just like keys in a dictionary. Fields that the
+    record type doesn't know about (from older data files) are kept in extra.
+    """
+    __slots__ = ('extra',)
+    fields = ()
+    field_set = frozenset()
+    interned_fields = frozenset() # Fields with values that repeat a lot between records
+    virtual_fields = frozenset() # Fields that can be read and set, but aren't stored as they are
+
+    def __init__(self, fields=(), **kwargs):
+        self.extra = None
+        self.update(fields, **kwargs)
+
+    def __getitem__(self, field):
+        if field in self.field_set or field in self.virtual_fields:
+            try:
+                return getattr(self, field)
+            except AttributeError: # Never set
+                raise KeyError(field)
+        elif self.extra is not None and field in self.extra:
+            return self.extra[field]
+        raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field in self.field_set:
+            if field in self.interned_fields and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, field, value)
+        elif field in self.virtual_fields:
+            setattr(self, field, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[field] = value
+
+    def __contains__(self, field):
+        try:
+            self[field]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def update(self, fields=(), **kwargs):
+        for field, value in dict(fields, **kwargs).items():
+            self[field] = value
+
+    def keys(self):
+        keys = [field for field in self.fields if field in self]
+        if self.extra is not None:
+            keys.extend(self.extra)
+        return keys
+
+    def items(self):
+        return [(field, self[field]) for field in self.keys()]
+
+    def update_changed(self, fields):
+        """Updates the record, and returns whether or not any of the values actually changed."""
+        changed = False
+        for field, value in fields.items():
+            old_value = self.get(field, missing)
+            self[field] = value
+            if not changed and self[field] != old_value:
+                changed = True
+        return changed
+
+    def to_dict(self):
+        """Returns the record as a plain dictionary, the way it is stored."""
+        return dict(self.items())
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.to_dict())
+
+class user_record(record):
+    """Who a user is, shared by every server they are on. Kept in the global users table."""
+    fields = ('name', 'avatar', 'discriminator', 'last_game', 'last_seen', 'aliases')
+    field_set = frozenset(fields)
+    interned_fields = frozenset(('discriminator', 'last_game'))
+    __slots__ = ('name', '_avatar_prefix', '_avatar', 'discriminator', 'last_game', '_last_seen', '_aliases')
+
+    @property
+    def avatar(self):
+        return self._avatar_prefix + self._avatar
+
+    @avatar.setter
+    def avatar(self, url):
+        self._avatar_prefix = ''
+        self._avatar = url
+        for prefix in AVATAR_PREFIXES:
+            if url.startswith(prefix):
+                self._avatar_prefix = prefix
+                self._avatar = url[len(prefix):]
+                break
+
+    # Dates are kept as seconds since the epoch and only formatted when shown (see format_time)
+    @property
+    def last_seen(self):
+        return self._last_seen
+
+    @last_seen.setter
+    def last_seen(self, value):
+        self._last_seen = to_epoch(value)
+
+    # Aliases are an ordered set (a dictionary with no values), oldest first, but stored as a list
+    @property
+    def aliases(self):
+        return list(self._aliases)
+
+    @aliases.setter
+    def aliases(self, value):
+        self._aliases = dict.fromkeys(value)
+
+    def has_alias(self, alias):
+        return alias in self._aliases
+
+    def add_alias(self, alias, limit=0):
+        """Adds the alias if it is new, and returns whether or not it was.
+
+        Keyword arguments:
+        limit -- how many aliases to keep, dropping the oldest ones (0 keeps all of them)
+        """
+        if alias in self._aliases:
+            return False
+        self._aliases[alias] = None
+        while limit > 0 and len(self._aliases) > limit:
+            del self._aliases[next(iter(self._aliases))]
+        return True
+
+class member_record(record):
+    """What is specific to a user on one server."""
+    fields = ('joined', 'nickname', 'status', 'color', 'friend_level', 'pun_level', 'repost_level', 'love_level')
+    field_set = frozenset(fields)
+    interned_fields = frozenset(('status', 'color'))
+    __slots__ = ('_joined', 'nickname', 'status', 'color', 'friend_level', 'pun_level', 'repost_level', 'love_level')
+
+    @property
+    def joined(self):
+        return self._joined
+
+    @joined.setter
+    def joined(self, value):
+        self._joined = to_epoch(value)
+
+class channel_record(record):
+    fields = ('name', 'position', 'default', 'voice', 'muted')
+    field_set = frozenset(fields)
+    __slots__ = fields
+
+class tag_record(record):
+    """The text of a tag lives in the tag text store (see blobmanager), and only its hash is stored.
+
+    Reading tag_text gets the text from the store, and setting it adds the text to the store.
+    Tags saved with the text itself are moved over when loaded.
+    """
+    fields = ('text_hash', 'author_id', 'private', 'full_name', 'hits', 'date_created')
+    field_set = frozenset(fields)
+    interned_fields = frozenset(('author_id',))
+    virtual_fields = frozenset(('tag_text',))
+    __slots__ = ('_text', 'author_id', 'private', 'full_name', 'hits', 'date_created')
+
+    @property
+    def text_hash(self):
+        return self._text[2]
+
+    @text_hash.setter
+    def text_hash(self, key):
+        self._text = blobmanager.get_ref(key)
+
+    @property
+    def tag_text(self):
+        return blobmanager.get_text(self._text)
+
+    @tag_text.setter
+    def tag_text(self, text):
+        self._text = blobmanager.store_text(text)
+
+    def rebind_text(self):
+        """Gets a new reference to the text from the store (compacting it moves every text)."""
+        self._text = blobmanager.get_ref(self._text[2])
+
+class sound_tag_record(record):
+    fields = ('url', 'author_id', 'private', 'type', 'length', 'full_name', 'hits', 'date_created')
+    field_set = frozenset(fields)
+    interned_fields = frozenset(('author_id', 'type'))
+    __slots__ = fields
+
+record_types = {'channels':channel_record, 'users':member_record, 'tags':tag_record, 'sound_tags':sound_tag_record}
+
+def get_record_type(kind, global_users=False):
+    """Returns the record type for the given collection (of the global users table if global_users is True)."""
+    return user_record if global_users and kind == 'users' else record_types[kind]
+
+def make_record(kind, fields, global_users=False):
+    """Turns a dictionary into the record type for the given collection. Records are returned as is."""
+    if isinstance(fields, record):
+        return fields
+    return get_record_type(kind, global_users)(fields)
+
+def load_server(server_data, global_users=False):
+    """Turns every collection of freshly loaded server data into records, in place."""
+    for kind in record_types:
+        record_type = get_record_type(kind, global_users)
+        server_data[kind] = {key: record_type(fields) for key, fields in server_data[kind].items()}
+    return server_data
+
+def join_user(user_data, member_data):
+    """Joins a global user record with a member record into one plain dictionary."""
+    joined = user_data.to_dict() if user_data is not None else {}
+    joined.update(member_data.to_dict())
+    return joined
+
+def copy_data(value):
+    """Copies servers data (or any part of it), turning records back into plain dictionaries."""
+    if isinstance(value, record):
+        value = value.to_dict()
+    if isinstance(value, dict):
+        return {key: copy_data(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [copy_data(item) for item in value]
+    return value
@@ -1,29 +1,428 @@
-import json, os.path, threading
+import os.path, threading, asyncio, queue
 
-from jshbot import configmanager, botmanager
+from jshbot import configmanager, botmanager, storagemanager, records, indexmanager, statsmanager, blobmanager
 from jshbot.configmanager import data_directory
 from jshbot.jbce import bot_exception
 
 EXCEPT_TYPE = "Server manager"
 
+# Pseudo-server that holds the global users table in its users collection. Users on actual
+# servers only have their membership records (see records.user_record and member_record).
+GLOBAL_ID = storagemanager.GLOBAL_ID
+
+# What new membership records start out with
+MEMBER_DEFAULTS = {
+    'nickname':'',
+    'status':'',
+    'color':'',
+    'friend_level':0,
+    'pun_level':0,
+    'repost_level':0,
+    'love_level':0
+}
+
 servers_data = {}
+backend = None
 write_lock = threading.Lock()
 
+# Write-behind state
+dirty_records = set() # (server_id, kind, key), see storagemanager.storage_backend
+flusher_running = False
+write_requests = 0
+flush_count = 0
+changes_flushed = 0
+
+# Tag and sound tag hits that haven't been folded into their records yet
+pending_hits = {} # (server_id, kind, key): hits
+hits_counted = 0
+
+# Writer thread state
+write_queue = queue.Queue() # (snapshot, changes, complete, on_written)
+writer_thread = None
+write_errors = 0
+
+class server_acl:
+    """Permissions of one server compiled into sets, so that checking a message is a few lookups.
+
+    Built from servers data when first needed, and thrown away by whatever changes the bans,
+    admins, or muting (see invalidate_acl).
+    """
+    __slots__ = ('bans', 'admins', 'muted', 'muted_channels')
+
+    def __init__(self, server_data):
+        self.bans = frozenset(server_data['bans'])
+        # The owner and the bot itself are admins everywhere
+        self.admins = frozenset(server_data['admins'] + [configmanager.config['owner_id'], botmanager.client_id])
+        self.muted = server_data['muted']
+        self.muted_channels = frozenset(channel_id for channel_id, channel_data in server_data['channels'].items()
+                if channel_data['muted'])
+
+    def is_admin(self, user_id):
+        return user_id in self.admins
+
+    def is_banned(self, user_id):
+        return user_id in self.bans
+
+    def is_muted(self, channel_id):
+        return self.muted or channel_id in self.muted_channels
+
+acls = {} # server_id: server_acl
+
+class lazy_servers(dict):
+    """Servers data that loads each server from the backend the first time it is accessed."""
+    def __missing__(self, server_id):
+        server_data = backend.load_server(server_id)
+        if server_data is None: # Server doesn't exist
+            if server_id != GLOBAL_ID:
+                raise KeyError(server_id)
+            server_data = create_global_users()
+        return load_server(server_id, server_data)
+
+def get_data_backend():
+    """Returns the name of the configured storage backend ('sharded', 'single', 'sqlite', or 'journal')."""
+    return configmanager.config.get('data_backend', 'sharded')
+
 # I hate typing        
 def load_data():
-    """Loads the servers.json data file into servers_data"""
-    global servers_data
-    print("Loading servers data...")
-    with open(data_directory + '/servers.json', 'r') as servers_file:
-        servers_data = json.load(servers_file)
+    """Sets up the storage backend, and loads the servers data if the backend isn't lazy."""
+    global servers_data, backend
+    print("Loading servers data ({} backend)...".format(get_data_backend()))
+    backend = storagemanager.get_backend(get_data_backend(), data_directory)
+    if backend.lazy:
+        servers_data = lazy_servers()
+    else:
+        loaded = backend.load_all()
+        servers_data = {GLOBAL_ID: loaded.pop(GLOBAL_ID, None) or create_global_users()}
+        load_server(GLOBAL_ID, servers_data[GLOBAL_ID])
+        for server_id, server_data in loaded.items():
+            load_server(server_id, server_data)
+        print("Decoded {} bytes with {} in {:.3f} seconds".format(
+                backend.decoded_bytes, backend.codec.name, backend.decode_time))
+    start_writer()
+
+def create_global_users():
+    """Returns a new, empty global users table, and marks it to be written out."""
+    write_data(GLOBAL_ID)
+    return {kind:{} for kind in storagemanager.COLLECTIONS}
+
+def load_server(server_id, server_data):
+    """Adds freshly loaded server data to servers_data, turning it into records first.
+
+    Users saved before the global users table existed have their identity fields moved into it,
+    and tags saved with their text have it moved into the tag text store. With lazy_users set,
+    membership records that hold nothing but the defaults are dropped (see is_default_member).
+    """
+    if server_id == GLOBAL_ID:
+        servers_data[server_id] = records.load_server(server_data, global_users=True)
+        return server_data
+    global_users = servers_data[GLOBAL_ID]['users']
+    moved = []
+    for user_id, user_data in server_data['users'].items():
+        identity = {field: user_data.pop(field) for field in records.user_record.fields if field in user_data}
+        if not identity:
+            continue
+        if user_id in global_users: # Already known from another server, so just keep the aliases
+            for alias in identity.get('aliases', []):
+                global_users[user_id].add_alias(alias)
+        else:
+            global_users[user_id] = records.user_record(identity)
+        moved.append(user_id)
+    pruned = []
+    if get_lazy_users(): # Probably from before lazy_users was set, so leave them to the client cache
+        pruned = [user_id for user_id, user_data in server_data['users'].items() if is_default_member(user_data)]
+        for user_id in pruned:
+            del server_data['users'][user_id]
+        if pruned:
+            print("Dropped {} unused member record(s) from server {}".format(len(pruned), server_id))
+    moved_tags = [tag_name for tag_name, tag_data in server_data['tags'].items() if 'tag_text' in tag_data]
+    servers_data[server_id] = records.load_server(server_data)
+    for user_id in moved:
+        write_data(GLOBAL_ID, 'users', user_id)
+        write_data(server_id, 'users', user_id)
+    for user_id in pruned:
+        write_data(server_id, 'users', user_id)
+    for tag_name in moved_tags:
+        write_data(server_id, 'tags', tag_name)
+    return server_data
+
+def is_default_member(member_data):
+    """Returns whether or not the membership record has nothing the client cache doesn't (see lazy_users)."""
+    return all(member_data.get(field, default) == default for field, default in MEMBER_DEFAULTS.items())
+
+def start_writer():
+    """Starts the thread that does all of the writing, so that disk I/O stays off the event loop."""
+    global writer_thread
+    if writer_thread is None or not writer_thread.is_alive():
+        writer_thread = threading.Thread(target=writer_loop, name="Servers data writer", daemon=True)
+        writer_thread.start()
+
+def writer_loop():
+    """Writes out the snapshots handed over by flush_data, in order. Runs on the writer thread.
+
+    on_written gets the last write error if anything that failed hasn't been written since, or None.
+    """
+    global write_errors
+    failed_changes = set() # Failed to write, and not written by a later flush yet
+    last_error = None
+    while (True):
+        snapshot, changes, complete, on_written = write_queue.get()
+        if changes:
+            try:
+                backend.write(snapshot, changes, complete)
+                failed_changes.difference_update(changes)
+            except Exception as e: # Keep the changes around so the next flush tries again
+                write_errors += 1
+                last_error = e
+                failed_changes.update(changes)
+                print("=== ERROR: Failed to write servers data: {}".format(e))
+                with write_lock:
+                    dirty_records.update(changes)
+        if on_written is not None:
+            on_written(last_error if failed_changes else None)
+
+def get_lazy_users():
+    """Returns whether or not users only get records once they use the bot (instead of every member)."""
+    return configmanager.config.get('lazy_users', False)
+
+def get_alias_limit():
+    """Returns how many former names are kept for each user (0 keeps all of them)."""
+    return configmanager.config.get('alias_limit', 0)
+
+def get_write_interval():
+    """Returns how many seconds the flusher waits between writes (0 writes immediately)."""
+    return configmanager.config.get('write_interval', 10)
         
 # I still hate typing
-def write_data():
-    """Serializes the given data as servers.json."""
-    write_lock.acquire()
-    with open(data_directory + '/servers.json', 'w') as servers_file:
-        json.dump(servers_data, servers_file, indent=4)
-    write_lock.release()
+def write_data(server_id, kind=None, key=None):
+    """Marks the given record (or the server fields) as changed so that the flusher writes it out.
+
+    If the write interval is 0, the data is written out immediately instead.
+    """
+    global write_requests
+    write_requests += 1
+    with write_lock:
+        dirty_records.add((server_id, kind, key))
+    if get_write_interval() <= 0:
+        flush_data()
+
+def flush_data(on_written=None):
+    """Snapshots every change since the last flush and queues it up for the writer thread.
+
+    Only the copying happens here; on_written is called from the writer thread once the
+    snapshot (and everything queued before it) has been written out, with the write error
+    if that failed (see writer_loop).
+    """
+    global flush_count, changes_flushed
+    fold_hits()
+    with write_lock:
+        changes = set(dirty_records)
+        dirty_records.clear()
+    if not changes:
+        if on_written is not None: # Still wait for whatever is already queued
+            write_queue.put((None, None, False, on_written))
+        return False
+    scope = backend.get_snapshot_scope(changes)
+    snapshot = storagemanager.take_snapshot(servers_data, changes, scope, backend.record_servers)
+    write_queue.put((snapshot, changes, scope == 'all', on_written))
+    flush_count += 1
+    changes_flushed += len(changes)
+    return True
+
+def add_hit(server_id, kind, key):
+    """Counts a hit for a tag or sound tag. Hits are only folded into the record on the next flush."""
+    global hits_counted
+    hits_counted += 1
+    pending_hits[(server_id, kind, key)] = pending_hits.get((server_id, kind, key), 0) + 1
+
+def get_hits(server_id, kind, key):
+    """Returns the live hits of a tag or sound tag, including the ones not yet folded in."""
+    return servers_data[server_id][kind][key]['hits'] + pending_hits.get((server_id, kind, key), 0)
+
+def fold_hits():
+    """Adds the pending hits to their records and marks them as changed.
+
+    Called by flush_data, so this marks the records directly instead of going through write_data
+    (which would flush again for every record if the write interval is 0).
+    """
+    global write_requests
+    folded = []
+    while pending_hits:
+        (server_id, kind, key), hits = pending_hits.popitem()
+        try:
+            tag_data = servers_data[server_id][kind][key]
+        except KeyError: # Removed in the meantime
+            continue
+        tag_data['hits'] += hits
+        folded.append((server_id, kind, key))
+    write_requests += len(folded)
+    with write_lock:
+        dirty_records.update(folded)
+
+def drop_hits(server_id, kind=None, key=None):
+    """Forgets the pending hits of a record (or of every record on the server if no kind is given)."""
+    if kind is None:
+        for hit_key in [hit_key for hit_key in pending_hits if hit_key[0] == server_id]:
+            del pending_hits[hit_key]
+    else:
+        pending_hits.pop((server_id, kind, key), None)
+
+def get_write_exception(error):
+    return bot_exception(EXCEPT_TYPE, "Failed to write servers data (the next flush tries again)", error)
+
+async def wait_for_write():
+    """Flushes right away and waits until everything changed so far is on disk.
+
+    Raises a bot exception if it couldn't be written.
+    """
+    loop = asyncio.get_event_loop()
+    written = asyncio.Future()
+
+    def on_written(error): # On the writer thread
+        if error is None:
+            loop.call_soon_threadsafe(written.set_result, True)
+        else:
+            loop.call_soon_threadsafe(written.set_exception, get_write_exception(error))
+
+    flush_data(on_written=on_written)
+    await written
+
+async def flush_loop():
+    """Periodically flushes servers_data. Only one flusher runs at a time."""
+    global flusher_running
+    if flusher_running or get_write_interval() <= 0:
+        return
+    flusher_running = True
+    try:
+        while (True):
+            await asyncio.sleep(get_write_interval())
+            flush_data()
+    finally:
+        flusher_running = False
+
+async def compact_tag_texts():
+    """Drops the texts no tag uses anymore from the tag text store, and returns how many bytes that freed up.
+
+    The file work happens on the writer thread, after everything changed so far is written out.
+    """
+    store = blobmanager.get_store()
+    store.begin_compaction() # Texts stored from here on are kept
+    loaded_ids = set(servers_data)
+    live_keys = set()
+    for server_data in servers_data.values():
+        live_keys.update(tag_data.text_hash for tag_data in server_data['tags'].values())
+    loop = asyncio.get_event_loop()
+    compacted = asyncio.Future()
+
+    def compact(error): # On the writer thread
+        if error is not None: # Saved servers might be out of date
+            store.end_compaction()
+            loop.call_soon_threadsafe(compacted.set_exception, get_write_exception(error))
+            return
+        try:
+            if backend.lazy: # Servers that aren't loaded only have their saved hashes
+                for server_id, server_data in backend.iterate_servers():
+                    if server_id not in loaded_ids: # Doesn't trigger a load
+                        live_keys.update(tag_data.get('text_hash') for tag_data in server_data['tags'].values())
+            reclaimed = store.compact(live_keys)
+        except Exception as e:
+            loop.call_soon_threadsafe(compacted.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(compacted.set_result, reclaimed)
+
+    flush_data(on_written=compact) # Saved servers have to be up to date
+    reclaimed = await compacted
+    for server_data in servers_data.values(): # Offsets moved
+        for tag_data in server_data['tags'].values():
+            tag_data.rebind_text()
+    return reclaimed
+
+def get_data_info():
+    """Retrieves a bundle of information about data persistence."""
+    return """Data information:
+```
+Backend: {backend}
+Loaded servers: {loaded}
+Write interval: {interval} second(s)
+Write requests: {requests}
+Flushes: {flushes}
+Coalesced writes: {coalesced}
+Changes flushed: {changes}
+Changes pending: {dirty}
+Hits counted: {hits}
+Hits pending: {pending}
+Writes queued: {queued}
+Write errors: {errors}
+{backend_info}{store_info}```""".format(backend=backend.name, backend_info=backend.get_info(),
+        store_info=blobmanager.get_store().get_info(),
+        queued=write_queue.qsize(), errors=write_errors, loaded=len(servers_data), interval=get_write_interval(),
+        requests=write_requests, flushes=flush_count, changes=changes_flushed, dirty=len(dirty_records),
+        hits=hits_counted, pending=sum(pending_hits.values()),
+        coalesced=write_requests - flush_count - (1 if dirty_records else 0))
+
+# Storage interface for the other modules
+def get_server(server_id):
+    """Returns the data of the given server. Raises KeyError if it doesn't exist."""
+    return servers_data[server_id]
+
+def get_records(server_id, kind):
+    """Returns every record of the given kind ('channels', 'users', 'tags', or 'sound_tags')."""
+    return servers_data[server_id][kind]
+
+def get_record(server_id, kind, key):
+    """Returns a single record. Raises KeyError if it doesn't exist."""
+    return servers_data[server_id][kind][key]
+
+def get_user(server_id, user_id):
+    """Returns everything known about a user on the given server as one dictionary.
+
+    This joins the global users table with the membership record. Raises KeyError if the
+    user isn't on the server.
+    """
+    member_data = servers_data[server_id]['users'][user_id]
+    return records.join_user(servers_data[GLOBAL_ID]['users'].get(user_id), member_data)
+
+def has_user(server_id, user_id):
+    """Returns whether or not the user has a record on the given server."""
+    return user_id in servers_data[server_id]['users']
+
+def preview_user(**kwargs):
+    """Returns what get_user would for a new user with the given fields (see update_user), without adding them."""
+    identity = {field: kwargs.pop(field) for field in records.user_record.fields if field in kwargs}
+    return records.join_user(
+            records.user_record(identity, aliases=[identity['name']] if 'name' in identity else []),
+            records.member_record(kwargs, **MEMBER_DEFAULTS))
+
+def set_record(server_id, kind, key, record):
+    """Adds or replaces a single record."""
+    servers_data[server_id][kind][key] = records.make_record(kind, record, server_id == GLOBAL_ID)
+    drop_hits(server_id, kind, key) # Hits from whatever was here before don't count
+    write_data(server_id, kind, key)
+
+def update_record(server_id, kind, key, **kwargs):
+    """Updates the given fields of an existing record. Raises KeyError if it doesn't exist."""
+    servers_data[server_id][kind][key].update(kwargs)
+    write_data(server_id, kind, key)
+
+def remove_record(server_id, kind, key):
+    """Removes a single record. Raises KeyError if it doesn't exist."""
+    del servers_data[server_id][kind][key]
+    drop_hits(server_id, kind, key)
+    write_data(server_id, kind, key)
+
+def get_acl(server_id):
+    """Returns the compiled permissions of the given server. Raises KeyError if it doesn't exist."""
+    try:
+        return acls[server_id]
+    except KeyError:
+        acls[server_id] = server_acl(servers_data[server_id])
+        return acls[server_id]
+
+def invalidate_acl(server_id=None):
+    """Throws away the compiled permissions of the given server (or of every server)."""
+    if server_id is None:
+        acls.clear()
+    else:
+        acls.pop(server_id, None)
 
 def is_bot(user_id):
     """Checks if user is actually the bot itself"""
@@ -35,15 +434,17 @@ def is_owner(user_id):
 
 def is_admin(server_id, user_id):
     """Checks if user from specified server is a bot admin."""
-    return user_id in servers_data[server_id]['admins'] or is_owner(user_id) or is_bot(user_id)
+    return get_acl(server_id).is_admin(user_id)
 
 def is_banned(server_id, user_id):
     """Checks if user from specified server is banned from bot interaction."""
-    return user_id in servers_data[server_id]['bans']
+    return get_acl(server_id).is_banned(user_id)
 
 def is_muted(server_id, channel_id):
-    """Checks if the bot is muted on the specified server."""
-    return servers_data[server_id]['muted'] or servers_data[server_id]['channels'][channel_id]['muted']
+    """Checks if the bot is muted on the specified server or channel. Raises KeyError if the channel doesn't exist."""
+    if channel_id not in servers_data[server_id]['channels']:
+        raise KeyError(channel_id)
+    return get_acl(server_id).is_muted(channel_id)
     
 def add_ban(server_id, user_id, add=True):
     """Bans or unbans the given user."""
@@ -55,7 +456,8 @@ def add_ban(server_id, user_id, add=True):
         servers_data[server_id]['bans'].append(user_id)
     else:
         servers_data[server_id]['bans'].remove(user_id)
-    write_data()
+    invalidate_acl(server_id)
+    write_data(server_id)
     return "User successfully {}banned".format('' if add else "un")
 
 def add_admin(server_id, user_id, add=True):
@@ -68,7 +470,8 @@ def add_admin(server_id, user_id, add=True):
         if user_id == configmanager.config['owner_id']:
             raise bot_exception(EXCEPT_TYPE, "You can't remove yourself, silly goose!")
         servers_data[server_id]['admins'].remove(user_id)
-    write_data()
+    invalidate_acl(server_id)
+    write_data(server_id)
     return "User successfully {} as an admin".format("added" if add else "removed")
 
 def mute_channel(server_id, channel_id, mute=True):
@@ -76,8 +479,8 @@ def mute_channel(server_id, channel_id, mute=True):
     channel_muted = servers_data[server_id]['channels'][channel_id]['muted']
     if (mute and channel_muted) or (not mute and not channel_muted):
         raise bot_exception(EXCEPT_TYPE, "Channel is already {}muted".format('' if mute else "un"))
-    servers_data[server_id]['channels'][channel_id]['muted'] = mute
-    write_data()
+    update_record(server_id, 'channels', channel_id, muted=mute)
+    invalidate_acl(server_id)
     return "Channel successfully {}muted".format('' if mute else "un")
     
 def mute_server(server_id, mute=True):
@@ -86,7 +489,8 @@ def mute_server(server_id, mute=True):
     if (mute and server_muted) or (not mute and not server_muted):
         raise bot_exception(EXCEPT_TYPE, "Server is already {}muted".format('' if mute else "un"))
     servers_data[server_id]['muted'] = mute
-    write_data()
+    invalidate_acl(server_id)
+    write_data(server_id)
     return "Server successfully {}muted".format('' if mute else "un")
 
 def update_server(server_id, force_write=True, **kwargs):
@@ -112,8 +516,9 @@ def update_server(server_id, force_write=True, **kwargs):
             'bans':[],
             'admins':[]
         }
+    write_data(server_id)
     if force_write:
-        write_data()
+        flush_data()
 
 def update_channel(server_id, channel_id, force_write=True, **kwargs):
     """Updates channel information, or adds a new channel.
@@ -127,66 +532,80 @@ def update_channel(server_id, channel_id, force_write=True, **kwargs):
     try:
         servers_data[server_id]['channels'][channel_id].update(kwargs)
     except KeyError: # Channel doesn't exist. Create it.
-        servers_data[server_id]['channels'][channel_id] = {**kwargs, 'muted':False}
+        servers_data[server_id]['channels'][channel_id] = records.channel_record(kwargs, muted=False)
+    write_data(server_id, 'channels', channel_id)
     if force_write:
-        write_data()
+        flush_data()
     
 def update_user(server_id, user_id, force_write=True, **kwargs):
     """Updates user information, or adds a new user.
+
+    The identity fields (name, avatar, discriminator, last_seen, and last_game) go in the
+    global users table, and the rest in the membership record for the server. Only records
+    that actually changed are written out.
     
     Keyword arguments:
     name -- user name
     avatar -- URL of the user's avatar
     discriminator -- discriminator?????
-    joined -- date the user joined
-    last_seen -- date of when the user was last seen online
+    joined -- date the user joined (datetime or seconds since the epoch)
+    last_seen -- seconds since the epoch of when the user was last seen online
     last_game -- last known game the user played
     nickname -- nickname (should only be passed when bot is changing nickname)
     status -- status (same as nickname, only for bot use)
     """
-    try:
-        aliases = servers_data[server_id]['users'][user_id]['aliases']
-        try:
-            if kwargs['name'] not in aliases: # Add new name to list
-                aliases.append(kwargs['name'])
-                kwargs['aliases'] = aliases
-        except KeyError: # No name was given - it's the bot
-            pass
-        if not kwargs['last_seen']: # The last seen date and game shouldn't be overwritten
-            del kwargs['last_seen']
-        if not kwargs['last_game']:
-            del kwargs['last_game']
-        servers_data[server_id]['users'][user_id].update(kwargs)
-    except KeyError: # User doesn't exist. Create it.
-        servers_data[server_id]['users'][user_id] = {
-            **kwargs,
-            'nickname':'',
-            'status':'',
-            'color':'',
-            'friend_level':0,
-            'pun_level':0,
-            'repost_level':0,
-            'love_level':0,
-            'aliases':[kwargs['name']]
-        }
+    identity = {field: kwargs.pop(field) for field in records.user_record.fields if field in kwargs}
+    global_users = servers_data[GLOBAL_ID]['users']
+    renamed = False
+    if user_id in global_users:
+        user_data = global_users[user_id]
+        renamed = 'name' in identity and identity['name'] != user_data.get('name')
+        new_alias = renamed and user_data.add_alias(identity['name'], get_alias_limit()) # Add new name to list
+        for field in ('last_seen', 'last_game'): # The last seen date and game shouldn't be overwritten
+            if field in identity and not identity[field]:
+                del identity[field]
+        if user_data.update_changed(identity) or new_alias:
+            write_data(GLOBAL_ID, 'users', user_id)
+    else: # Never seen on any server. Create it.
+        global_users[user_id] = records.user_record(
+            identity, aliases=[identity['name']] if 'name' in identity else [])
+        write_data(GLOBAL_ID, 'users', user_id)
+    users_data = servers_data[server_id]['users']
+    if user_id in users_data:
+        nickname = users_data[user_id].get('nickname')
+        if users_data[user_id].update_changed(kwargs):
+            write_data(server_id, 'users', user_id)
+            if not renamed and users_data[user_id].get('nickname') != nickname:
+                indexmanager.update_user(server_id, user_id)
+    else: # User isn't on this server yet. Create it.
+        users_data[user_id] = records.member_record(kwargs, **MEMBER_DEFAULTS)
+        write_data(server_id, 'users', user_id)
+        indexmanager.update_user(server_id, user_id)
+    if renamed:
+        indexmanager.update_user(server_id, user_id, everywhere=True)
     if force_write:
-        write_data()
+        flush_data()
     
 # Remove user, remove channel, and remove server
 def remove_server(server_id):
     """Removes specified server."""
-    del servers_data[server_id]
-    write_data()
+    servers_data.pop(server_id, None) # The shard might not be loaded
+    invalidate_acl(server_id)
+    drop_hits(server_id)
+    indexmanager.remove_server(server_id)
+    statsmanager.remove_server(server_id)
+    write_data(server_id)
     
 def remove_channel(server_id, channel_id):
     """Removes specified channel."""
-    del servers_data[server_id]['channels'][channel_id]
-    write_data()
+    remove_record(server_id, 'channels', channel_id)
+    invalidate_acl(server_id)
     
 def remove_user(server_id, user_id):
-    """Removes specified user."""
-    del servers_data[server_id]['users'][user_id]
-    write_data()
+    """Removes specified user from the server. Their global user record stays, since they might be on other servers."""
+    if has_user(server_id, user_id): # Lazy users might not have a record
+        remove_record(server_id, 'users', user_id)
+        indexmanager.remove_user(server_id, user_id)
     
 def get_server_info(server_id):
     """Retrieves a bundle of server information."""
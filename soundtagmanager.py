@@ -3,31 +3,32 @@ import json, os.path, time, random, asyncio, urllib.response, pafy, threading
 from xml.dom.minidom import parseString
 from mutagen.mp3 import MP3
 
-from jshbot import servermanager, usermanager, botmanager, configmanager
-from jshbot.servermanager import write_data
+from jshbot import servermanager, usermanager, botmanager, configmanager, indexmanager, statsmanager, syntaxmanager
 from jshbot.jbce import bot_exception
 
-commands_dictionary = {'module_commands':['soundtag', 'st'],
-                       'shortcut_commands':['stc', 'str', 'stl', 'sts', 'stfu'],
-                       'private_module_commands':[],
-                       'private_shortcut_commands':[]}
+# See syntaxmanager
+command_syntaxes = [{'command':'soundtag', 'aliases':['st'], 'syntaxes':[
+    {'arguments':(1, None), 'usage':'<sound name>', 'function':'respond_play'},
+    {'options':[['create', 'c']], 'optional':[['private', 'p']], 'arguments':(2, 2), 'usage':'<"sound name"> <"sound url">',
+        'shortcuts':['stc'], 'function':'respond_create'},
+    {'options':[['remove', 'r']], 'arguments':(1, None), 'usage':'<sound name>', 'shortcuts':['str'], 'function':'respond_remove'},
+    {'options':[['edit', 'e']], 'arguments':(2, 2), 'usage':'<"sound name"> <"sound url">', 'function':'respond_edit'},
+    {'options':[['edit', 'e'], ['setprivate']], 'arguments':(1, 1), 'usage':'<sound name>', 'function':'respond_set_private'},
+    {'options':[['edit', 'e'], ['setpublic']], 'arguments':(1, 1), 'usage':'<sound name>', 'function':'respond_set_public'},
+    {'options':[['list', 'l']], 'arguments':(0, 1), 'usage':'(user name)', 'shortcuts':['stl'], 'function':'respond_list'},
+    {'options':[['search', 's']], 'arguments':(1, None), 'usage':'<sound name>', 'shortcuts':['sts'], 'function':'respond_search'},
+    {'options':[['top']], 'function':'respond_top'},
+    {'options':[['trending']], 'function':'respond_trending'},
+    {'options':[['info', 'i']], 'arguments':(1, None), 'usage':'<sound name>', 'function':'respond_info'},
+    {'options':[['stop', 'silent', 'silence', 'fu']], 'shortcuts':['stfu'], 'function':'respond_stop'}]}]
+
+commands_dictionary = syntaxmanager.get_commands_dictionary(command_syntaxes)
 commands = []
 for command_list in list(commands_dictionary.values()):
     for command in command_list:
         commands.append(command)
 
-usage_string = """Usage:
-    !soundtag [<sound name>]
-              [-create|c (-private|p) <"sound name"> <"sound url">] [-remove|r <sound name>]
-              [-edit|e <"sound name"> <"sound url">]
-              [-edit|e -setprivate <sound name>] [-edit|e -setpublic <sound name>]
-              [-list|l (user name)]
-              [-search|s <sound name>]
-              [-info|i <sound name>]
-              [-stop|silent|silence|fu]"""
-
-def get_formatted_usage_string():
-    return "\n```\n{}\n```".format(usage_string)
+usage_string = syntaxmanager.get_usage_string(command_syntaxes[0])
 
 help_string = """```
 Description:
@@ -82,9 +83,11 @@ async def timeout_disconnect():
 def get_sound_tag_data(server_id, sound_tag_name):
     """Ensures that the given sound tag exists and return sound tag data, otherwise throw an exception."""
     try:
-        return servermanager.servers_data[server_id]['sound_tags'][sound_tag_name]
+        return servermanager.get_record(server_id, 'sound_tags', sound_tag_name)
     except KeyError:
-        raise bot_exception(EXCEPT_TYPE, "Sound tag '{}' doesn't exist".format(sound_tag_name))
+        suggestions = indexmanager.suggest_tags(server_id, 'sound_tags', sound_tag_name)
+        raise bot_exception(EXCEPT_TYPE, "Sound tag '{}' doesn't exist{}".format(
+                sound_tag_name, ". Did you mean: {}?".format(', '.join(suggestions)) if suggestions else ''))
 
 def get_sound_info(server_id, sound_tag_name):
     """Builds a string listing known information of the given sound tag."""
@@ -94,12 +97,15 @@ def get_sound_info(server_id, sound_tag_name):
 ```
 Author: {author_name}
 Private: {sound_tag_data[private]}
-Hits: {sound_tag_data[hits]}
+Hits: {hits}
+Hits in the last {hours} hours: {recent_hits}
 Date created: {sound_tag_data[date_created]}
 Sound URL: {sound_tag_data[url]}
 Type: {sound_tag_data[type]}
 Length: {sound_tag_data[length]} second(s)
-```""".format(author_name=author_name, sound_tag_data=sound_tag_data)
+```""".format(author_name=author_name, sound_tag_data=sound_tag_data,
+        hits=servermanager.get_hits(server_id, 'sound_tags', sound_tag_name), hours=statsmanager.get_history_hours(),
+        recent_hits=statsmanager.get_recent_hits(server_id, 'sound_tags', sound_tag_name))
     return to_return # Placeholder if this will be modified later
     
 def list_sound_tags(server_id, user_id=''):
@@ -107,24 +113,43 @@ def list_sound_tags(server_id, user_id=''):
     initial_text = "Listing all sound tags:"
     if user_id:
         initial_text = "Listing sound tags created by {}:".format(usermanager.get_name(server_id, user_id))
-    sound_tags = servermanager.servers_data[server_id]['sound_tags']
-    found_list = []
-    for sound_tag_name, sound_tag_data in sound_tags.items():
-        if not user_id or user_id == sound_tag_data['author_id']:
-            found_list.append(sound_tag_data['full_name'])
+    sound_tags = servermanager.get_records(server_id, 'sound_tags')
+    if user_id:
+        found_list = [sound_tags[sound_tag_name]['full_name']
+                for sound_tag_name in indexmanager.find_author_tags(server_id, 'sound_tags', user_id)]
+    else:
+        found_list = [sound_tag_data['full_name'] for sound_tag_data in sound_tags.values()]
     return process_found_list(initial_text, found_list)
     
 def search_sound_tags(server_id, search_text):
     """Tries to find a tag that has the search text in it."""
     initial_text = "Searching sound tags for '{}':".format(search_text)
-    sound_tags = servermanager.servers_data[server_id]['sound_tags']
-    found_list = [sound_tag_name for sound_tag_name in sound_tags if search_text in sound_tag_name]
+    found_list = indexmanager.search_tags(server_id, 'sound_tags', search_text)
     return process_found_list(initial_text, found_list)
 
+def list_top_sound_tags(server_id, user_id, trending=False):
+    """Lists the most played sound tags, either of all time or recently."""
+    if trending:
+        initial_text = "Trending sound tags:"
+        leaders = ['{} ({:.1f})'.format(sound_tag_name, score)
+                for sound_tag_name, score in statsmanager.get_trending_tags(server_id, 'sound_tags', limit=25)
+                if can_see_sound_tag(server_id, sound_tag_name, user_id)]
+    else:
+        initial_text = "Most played sound tags:"
+        leaders = ['{} ({})'.format(sound_tag_name, hits)
+                for sound_tag_name, hits in statsmanager.get_top_tags(server_id, 'sound_tags', limit=25)
+                if can_see_sound_tag(server_id, sound_tag_name, user_id)]
+    return process_found_list(initial_text, leaders[:10], sort=False)
+
+def can_see_sound_tag(server_id, sound_tag_name, user_id):
+    sound_tag_data = servermanager.get_record(server_id, 'sound_tags', sound_tag_name)
+    return not sound_tag_data['private'] or sound_tag_data['author_id'] == user_id or servermanager.is_admin(server_id, user_id)
+
 # Helper for listing functions
-def process_found_list(initial_text, found_list):
-    """Helper function for search_sound_tags and list_sound_tags."""
-    found_list.sort()
+def process_found_list(initial_text, found_list, sort=True):
+    """Helper function for search_sound_tags, list_top_sound_tags, and list_sound_tags."""
+    if sort:
+        found_list.sort()
     list_string = ''
     for sound_tag_name in found_list:
         list_string += '{}, '.format(sound_tag_name)
@@ -133,12 +158,11 @@ def process_found_list(initial_text, found_list):
     return "{initial_text}\n```\n{list_string}\n```\n".format(initial_text=initial_text, list_string=list_string[:-2])
     
 # This function does not work. Don't use it. Or maybe it does. I dunno.
-async def get_random_sound_tag(server_id, voice_channel_id, user_id):
-    """Gets a random sound tag for shiggles."""
-    sound_tags = servermanager.servers_data[server_id]['sound_tags']
-    if len(sound_tags) == 0:
+async def get_random_sound_tag(server_id, voice_channel_id, user_id, weighted=False):
+    """Gets a random sound tag for shiggles. Weighted picks favor sound tags with more hits."""
+    sound_tag_name = indexmanager.get_random_tag(server_id, 'sound_tags', weighted=weighted)
+    if sound_tag_name is None:
         return "No sound tags available!"
-    sound_tag_name = random.choice(list(sound_tags.keys()))
     await play_sound_tag(server_id, voice_channel_id, sound_tag_name, user_id)
     return "Sound tag: {sound_tag_name}".format(sound_tag_name=sound_tag_name)
 
@@ -160,9 +184,11 @@ def update_sound_tag(server_id, sound_tag_name, increment_hits=False, **kwargs):
     to_return = ''
     full_name = sound_tag_name
     sound_tag_name = sound_tag_name.replace(' ', '')
-    servers_data = servermanager.servers_data
     if increment_hits: # Updating hit counter
-        servers_data[server_id]['sound_tags'][sound_tag_name]['hits'] += 1
+        servermanager.get_record(server_id, 'sound_tags', sound_tag_name) # Make sure it exists
+        servermanager.add_hit(server_id, 'sound_tags', sound_tag_name) # Folded into the record on the next flush
+        statsmanager.add_hit(server_id, 'sound_tags', sound_tag_name)
+        indexmanager.update_tag_hits(server_id, 'sound_tags', sound_tag_name)
     else: # Creating or modifying a tag
         if kwargs['url'].startswith('https://www.youtube.com/') or kwargs['url'].startswith('https://youtu.be/'):
             kwargs['type'] = 'YouTube'
@@ -189,16 +215,17 @@ def update_sound_tag(server_id, sound_tag_name, increment_hits=False, **kwargs):
         kwargs['length'] = int(length)
         
         try:
-            sound_tag_data = servers_data[server_id]['sound_tags'][sound_tag_name]
+            sound_tag_data = servermanager.get_record(server_id, 'sound_tags', sound_tag_name)
             try:
                 check_sound_tag_access(server_id, sound_tag_data, kwargs['user_id'], need_owner=True)
             except KeyError: # user_id not found, meant to create but tag exists
                 raise bot_exception(EXCEPT_TYPE, "Sound tag '{}' already exists".format(sound_tag_name))
             del kwargs['user_id'] # Don't write user_id to updated tag
-            servers_data[server_id]['sound_tags'][sound_tag_name].update(kwargs)
+            servermanager.update_record(server_id, 'sound_tags', sound_tag_name, **kwargs)
+            indexmanager.update_tag(server_id, 'sound_tags', sound_tag_name)
             to_return += "Sound tag '{}' successfully modified!".format(full_name)
         except KeyError: # Tag doesn't exist. Create it.
-            if configmanager.config['sound_tags_per_server'] > 0 and len(servers_data[server_id]['sound_tags']) >= configmanager.config['sound_tags_per_server']:
+            if configmanager.config['sound_tags_per_server'] > 0 and len(servermanager.get_records(server_id, 'sound_tags')) >= configmanager.config['sound_tags_per_server']:
                 raise bot_exception(EXCEPT_TYPE, "This server has hit the sound tag limit of {}".format(configmanager.config['sound_tags_per_server']))
             if 'url' not in kwargs:
                 raise bot_exception(EXCEPT_TYPE, "Sound tag '{}' does not exist".format(sound_tag_name))
@@ -211,18 +238,18 @@ def update_sound_tag(server_id, sound_tag_name, increment_hits=False, **kwargs):
                 kwargs['author_id'] = kwargs['user_id']
                 del kwargs['user_id']
             kwargs['full_name'] = full_name
-            servers_data[server_id]['sound_tags'][sound_tag_name] = {**kwargs, 'hits':0, 'date_created':time.strftime("%c")}
+            servermanager.set_record(server_id, 'sound_tags', sound_tag_name, {**kwargs, 'hits':0, 'date_created':time.strftime("%c")})
+            indexmanager.add_tag(server_id, 'sound_tags', sound_tag_name)
             to_return += "Sound tag '{}' successfully created!".format(full_name)
-    write_data()
     return to_return
 
 def remove_sound_tag(server_id, sound_tag_name, user_id):
     """Removes the given sound tag in the server."""
     sound_tag_data = get_sound_tag_data(server_id, sound_tag_name)
     check_sound_tag_access(server_id, sound_tag_data, user_id, need_owner=True)
-    servers_data = servermanager.servers_data
-    del servers_data[server_id]['sound_tags'][sound_tag_name]
-    write_data()
+    servermanager.remove_record(server_id, 'sound_tags', sound_tag_name)
+    indexmanager.remove_tag(server_id, 'sound_tags', sound_tag_name)
+    statsmanager.remove_tag(server_id, 'sound_tags', sound_tag_name)
     return "Tag '{}' successfully removed!".format(sound_tag_name)
     
 async def play_sound_tag(server_id, voice_channel_id, sound_tag_name, user_id):
@@ -310,70 +337,52 @@ def check_sound_tag_access(server_id, sound_tag_data, user_id, need_owner=False)
                 "User is not the author of sound tag '{sound_tag_name}', created by {tag_author}".format(
                 sound_tag_name=sound_tag_data['name'], tag_author=tag_author))
 
-async def get_response(command, options, arguments, arguments_blocks, raw_parameters, server_id, channel_id, voice_channel_id, user_id, is_admin, is_private):
-    """Gets a response from the command and parameters."""
-    
-    to_return = ''
-    num_options = len(options)
-    num_arguments = len(arguments)
-    using_shortcut = command in commands_dictionary['shortcut_commands']
+def get_context_sound_tag_name(context):
+    return context.get_rest(0).lower().replace(' ', '')
 
-    # Play sounds
-    if (not using_shortcut and num_options == 0 and num_arguments >= 1):
-        try: # For convenience, try with both raw parameters and single argument
-            if num_arguments == 1:
-                await play_sound_tag(server_id, voice_channel_id, arguments[0].lower().replace(' ', ''), user_id)
-                return None;
-        except bot_exception:
-            pass
-        await play_sound_tag(server_id, voice_channel_id, arguments_blocks[0].lower().replace(' ', ''), user_id)
-        return None;
+async def respond_play(context):
+    try: # For convenience, try with both raw parameters and single argument
+        if len(context.arguments) == 1:
+            await play_sound_tag(context.server_id, context.voice_channel_id, context.arguments[0].lower().replace(' ', ''), context.user_id)
+            return None
+    except bot_exception:
+        pass
+    await play_sound_tag(context.server_id, context.voice_channel_id, context.arguments_blocks[0].lower().replace(' ', ''), context.user_id)
+    return None
 
-    # Create sound tag
-    elif (num_arguments == 2 and ((command in ['stc'] and num_options == 0) or
-            (not using_shortcut and (num_options == 1 or (num_options == 2 and options[1] in ['p', 'private'])) and
-            options[0] in ['c', 'create']))):
-        use_private = num_options == 2 and options[1] in ['p', 'private'] # Private tag
-        return update_sound_tag(server_id, sound_tag_name=arguments[0].lower(), url=arguments[1], author_id=user_id, private=use_private)
+async def respond_create(context):
+    return update_sound_tag(context.server_id, sound_tag_name=context.arguments[0].lower(), url=context.arguments[1],
+            author_id=context.user_id, private=len(context.options) == 2)
 
-    # Remove sound tag
-    elif (num_arguments >= 1 and ((command in ['str'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['r', 'remove']))):
-        sound_tag_name = (arguments[0].lower() if num_arguments == 1 else arguments_blocks[0].lower()).replace(' ', '')
-        return remove_sound_tag(server_id, sound_tag_name, user_id)
-    
-    # List sound tags
-    elif ((command in ['stl'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and num_arguments <= 1 and options[0] in ['l', 'list'])):
-        return list_sound_tags(server_id, user_id=usermanager.get_user_id(server_id, arguments[0]) if num_arguments == 1 else '')
-    
-    # Search sound tags
-    elif (num_arguments >= 1 and ((command in ['sts'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['s', 'search']))):
-        sound_tag_name = (arguments[0].lower() if num_arguments == 1 else arguments_blocks[0].lower()).replace(' ', '')
-        return search_sound_tags(server_id, sound_tag_name)
-        
-    # Sound tag info
-    elif not using_shortcut and num_options == 1 and num_arguments >= 1 and options[0] in ['i', 'info']:
-        sound_tag_name = (arguments[0].lower() if num_arguments == 1 else arguments_blocks[0].lower()).replace(' ', '')
-        return get_sound_info(server_id, sound_tag_name)
-    
-    # Edit sound tag
-    elif not using_shortcut and (num_options in range(1,3)) and num_arguments <= 2 and options[0] in ['e', 'edit']:
-        if num_options == 2 and num_arguments == 1: # Set private or public
-            if options[1] == 'setpublic': # Explicit to follow a strict syntax
-                return update_sound_tag(server_id, sound_tag_name=arguments[0].lower(), user_id=user_id, private=False)
-            elif options[1] == 'setprivate':
-                return update_sound_tag(server_id, sound_tag_name=arguments[0].lower(), user_id=user_id, private=True)
-        elif num_options == 1 and num_arguments == 2: # Modify sound tag url
-            return update_sound_tag(server_id, sound_tag_name=arguments[0].lower(), user_id=user_id, url=arguments[1], private=False)
-    
-    # Stop sounds
-    elif ((command in ['stfu'] and num_arguments == 0 and num_options == 0) or
-            (not using_shortcut and num_options == 1 and num_arguments == 0 and options[0] in ['stop', 'silence', 'silent', 'fu'])):
-        return await stop_sounds(server_id)
-    
+async def respond_remove(context):
+    return remove_sound_tag(context.server_id, get_context_sound_tag_name(context), context.user_id)
+
+async def respond_edit(context):
+    return update_sound_tag(context.server_id, sound_tag_name=context.arguments[0].lower(), user_id=context.user_id,
+            url=context.arguments[1], private=False)
+
+async def respond_set_private(context):
+    return update_sound_tag(context.server_id, sound_tag_name=context.arguments[0].lower(), user_id=context.user_id, private=True)
+
+async def respond_set_public(context):
+    return update_sound_tag(context.server_id, sound_tag_name=context.arguments[0].lower(), user_id=context.user_id, private=False)
+
+async def respond_list(context):
+    if context.arguments:
+        return list_sound_tags(context.server_id, user_id=usermanager.get_user_id(context.server_id, context.arguments[0]))
+    return list_sound_tags(context.server_id)
+
+async def respond_search(context):
+    return search_sound_tags(context.server_id, get_context_sound_tag_name(context))
+
+async def respond_top(context):
+    return list_top_sound_tags(context.server_id, context.user_id)
+
+async def respond_trending(context):
+    return list_top_sound_tags(context.server_id, context.user_id, trending=True)
 
-    # Invalid command
-    raise bot_exception(EXCEPT_TYPE, "Invalid syntax", get_formatted_usage_string())
+async def respond_info(context):
+    return get_sound_info(context.server_id, get_context_sound_tag_name(context))
 
+async def respond_stop(context):
+    return await stop_sounds(context.server_id)
@@ -0,0 +1,182 @@
+import math, time, heapq
+
+from jshbot import servermanager, configmanager
+
+# In-memory tag (and sound tag) usage analytics, fed by every recall. Nothing here is saved:
+# the all-time leaders start out from the saved hits, but trending scores and hourly history
+# only cover hits since the bot started.
+
+TOP_SIZE = 25 # How many leaders are kept
+
+class top_counter:
+    """Keeps the leaders of a set of scores that only ever go up.
+
+    Only the leaders and their scores are kept. The heap has the lowest leader on top, along
+    with stale entries for leaders whose score went up since (skipped once they reach the top).
+    """
+    __slots__ = ('size', 'leaders', 'heap')
+
+    def __init__(self, size=TOP_SIZE):
+        self.size = size
+        self.leaders = {}
+        self.heap = []
+
+    def rebuild(self, scores):
+        """Starts over with the best of the given {name: score} dictionary."""
+        self.leaders = dict(heapq.nlargest(self.size, scores.items(), key=lambda item: item[1]))
+        self.heap = [(score, name) for name, score in self.leaders.items()]
+        heapq.heapify(self.heap)
+
+    def get_lowest(self):
+        """Returns the (score, name) of the lowest leader, dropping stale entries on the way."""
+        while self.leaders.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0]
+
+    def offer(self, name, score):
+        """Updates the score of an entry, which becomes a leader if it beats the lowest one."""
+        if name not in self.leaders and len(self.leaders) >= self.size:
+            if score <= self.get_lowest()[0]:
+                return
+            del self.leaders[heapq.heappop(self.heap)[1]]
+        self.leaders[name] = score
+        heapq.heappush(self.heap, (score, name))
+        if len(self.heap) > 4 * self.size: # Too many stale entries
+            self.heap = [(score, name) for name, score in self.leaders.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, name):
+        """Drops the entry, and returns whether or not it was a leader (if so, rebuild to fill the spot)."""
+        return self.leaders.pop(name, None) is not None
+
+    def get_top(self, limit):
+        return sorted(self.leaders.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+class hit_history:
+    """Ring buffer of hit counts for the last few hours."""
+    __slots__ = ('counts', 'hour')
+
+    def __init__(self, hours):
+        self.counts = [0] * hours
+        self.hour = 0 # Last hour (since the epoch) that has a slot
+
+    def advance(self, hour):
+        """Clears the slots of the hours that went by since the last hit."""
+        if hour - self.hour >= len(self.counts):
+            self.counts = [0] * len(self.counts)
+        else:
+            for skipped in range(self.hour + 1, hour + 1):
+                self.counts[skipped % len(self.counts)] = 0
+        self.hour = max(hour, self.hour)
+
+    def add(self, hour):
+        self.advance(hour)
+        self.counts[hour % len(self.counts)] += 1
+
+    def get_total(self, hour):
+        self.advance(hour)
+        return sum(self.counts)
+
+class tag_stats:
+    """Usage analytics of the tags (or sound tags) of one server.
+
+    Trending scores use forward decay: each hit adds 2^((time - landmark) / half life), so the
+    stored scores only go up and rank the same as the decayed ones. They are scaled back down
+    (and tiny ones dropped) once every half life.
+    """
+    __slots__ = ('top', 'trending', 'trending_top', 'landmark', 'histories')
+
+    def __init__(self):
+        self.top = None # Built from the saved hits the first time it is needed
+        self.trending = {}
+        self.trending_top = top_counter()
+        self.landmark = time.time()
+        self.histories = {}
+
+    def add_hit(self, tag_name, hits, now):
+        if self.top is not None:
+            self.top.offer(tag_name, hits)
+        half_life = get_half_life()
+        if now - self.landmark > half_life:
+            self.rescale(now)
+        score = self.trending.get(tag_name, 0) + 2 ** ((now - self.landmark) / half_life)
+        self.trending[tag_name] = score
+        self.trending_top.offer(tag_name, score)
+        if tag_name not in self.histories:
+            self.histories[tag_name] = hit_history(get_history_hours())
+        self.histories[tag_name].add(int(now // 3600))
+
+    def rescale(self, now):
+        """Moves the landmark to now, decaying every trending score, and drops what has faded away."""
+        factor = 2 ** (-(now - self.landmark) / get_half_life())
+        self.trending = {tag_name: score * factor for tag_name, score in self.trending.items() if score * factor >= 0.01}
+        self.trending_top.rebuild(self.trending)
+        self.landmark = now
+        hour = int(now // 3600)
+        for tag_name in [tag_name for tag_name, history in self.histories.items() if not history.get_total(hour)]:
+            del self.histories[tag_name]
+
+    def get_trending(self, limit, now):
+        """Returns (tag name, decayed score) pairs, best first."""
+        factor = 2 ** (-(now - self.landmark) / get_half_life())
+        return [(tag_name, score * factor) for tag_name, score in self.trending_top.get_top(limit)]
+
+    def get_recent_hits(self, tag_name, now):
+        history = self.histories.get(tag_name)
+        return history.get_total(int(now // 3600)) if history else 0
+
+    def remove(self, tag_name):
+        """Forgets the tag, refilling the leaders if it was one of them."""
+        if self.top is not None and self.top.remove(tag_name):
+            self.top = None
+        self.trending.pop(tag_name, None)
+        if self.trending_top.remove(tag_name):
+            self.trending_top.rebuild(self.trending)
+        self.histories.pop(tag_name, None)
+
+stats = {} # (server_id, kind): tag_stats
+
+def get_half_life():
+    """Returns how many seconds it takes for a hit to count half as much towards trending."""
+    return configmanager.config.get('trending_half_life', 24) * 3600
+
+def get_history_hours():
+    return configmanager.config.get('history_hours', 24)
+
+def get_stats(server_id, kind):
+    try:
+        return stats[(server_id, kind)]
+    except KeyError:
+        stats[(server_id, kind)] = tag_stats()
+        return stats[(server_id, kind)]
+
+def add_hit(server_id, kind, tag_name):
+    """Counts a recall of the given tag (or sound tag). Call after servermanager.add_hit."""
+    get_stats(server_id, kind).add_hit(tag_name, servermanager.get_hits(server_id, kind, tag_name), time.time())
+
+def get_top_tags(server_id, kind, limit=10):
+    """Returns (tag name, hits) pairs of the most used tags (or sound tags) of all time, best first."""
+    server_stats = get_stats(server_id, kind)
+    if server_stats.top is None:
+        server_stats.top = top_counter()
+        server_stats.top.rebuild({tag_name: servermanager.get_hits(server_id, kind, tag_name)
+                for tag_name in servermanager.get_records(server_id, kind)})
+    return server_stats.top.get_top(limit)
+
+def get_trending_tags(server_id, kind, limit=10):
+    """Returns (tag name, score) pairs of the tags (or sound tags) with the most recent hits, best first."""
+    return get_stats(server_id, kind).get_trending(limit, time.time())
+
+def get_recent_hits(server_id, kind, tag_name):
+    """Returns how many hits the tag (or sound tag) got in the last few hours (see get_history_hours)."""
+    if (server_id, kind) not in stats:
+        return 0
+    return stats[(server_id, kind)].get_recent_hits(tag_name, time.time())
+
+def remove_tag(server_id, kind, tag_name):
+    if (server_id, kind) in stats:
+        stats[(server_id, kind)].remove(tag_name)
+
+def remove_server(server_id):
+    for key in [key for key in stats if key[0] == server_id]:
+        del stats[key]
@@ -0,0 +1,785 @@
+import json, os, os.path, sqlite3, marshal, zlib, lzma, time, threading
+
+try: # Optional, but the fastest of the binary codecs
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from jshbot import configmanager, records
+from jshbot.configmanager import data_directory
+from jshbot.jbce import bot_exception
+
+EXCEPT_TYPE = "Storage manager"
+
+# Everything in a server's data that isn't a plain server field
+COLLECTIONS = ('channels', 'users', 'tags', 'sound_tags')
+
+# Pseudo-server that holds the global users table (see servermanager)
+GLOBAL_ID = 'global'
+
+def get_server_fields(server_data):
+    """Returns the server data without any of the collections."""
+    return {field: value for field, value in server_data.items() if field not in COLLECTIONS}
+
+def leave_out_users(server_id, server_data):
+    """Returns what the file backends keep of a server where they keep the servers, which is
+    everything but the users of the global pseudo-server (those are in user_buckets).
+    """
+    if server_id != GLOBAL_ID or server_data is None:
+        return server_data
+    return {**server_data, 'users':{}}
+
+class data_codec:
+    """Turns servers data into bytes and back. Optionally compresses the result.
+
+    Codecs are named by their format and compression, like 'json-pretty', 'marshal', or 'msgpack+zlib'.
+    """
+    formats = ('json-pretty', 'json', 'marshal', 'msgpack')
+    compressions = ('', 'zlib', 'lzma')
+    extensions = {'json-pretty':'.json', 'json':'.json', 'marshal':'.marshal', 'msgpack':'.msgpack'}
+
+    def __init__(self, name='json-pretty'):
+        data_format, _, compression = name.partition('+')
+        if data_format not in self.formats or compression not in self.compressions:
+            raise bot_exception(EXCEPT_TYPE, "Unknown data codec '{}' (formats: {}; compression: {})".format(
+                    name, ', '.join(self.formats), ', '.join(self.compressions[1:])))
+        if data_format == 'msgpack' and msgpack is None:
+            raise bot_exception(EXCEPT_TYPE, "The msgpack codec needs the msgpack package to be installed")
+        self.name = name
+        self.data_format = data_format
+        self.compression = compression
+        self.extension = self.extensions[data_format] + ('.' + compression if compression else '')
+
+    def encode(self, data):
+        if self.data_format == 'json-pretty':
+            encoded = json.dumps(data, indent=4).encode('utf-8')
+        elif self.data_format == 'json':
+            encoded = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        elif self.data_format == 'marshal':
+            encoded = marshal.dumps(data)
+        else:
+            encoded = msgpack.packb(data, use_bin_type=True)
+        if self.compression == 'zlib':
+            encoded = zlib.compress(encoded, 6)
+        elif self.compression == 'lzma':
+            encoded = lzma.compress(encoded)
+        return encoded
+
+    def can_join(self):
+        """Whether or not the top level object can be built from separately encoded entries."""
+        return self.data_format.startswith('json')
+
+    def encode_entry(self, key, value):
+        """Encodes one key/value pair of the top level object. Only for codecs that can join."""
+        if self.data_format == 'json-pretty': # Nested one level deeper than json.dumps would put it
+            return '    {}: {}'.format(json.dumps(key), json.dumps(value, indent=4).replace('\n', '\n    ')).encode('utf-8')
+        else:
+            return '{}:{}'.format(json.dumps(key), json.dumps(value, separators=(',', ':'))).encode('utf-8')
+
+    def join_entries(self, entries):
+        """Yields the top level object built from encoded entries, chunk by chunk (compressed if needed)."""
+        if self.compression == 'zlib':
+            compressor = zlib.compressobj(6)
+        elif self.compression == 'lzma':
+            compressor = lzma.LZMACompressor()
+        else:
+            compressor = None
+        pretty = self.data_format == 'json-pretty'
+        def get_chunks():
+            if not entries:
+                yield b'{}'
+                return
+            yield b'{\n' if pretty else b'{'
+            for index, entry in enumerate(entries):
+                if index:
+                    yield b',\n' if pretty else b','
+                yield entry
+            yield b'\n}' if pretty else b'}'
+        for chunk in get_chunks():
+            yield compressor.compress(chunk) if compressor else chunk
+        if compressor:
+            yield compressor.flush()
+
+    def decode(self, encoded):
+        if self.compression == 'zlib':
+            encoded = zlib.decompress(encoded)
+        elif self.compression == 'lzma':
+            encoded = lzma.decompress(encoded)
+        if self.data_format.startswith('json'):
+            return json.loads(encoded.decode('utf-8'))
+        elif self.data_format == 'marshal':
+            return marshal.loads(encoded)
+        else:
+            return msgpack.unpackb(encoded, raw=False)
+
+def get_codec():
+    """Returns the configured data codec."""
+    return data_codec(configmanager.config.get('data_codec', 'json-pretty'))
+
+def get_other_extensions(codec):
+    """Returns {extension: codec} for every extension data could have been saved with before
+    data_codec was changed. Codecs that can't be used here (msgpack isn't installed) map to None.
+    """
+    extensions = {}
+    for data_format in data_codec.formats:
+        for compression in data_codec.compressions:
+            name = data_format + ('+' + compression if compression else '')
+            try:
+                other = data_codec(name)
+            except bot_exception:
+                extensions.setdefault(data_codec.extensions[data_format] + ('.' + compression if compression else ''), None)
+                continue
+            if other.extension != codec.extension:
+                extensions[other.extension] = other
+    return extensions
+
+def get_readable_codec(path, codec):
+    """Returns the codec to read the given file with, or raises if it can't be read here."""
+    if codec is None:
+        raise bot_exception(EXCEPT_TYPE, "Found {} from a different data_codec, but can't read it "
+                "(is msgpack installed?). Set data_codec back, or convert it with convert_data".format(path))
+    return codec
+
+def write_atomically(path, encoded):
+    """Writes to a temporary file first and renames it over the original, so a crash can't truncate it.
+
+    The encoded data can either be bytes or an iterable of bytes chunks, which are streamed to disk.
+    """
+    if isinstance(encoded, bytes):
+        encoded = (encoded,)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as temporary_file:
+        for chunk in encoded:
+            temporary_file.write(chunk)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+
+def find_existing_data(directory):
+    """Returns a backend for whatever JSON data already exists (shards first), or None."""
+    if os.path.isdir(directory + '/servers'):
+        return sharded_backend(directory)
+    elif os.path.isfile(directory + '/servers.json'):
+        return single_backend(directory)
+    return None
+
+def get_all_changes(servers_data):
+    """Builds a change set that covers every server and record in the given data."""
+    changes = set()
+    for server_id, server_data in servers_data.items():
+        changes.add((server_id, None, None))
+        for kind in COLLECTIONS:
+            changes.update((server_id, kind, key) for key in server_data[kind])
+    return changes
+
+def take_snapshot(servers_data, changes, scope, record_servers=()):
+    """Copies what a backend needs to write the given changes, so the copy can be written on another thread.
+
+    Scopes:
+    records -- the server fields and the changed records of each changed server
+    servers -- every changed server in full
+    all -- every loaded server
+    Servers in record_servers are always copied like the records scope, no matter the scope.
+    Removed servers are left out, just like in servers_data.
+    """
+    if scope == 'all':
+        server_ids = list(servers_data)
+    else:
+        server_ids = {change[0] for change in changes}
+    snapshot = {}
+    by_record = set()
+    for server_id in server_ids:
+        server_data = servers_data.get(server_id) # Doesn't trigger a load
+        if server_data is None:
+            continue
+        if scope == 'records' or server_id in record_servers:
+            snapshot[server_id] = {**records.copy_data(get_server_fields(server_data)), **{kind:{} for kind in COLLECTIONS}}
+            by_record.add(server_id)
+        else:
+            snapshot[server_id] = records.copy_data(server_data)
+    for server_id, kind, key in changes:
+        if kind is not None and server_id in by_record and key in servers_data[server_id][kind]:
+            snapshot[server_id][kind][key] = records.copy_data(servers_data[server_id][kind][key])
+    return snapshot
+
+class user_buckets:
+    """Keeps the global users table for the file backends, spread over bucket files in data/global_users/.
+
+    A write only rewrites the buckets of the users that changed, instead of the whole table, and
+    the snapshot for it only has to copy those users (see record_servers in storage_backend).
+    """
+    count = 256
+
+    def __init__(self, backend, directory):
+        self.backend = backend # For its codec
+        self.directory = directory + '/global_users'
+        self.buckets_written = 0
+
+    def get_bucket(self, user_id):
+        return zlib.crc32(user_id.encode('utf-8')) % self.count
+
+    def get_base_path(self, bucket, directory=None):
+        return '{}/{:02x}'.format(directory or self.directory, bucket)
+
+    def split(self, user_ids):
+        """Returns {bucket: [user_id, ...]} for the given user IDs."""
+        buckets = {}
+        for user_id in user_ids:
+            buckets.setdefault(self.get_bucket(user_id), []).append(user_id)
+        return buckets
+
+    def load_bucket(self, bucket):
+        base_path = self.get_base_path(bucket)
+        path = base_path + self.backend.codec.extension
+        if os.path.isfile(path):
+            return self.backend.read_file(path)
+        users = self.backend.convert_file(base_path) # Saved with another codec, if at all
+        return users if users is not None else {}
+
+    def load(self, global_data):
+        """Returns the global pseudo-server with the stored users put in, or None if there is nothing.
+
+        Users still kept in the pseudo-server itself (from before the buckets) are moved into buckets first.
+        """
+        if not os.path.isdir(self.directory):
+            self.migrate(global_data['users'] if global_data is not None else {})
+            return global_data
+        users = {}
+        for bucket in range(self.count):
+            users.update(self.load_bucket(bucket))
+        if global_data is None:
+            if not users:
+                return None
+            global_data = {kind:{} for kind in COLLECTIONS}
+        global_data['users'] = users
+        return global_data
+
+    def migrate(self, users):
+        """Writes every user into buckets. Only complete migrations end up in the bucket directory."""
+        if users:
+            print("Moving {} global user(s) into buckets...".format(len(users)))
+        temporary_directory = self.directory + '_migrating'
+        os.makedirs(temporary_directory, exist_ok=True)
+        for bucket, user_ids in self.split(users).items():
+            self.backend.write_file(self.get_base_path(bucket, temporary_directory) + self.backend.codec.extension,
+                    {user_id: users[user_id] for user_id in user_ids})
+        os.rename(temporary_directory, self.directory)
+
+    def write(self, global_data, changes):
+        """Rewrites the buckets of the changed global users, reading them from the (snapshot of the) pseudo-server."""
+        users = global_data['users'] if global_data is not None else {}
+        changed = [key for server_id, kind, key in changes if server_id == GLOBAL_ID and kind == 'users']
+        for bucket, user_ids in self.split(changed).items():
+            stored = self.load_bucket(bucket)
+            for user_id in user_ids:
+                if user_id in users:
+                    stored[user_id] = users[user_id]
+                else: # User was removed
+                    stored.pop(user_id, None)
+            self.backend.write_file(self.get_base_path(bucket) + self.backend.codec.extension, stored)
+            self.buckets_written += 1
+
+class storage_backend:
+    """Base class for anything that can store servers data.
+
+    Changes are given as a set of (server_id, kind, key) tuples, where kind is one of
+    the collections (with key being the record in it), or None for the server fields.
+    If a change points to something that no longer exists, it was removed.
+    """
+    name = ''
+    lazy = True # Whether or not servers should be loaded on first access
+    record_servers = () # Servers that are only snapshotted by record (see take_snapshot)
+    codec = data_codec()
+    decode_time = 0.0
+    decoded_bytes = 0
+
+    def read_file(self, path):
+        """Reads and decodes the given file, keeping track of how long decoding takes."""
+        with open(path, 'rb') as data_file:
+            encoded = data_file.read()
+        start_time = time.perf_counter()
+        data = self.codec.decode(encoded)
+        self.decode_time += time.perf_counter() - start_time
+        self.decoded_bytes += len(encoded)
+        return data
+
+    def write_file(self, path, data):
+        write_atomically(path, self.codec.encode(data))
+
+    def convert_file(self, base_path):
+        """Converts base_path plus the extension of another codec (the newest if there are several)
+        to this codec, and returns the data. The old file is kept with .migrated added to its name.
+
+        Returns None if there is nothing to convert.
+        """
+        found = [(os.path.getmtime(base_path + extension), extension, codec)
+                for extension, codec in get_other_extensions(self.codec).items() if os.path.isfile(base_path + extension)]
+        if not found:
+            return None
+        _, extension, codec = max(found, key=lambda entry: entry[0])
+        old_path = base_path + extension
+        codec = get_readable_codec(old_path, codec)
+        print("Converting {} from {} to {}...".format(old_path, codec.name, self.codec.name))
+        with open(old_path, 'rb') as old_file:
+            data = codec.decode(old_file.read())
+        self.write_file(base_path + self.codec.extension, data)
+        os.replace(old_path, old_path + '.migrated') # Keep the original around just in case
+        return data
+
+    def load_server(self, server_id):
+        """Returns the data of the given server, or None if it doesn't exist."""
+        raise NotImplementedError
+
+    def iterate_servers(self):
+        """Yields (server_id, server_data) for every stored server."""
+        raise NotImplementedError
+
+    def load_all(self):
+        return {server_id: server_data for server_id, server_data in self.iterate_servers()}
+
+    def get_snapshot_scope(self, changes):
+        """Returns how much of the servers data write needs for the given changes (see take_snapshot)."""
+        return 'servers'
+
+    def write(self, servers_data, changes, complete=True):
+        """Persists the given changes, reading the current values from servers_data.
+
+        If complete is False, servers_data only holds what get_snapshot_scope asked for.
+        """
+        raise NotImplementedError
+
+    def write_all(self, servers_data):
+        self.write(servers_data, get_all_changes(servers_data))
+
+    def get_info(self):
+        """Returns extra lines for the data information, if the backend has anything to say."""
+        return "Codec: {}\nDecoded: {} bytes in {:.3f} seconds\n".format(
+                self.codec.name, self.decoded_bytes, self.decode_time)
+
+    def close(self):
+        pass
+
+class single_backend(storage_backend):
+    """Keeps every server in one servers.json file. Everything is loaded on startup.
+
+    For JSON codecs, the encoded form of each server is cached so that a write only re-encodes
+    the servers that changed, and the file is streamed out from the cached fragments.
+    """
+    name = 'single'
+    lazy = False
+    record_servers = (GLOBAL_ID,)
+
+    def __init__(self, directory=data_directory, codec=data_codec()):
+        self.codec = codec
+        self.directory = directory
+        self.path = directory + '/servers' + codec.extension
+        self.fragments = {} # server_id: encoded entry
+        self.fragments_encoded = 0
+        self.users = user_buckets(self, directory)
+
+    def load_server(self, server_id):
+        return self.load_all().get(server_id)
+
+    def iterate_servers(self):
+        return iter(self.load_all().items())
+
+    def load_all(self):
+        """Loads every server. Without a file for the codec yet, one saved with another codec is converted."""
+        if os.path.isfile(self.path):
+            servers_data = self.read_file(self.path)
+        else:
+            servers_data = self.convert_file(self.directory + '/servers')
+            if servers_data is None: # Nothing saved yet
+                servers_data = {}
+        global_data = self.users.load(servers_data.pop(GLOBAL_ID, None))
+        if global_data is not None:
+            servers_data[GLOBAL_ID] = global_data
+        return servers_data
+
+    def get_snapshot_scope(self, changes):
+        if self.codec.can_join() and self.fragments:
+            return 'servers'
+        return 'all'
+
+    def write(self, servers_data, changes, complete=True):
+        self.users.write(servers_data.get(GLOBAL_ID), changes)
+        if not self.codec.can_join():
+            self.write_file(self.path, {server_id: leave_out_users(server_id, server_data)
+                    for server_id, server_data in servers_data.items()})
+            return
+        if self.fragments: # Only re-encode what changed
+            changed_servers = {change[0] for change in changes}
+        else: # First write, nothing is cached yet
+            changed_servers = list(servers_data)
+        for server_id in changed_servers:
+            server_data = servers_data.get(server_id)
+            if server_data is None: # Server was removed
+                self.fragments.pop(server_id, None)
+            else:
+                self.fragments[server_id] = self.codec.encode_entry(server_id, leave_out_users(server_id, server_data))
+        self.fragments_encoded += len(changed_servers)
+        write_atomically(self.path, self.codec.join_entries(list(self.fragments.values())))
+
+    def get_info(self):
+        return storage_backend.get_info(self) + "Cached fragments: {}\nFragments encoded: {}\nUser buckets written: {}\n".format(
+                len(self.fragments), self.fragments_encoded, self.users.buckets_written)
+
+class sharded_backend(storage_backend):
+    """Keeps each server in its own file under data/servers/, only rewriting changed servers."""
+    name = 'sharded'
+    record_servers = (GLOBAL_ID,)
+
+    def __init__(self, directory=data_directory, codec=data_codec()):
+        self.codec = codec
+        self.directory = directory + '/servers'
+        self.users = user_buckets(self, directory)
+        if not os.path.isdir(self.directory):
+            self.migrate(directory)
+        self.convert_shards()
+
+    def migrate(self, directory):
+        """Splits servers.json into shards. Only complete migrations end up in the shard directory."""
+        print("Migrating servers.json to per-server shards...")
+        try:
+            old_data = single_backend(directory).load_all()
+        except FileNotFoundError: # Nothing to migrate
+            old_data = {}
+        temporary_directory = self.directory + '_migrating'
+        os.makedirs(temporary_directory, exist_ok=True)
+        for server_id, server_data in old_data.items():
+            self.write_shard(temporary_directory, server_id, server_data)
+        os.rename(temporary_directory, self.directory)
+        if old_data: # Keep the original around just in case
+            os.replace(directory + '/servers.json', directory + '/servers.json.migrated')
+        print("Migrated {} server(s)".format(len(old_data)))
+
+    def convert_shards(self):
+        """Converts the shards saved with another codec (if data_codec was changed)."""
+        other_extensions = get_other_extensions(self.codec)
+        converted = 0
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(self.codec.extension):
+                continue
+            for extension, codec in other_extensions.items():
+                if file_name.endswith(extension):
+                    path = self.directory + '/' + file_name
+                    codec = get_readable_codec(path, codec)
+                    server_id = file_name[:-len(extension)]
+                    if not os.path.isfile(self.get_shard_path(server_id)): # Not converted before a crash
+                        with open(path, 'rb') as shard_file:
+                            self.write_shard(self.directory, server_id, codec.decode(shard_file.read()))
+                    os.replace(path, path + '.migrated')
+                    converted += 1
+                    break
+        if converted:
+            print("Converted {} shard(s) to {}".format(converted, self.codec.name))
+
+    def get_shard_path(self, server_id, directory=None):
+        return '{}/{}{}'.format(directory or self.directory, server_id, self.codec.extension)
+
+    def write_shard(self, directory, server_id, server_data):
+        self.write_file(self.get_shard_path(server_id, directory), leave_out_users(server_id, server_data))
+
+    def load_server(self, server_id):
+        try:
+            server_data = self.read_file(self.get_shard_path(server_id))
+        except FileNotFoundError:
+            server_data = None
+        if server_id == GLOBAL_ID:
+            return self.users.load(server_data)
+        return server_data
+
+    def iterate_servers(self):
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(self.codec.extension):
+                server_id = file_name[:-len(self.codec.extension)]
+                yield server_id, self.load_server(server_id)
+
+    def write(self, servers_data, changes, complete=True):
+        self.users.write(servers_data.get(GLOBAL_ID), changes)
+        for server_id in {change[0] for change in changes}: # Each shard only once
+            server_data = servers_data.get(server_id) # Doesn't trigger a load
+            if server_data is not None:
+                self.write_shard(self.directory, server_id, server_data)
+            elif os.path.isfile(self.get_shard_path(server_id)):
+                os.remove(self.get_shard_path(server_id))
+
+class sqlite_backend(storage_backend):
+    """Keeps servers data in an SQLite database with one row per record.
+
+    Records are stored as JSON, with the columns needed for lookups pulled out and indexed.
+    The database is in WAL mode, and servers are loaded through a connection of their own, so
+    a lazy load on the event loop doesn't wait for the writer thread to finish a batch.
+    """
+    name = 'sqlite'
+    codec = data_codec('json')
+
+    # Key column and extra indexed columns for each collection
+    key_columns = {'channels':'channel_id', 'users':'user_id', 'tags':'tag_name', 'sound_tags':'tag_name'}
+    indexed_columns = {'channels':(), 'users':('name',), 'tags':('author_id',), 'sound_tags':('author_id',)}
+    # Columns only some rows have, so their index leaves out the NULL rows. Names are only
+    # kept in the global users table, not on the member rows of each server.
+    sparse_columns = {('users', 'name')}
+
+    def __init__(self, directory=data_directory, codec=None): # Rows are always JSON so they stay queryable
+        path = directory + '/servers.sqlite'
+        is_new = not os.path.isfile(path)
+        self.connection = sqlite3.connect(path, check_same_thread=False) # Writes, on the writer thread
+        self.connection.execute('PRAGMA journal_mode=WAL') # Readers see the last commit while a write goes on
+        self.lock = threading.Lock()
+        self.create_tables()
+        self.read_connection = sqlite3.connect(path, check_same_thread=False) # Loads, mostly on the event loop
+        self.read_lock = threading.Lock()
+        if is_new:
+            self.migrate(directory)
+
+    def create_tables(self):
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS servers (server_id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            for kind in COLLECTIONS:
+                key_column = self.key_columns[kind]
+                indexed_columns = self.indexed_columns[kind]
+                self.connection.execute(
+                    'CREATE TABLE IF NOT EXISTS {kind} (server_id TEXT NOT NULL, {key} TEXT NOT NULL, {extra}'
+                    'data TEXT NOT NULL, PRIMARY KEY (server_id, {key}))'.format(
+                    kind=kind, key=key_column, extra=''.join('{} TEXT, '.format(column) for column in indexed_columns)))
+                for column in indexed_columns:
+                    if (kind, column) in self.sparse_columns:
+                        # Databases from before the global users table have a full index instead
+                        self.connection.execute('DROP INDEX IF EXISTS {kind}_by_{column}'.format(kind=kind, column=column))
+                        self.connection.execute('CREATE INDEX IF NOT EXISTS {kind}_by_{column}_sparse ON {kind} ({column}) '
+                                'WHERE {column} IS NOT NULL'.format(kind=kind, column=column))
+                    else:
+                        self.connection.execute('CREATE INDEX IF NOT EXISTS {kind}_by_{column} ON {kind} (server_id, {column})'.format(
+                            kind=kind, column=column))
+
+    def migrate(self, directory):
+        """Imports existing JSON data (shards if there are any, otherwise servers.json)."""
+        source = find_existing_data(directory)
+        if source is None:
+            return
+        print("Importing servers data from the {} backend into SQLite...".format(source.name))
+        old_data = source.load_all()
+        self.write_all(old_data)
+        print("Imported {} server(s)".format(len(old_data)))
+
+    def load_server(self, server_id):
+        with self.read_lock:
+            self.read_connection.execute('BEGIN') # One read transaction, so all rows are from the same commit
+            try:
+                row = self.read_connection.execute('SELECT data FROM servers WHERE server_id = ?', (server_id,)).fetchone()
+                if row is None:
+                    return None
+                rows = {kind: self.read_connection.execute('SELECT {key}, data FROM {kind} WHERE server_id = ?'.format(
+                        key=self.key_columns[kind], kind=kind), (server_id,)).fetchall() for kind in COLLECTIONS}
+            finally:
+                self.read_connection.rollback() # Nothing to keep, just ends the transaction
+        start_time = time.perf_counter()
+        server_data = json.loads(row[0])
+        for kind in COLLECTIONS:
+            server_data[kind] = {key: json.loads(data) for key, data in rows[kind]}
+        self.decode_time += time.perf_counter() - start_time
+        self.decoded_bytes += len(row[0]) + sum(len(data) for kind in COLLECTIONS for _, data in rows[kind])
+        return server_data
+
+    def iterate_servers(self):
+        with self.read_lock:
+            server_ids = self.read_connection.execute('SELECT server_id FROM servers').fetchall()
+        for (server_id,) in server_ids:
+            yield server_id, self.load_server(server_id)
+
+    def get_snapshot_scope(self, changes):
+        return 'records'
+
+    def write(self, servers_data, changes, complete=True):
+        with self.lock, self.connection: # One transaction per flush
+            for server_id, kind, key in changes:
+                server_data = servers_data.get(server_id)
+                if kind is None:
+                    self.write_server(server_id, server_data)
+                else:
+                    record = server_data[kind].get(key) if server_data is not None else None
+                    self.write_record(server_id, kind, key, record)
+
+    def write_server(self, server_id, server_data):
+        if server_data is None: # Server was removed
+            self.connection.execute('DELETE FROM servers WHERE server_id = ?', (server_id,))
+            for kind in COLLECTIONS:
+                self.connection.execute('DELETE FROM {} WHERE server_id = ?'.format(kind), (server_id,))
+        else:
+            self.connection.execute('INSERT OR REPLACE INTO servers (server_id, data) VALUES (?, ?)',
+                    (server_id, json.dumps(get_server_fields(server_data))))
+
+    def write_record(self, server_id, kind, key, record):
+        key_column = self.key_columns[kind]
+        if record is None: # Record was removed
+            self.connection.execute('DELETE FROM {kind} WHERE server_id = ? AND {key} = ?'.format(
+                    kind=kind, key=key_column), (server_id, key))
+        else:
+            indexed_columns = self.indexed_columns[kind]
+            self.connection.execute('INSERT OR REPLACE INTO {kind} (server_id, {key}, {extra}data) VALUES ({marks})'.format(
+                    kind=kind, key=key_column, extra=''.join('{}, '.format(column) for column in indexed_columns),
+                    marks=', '.join('?'*(3 + len(indexed_columns)))),
+                    (server_id, key) + tuple(record.get(column) for column in indexed_columns) + (json.dumps(record),))
+
+    def close(self):
+        self.read_connection.close()
+        self.connection.close()
+
+class journal_backend(storage_backend):
+    """Appends every change to a journal, and periodically folds the journal into a snapshot.
+
+    Each journal line is a JSON object with an op ('set' or 'del'), a path ([server_id] for the
+    server fields, or [server_id, kind, key] for a record), and the new value for 'set'.
+    Replaying a line twice gives the same result, so a crash during compaction is harmless.
+    """
+    name = 'journal'
+    lazy = False
+
+    def __init__(self, directory=data_directory, codec=data_codec()):
+        self.codec = codec
+        self.directory = directory
+        self.snapshot_path = directory + '/servers.snapshot' + codec.extension
+        self.journal_path = directory + '/servers.journal'
+        self.journal_entries = 0
+        self.entries_since_snapshot = 0
+        self.compactions = 0
+        self.journal_file = None
+
+    def load_all(self):
+        """Loads the snapshot and replays the journal on top of it."""
+        base_path = self.directory + '/servers.snapshot'
+        if os.path.isfile(self.snapshot_path):
+            servers_data = self.read_file(self.snapshot_path)
+        else: # The journal goes on top of a snapshot from before data_codec was changed
+            servers_data = self.convert_file(base_path)
+        if servers_data is None and not os.path.isfile(self.journal_path): # First run, import any existing data
+            source = find_existing_data(self.directory)
+            servers_data = source.load_all() if source is not None else {}
+            self.write_file(self.snapshot_path, servers_data)
+        elif servers_data is None:
+            raise bot_exception(EXCEPT_TYPE, "There is a journal, but no snapshot to replay it on "
+                    "(looked for {}). Restore the snapshot, or move the journal away to start over".format(self.snapshot_path))
+        self.journal_entries = 0
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path, 'r') as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError: # Partially written last line from a crash
+                        print("=== WARNING: Skipping a broken journal entry")
+                        continue
+                    self.apply(servers_data, entry)
+                    self.journal_entries += 1
+        print("Replayed {} journal entries".format(self.journal_entries))
+        self.entries_since_snapshot = self.journal_entries
+        return servers_data
+
+    def apply(self, servers_data, entry):
+        """Applies a single journal entry to the given servers data."""
+        server_id = entry['path'][0]
+        if len(entry['path']) == 1: # Server fields
+            if entry['op'] == 'del':
+                servers_data.pop(server_id, None)
+            elif server_id in servers_data:
+                server_data = servers_data[server_id]
+                for field in list(get_server_fields(server_data)):
+                    del server_data[field]
+                server_data.update(entry['value'])
+            else:
+                servers_data[server_id] = {**entry['value'], **{kind:{} for kind in COLLECTIONS}}
+        elif server_id in servers_data:
+            kind, key = entry['path'][1:]
+            if entry['op'] == 'del':
+                servers_data[server_id][kind].pop(key, None)
+            else:
+                servers_data[server_id][kind][key] = entry['value']
+
+    def load_server(self, server_id):
+        return self.load_all().get(server_id)
+
+    def iterate_servers(self):
+        return iter(self.load_all().items())
+
+    def get_snapshot_scope(self, changes):
+        # Counted here rather than in write, since the writer thread can lag behind
+        self.entries_since_snapshot += len(changes)
+        if self.entries_since_snapshot >= self.get_journal_limit(): # Compaction needs everything
+            self.entries_since_snapshot = 0
+            return 'all'
+        return 'records'
+
+    def write(self, servers_data, changes, complete=True):
+        if self.journal_file is None:
+            self.journal_file = open(self.journal_path, 'a')
+        # Server fields go first so that records of new servers have somewhere to go on replay
+        for server_id, kind, key in sorted(changes, key=lambda change: change[1] is not None):
+            server_data = servers_data.get(server_id)
+            if kind is None:
+                path = [server_id]
+                value = get_server_fields(server_data) if server_data is not None else None
+            else:
+                path = [server_id, kind, key]
+                value = server_data[kind].get(key) if server_data is not None else None
+            if value is None:
+                entry = {'op':'del', 'path':path}
+            else:
+                entry = {'op':'set', 'path':path, 'value':value}
+            self.journal_file.write(json.dumps(entry) + '\n')
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        self.journal_entries += len(changes)
+        if complete: # Only complete snapshots can replace the old one
+            self.compact(servers_data)
+
+    def get_journal_limit(self):
+        """Returns how many journal entries are allowed before compacting."""
+        return configmanager.config.get('journal_limit', 5000)
+
+    def compact(self, servers_data):
+        """Writes a new snapshot and starts a fresh journal."""
+        self.write_file(self.snapshot_path, servers_data)
+        if self.journal_file is not None:
+            self.journal_file.close()
+        self.journal_file = open(self.journal_path, 'w') # Truncates
+        self.journal_entries = 0
+        self.compactions += 1
+
+    def get_info(self):
+        return storage_backend.get_info(self) + "Journal entries: {}\nCompactions: {}\n".format(self.journal_entries, self.compactions)
+
+    def close(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+backends = {backend.name: backend for backend in (single_backend, sharded_backend, sqlite_backend, journal_backend)}
+
+def get_backend(name, directory=data_directory, codec=None):
+    """Creates the storage backend with the given name, using the configured codec unless one is given."""
+    if name not in backends:
+        raise bot_exception(EXCEPT_TYPE, "Unknown data backend '{}' (available: {})".format(
+                name, ', '.join(sorted(backends))))
+    return backends[name](directory, codec or get_codec())
+
+def convert_data(backend_name, source_codec_name, target_codec_name, directory=data_directory):
+    """Rewrites the data of a file based backend from one codec to another.
+
+    The backends also convert on their own once data_codec is changed, keeping the original
+    files with .migrated added to their names. The journal backend folds its journal into the
+    new snapshot. Set data_codec in the config to the new codec afterwards, e.g.
+    storagemanager.convert_data('sharded', 'json-pretty', 'marshal+zlib')
+    """
+    if backend_name == 'sqlite':
+        raise bot_exception(EXCEPT_TYPE, "The SQLite backend doesn't use a codec")
+    source = get_backend(backend_name, directory, data_codec(source_codec_name))
+    servers_data = source.load_all()
+    target = get_backend(backend_name, directory, data_codec(target_codec_name)) # After loading, since shards convert right away
+    if backend_name == 'journal':
+        target.compact(servers_data) # Replayed data goes straight into a new snapshot
+        target.close()
+    else:
+        target.write_all(servers_data)
+    print("Converted {} server(s) from {} to {} (decoded in {:.3f} seconds)".format(
+            len(servers_data), source.codec.name, target.codec.name, source.decode_time))
+    return len(servers_data)
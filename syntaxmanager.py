@@ -0,0 +1,148 @@
+from jshbot.jbce import bot_exception
+
+# Declarative command syntaxes. Modules list their commands in command_syntaxes, and the
+# parser compiles every module into one syntax_table, so picking what to run is a lookup
+# on (command, options, number of arguments) instead of a chain of conditions.
+#
+# Each command is declared like this:
+# {'command':'tag', 'aliases':['t'], 'private':False, 'except_type':None, 'syntaxes':[...]}
+#
+# private -- whether or not the command can be used in private messages
+# except_type -- exception type for invalid syntax (defaults to the EXCEPT_TYPE of the module)
+#
+# And each syntax like this:
+# {'options':[['create', 'c']], 'optional':[['private', 'p']], 'arguments':(2, None),
+#  'usage':'<"tag name"> <tag text>', 'shortcuts':['tc'], 'function':'respond_create'}
+#
+# options -- option groups that must be given in order, with the name shown in the usage first
+# optional -- option groups that can follow them (in order)
+# arguments -- (minimum, maximum) number of arguments, where a maximum of None has no limit
+# counts -- exact numbers of arguments instead, for syntaxes that don't take a range
+# usage -- how the arguments are shown in the usage string
+# shortcuts -- commands that run the syntax without any options
+# function -- name of the module function that responds, given a command_context
+#             (None for syntaxes that are shown in the usage, but not handled yet)
+#
+# Options ending in a value (like -results=3) are declared with an equals sign, and match
+# any value.
+
+class command_context:
+    """Everything a syntax function gets to respond with."""
+    __slots__ = ('command', 'options', 'arguments', 'arguments_blocks', 'raw_parameters', 'server_id',
+            'channel_id', 'voice_channel_id', 'user_id', 'is_admin', 'is_private', 'shortcut')
+
+    def __init__(self, **kwargs):
+        for field, value in kwargs.items():
+            setattr(self, field, value)
+
+    def get_rest(self, index):
+        """Returns the given argument, or everything from it on if more arguments follow it."""
+        if len(self.arguments) == index + 1:
+            return self.arguments[index]
+        return self.arguments_blocks[index]
+
+def get_option_key(option):
+    """Options with a value (like results=3) are looked up by their name (results=)."""
+    name, equals, _ = option.partition('=')
+    return name + equals
+
+def get_option_combinations(syntax):
+    """Yields every sequence of option names the syntax accepts."""
+    combinations = [()]
+    for group in syntax.get('options', []):
+        combinations = [combination + (get_option_key(option),) for combination in combinations for option in group]
+    for group in syntax.get('optional', []):
+        combinations += [combination + (get_option_key(option),) for combination in combinations for option in group]
+    return combinations
+
+def get_counts(syntax, limit):
+    """Returns the numbers of arguments the syntax accepts, with everything from the limit on counted as the limit."""
+    if 'counts' in syntax:
+        return syntax['counts']
+    minimum, maximum = syntax.get('arguments', (0, 0))
+    return range(minimum, limit + 1 if maximum is None else maximum + 1)
+
+def get_usage_line(syntax):
+    parts = ['-' + '|'.join(group) for group in syntax.get('options', [])]
+    parts += ['(-' + '|'.join(group) + ')' for group in syntax.get('optional', [])]
+    if syntax.get('usage'):
+        parts.append(syntax['usage'])
+    return '[{}]'.format(' '.join(parts))
+
+def get_usage_string(declaration):
+    """Builds the usage string of a command from its syntaxes, one syntax per line."""
+    invoker = '!{} '.format(declaration['command'])
+    lines = [get_usage_line(syntax) for syntax in declaration['syntaxes']]
+    return "Usage:\n    {}{}".format(invoker, ('\n    ' + ' ' * len(invoker)).join(lines))
+
+def get_commands_dictionary(command_syntaxes):
+    """Builds the commands dictionary of a module (see parser.add_commands) from its command syntaxes."""
+    commands_dictionary = {'module_commands':[], 'shortcut_commands':[],
+                           'private_module_commands':[], 'private_shortcut_commands':[]}
+    for declaration in command_syntaxes:
+        names = [declaration['command']] + declaration.get('aliases', [])
+        shortcuts = [shortcut for syntax in declaration['syntaxes'] for shortcut in syntax.get('shortcuts', [])]
+        commands_dictionary['module_commands'].extend(names)
+        commands_dictionary['shortcut_commands'].extend(shortcuts)
+        if declaration.get('private'):
+            commands_dictionary['private_module_commands'].extend(names)
+            commands_dictionary['private_shortcut_commands'].extend(shortcuts)
+    return commands_dictionary
+
+class syntax_table:
+    """Compiled syntaxes of every module.
+
+    Maps (command, option names, number of arguments) to the function that responds, and
+    whether or not it was called through a shortcut. Numbers of arguments are capped at
+    the arity limit, which is one more than any bound a syntax declares.
+    """
+    __slots__ = ('functions', 'errors', 'arity_limit')
+
+    def __init__(self):
+        self.functions = {}
+        self.errors = {} # command: (exception type, formatted usage string)
+        self.arity_limit = 0
+
+    def compile(self, modules):
+        """Compiles the command syntaxes of the given modules, replacing whatever was there.
+
+        Syntaxes declared first win if more than one of them matches.
+        """
+        declarations = [(module, declaration) for module in modules for declaration in module.command_syntaxes]
+        syntaxes = [syntax for _, declaration in declarations for syntax in declaration['syntaxes']]
+        self.functions = {}
+        self.errors = {}
+        self.arity_limit = 1 + max([0] + [count for syntax in syntaxes for count in
+                syntax.get('counts', [bound for bound in syntax.get('arguments', (0, 0)) if bound is not None])])
+        for module, declaration in declarations:
+            names = [declaration['command']] + declaration.get('aliases', [])
+            error = (declaration.get('except_type') or module.EXCEPT_TYPE,
+                    "\n```\n{}\n```".format(get_usage_string(declaration)))
+            for syntax in declaration['syntaxes']:
+                for shortcut in syntax.get('shortcuts', []):
+                    self.errors[shortcut] = error
+                if syntax.get('function') is None:
+                    continue
+                function = getattr(module, syntax['function'])
+                counts = get_counts(syntax, self.arity_limit)
+                for option_names in get_option_combinations(syntax):
+                    for name in names:
+                        for count in counts:
+                            self.functions.setdefault((name, option_names, count), (function, False))
+                for shortcut in syntax.get('shortcuts', []):
+                    for count in counts:
+                        self.functions.setdefault((shortcut, (), count), (function, True))
+            for name in names:
+                self.errors[name] = error
+
+    def __contains__(self, command):
+        return command in self.errors
+
+    def find(self, command, options, num_arguments):
+        """Returns the function for the given command and whether it is a shortcut, or raises an invalid syntax exception."""
+        key = (command, tuple(get_option_key(option) for option in options), min(num_arguments, self.arity_limit))
+        try:
+            return self.functions[key]
+        except KeyError:
+            except_type, usage = self.errors[command]
+            raise bot_exception(except_type, "Invalid syntax", usage)
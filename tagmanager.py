@@ -1,29 +1,31 @@
 import json, os.path, time, random, asyncio
 
-from jshbot import servermanager, usermanager, configmanager
-from jshbot.servermanager import write_data
+from jshbot import servermanager, usermanager, configmanager, indexmanager, statsmanager, syntaxmanager
 from jshbot.jbce import bot_exception
 
-commands_dictionary = {'module_commands':['tag', 't'],
-                       'shortcut_commands':['tc', 'tr', 'tl', 'ts'],
-                       'private_module_commands':[],
-                       'private_shortcut_commands':[]}
+# See syntaxmanager
+command_syntaxes = [{'command':'tag', 'aliases':['t'], 'syntaxes':[
+    {'arguments':(1, None), 'usage':'<tag name>', 'function':'respond_tag_text'},
+    {'options':[['create', 'c']], 'optional':[['private', 'p']], 'arguments':(2, None), 'usage':'<"tag name"> <tag text>',
+        'shortcuts':['tc'], 'function':'respond_create'},
+    {'options':[['remove', 'r']], 'arguments':(1, None), 'usage':'<tag name>', 'shortcuts':['tr'], 'function':'respond_remove'},
+    {'options':[['edit', 'e']], 'arguments':(2, None), 'usage':'<"tag name"> <tag text>', 'function':'respond_edit'},
+    {'options':[['edit', 'e'], ['setprivate']], 'arguments':(1, None), 'usage':'<tag name>', 'function':'respond_set_private'},
+    {'options':[['edit', 'e'], ['setpublic']], 'arguments':(1, None), 'usage':'<tag name>', 'function':'respond_set_public'},
+    {'options':[['list', 'l']], 'arguments':(0, None), 'usage':'(user name)', 'shortcuts':['tl'], 'function':'respond_list'},
+    {'options':[['search', 's']], 'arguments':(1, None), 'usage':'<tag name>', 'shortcuts':['ts'], 'function':'respond_search'},
+    {'options':[['find', 'f']], 'arguments':(1, None), 'usage':'<words>', 'function':'respond_find'},
+    {'options':[['top']], 'function':'respond_top'},
+    {'options':[['trending']], 'function':'respond_trending'},
+    {'options':[['info', 'i']], 'arguments':(1, None), 'usage':'<tag name>', 'function':'respond_info'}]}]
+
+commands_dictionary = syntaxmanager.get_commands_dictionary(command_syntaxes)
 commands = []
 for command_list in list(commands_dictionary.values()):
     for command in command_list:
         commands.append(command)
 
-usage_string = """Usage:
-    !tag [<tag name>]
-         [-create|c (-private|p) <"tag name"> <tag text>] [-remove|r <tag name>]
-         [-edit|e <"tag name"> <tag text>]
-         [-edit|e -setprivate <tag name>] [-edit|e -setpublic <tag name>]
-         [-list|l (user name)]
-         [-search|s <tag name>]
-         [-info|i <tag name>]"""
-
-def get_formatted_usage_string():
-    return "\n```\n{}\n```".format(usage_string)
+usage_string = syntaxmanager.get_usage_string(command_syntaxes[0])
 
 help_string = """```
 Description:
@@ -50,9 +52,11 @@ EXCEPT_TYPE = "Tag manager"
 def get_tag_data(server_id, tag_name):
     """Ensures that the given tag exists and return tag data, otherwise throw an exception."""
     try:
-        return servermanager.servers_data[server_id]['tags'][tag_name]
+        return servermanager.get_record(server_id, 'tags', tag_name)
     except KeyError:
-        raise bot_exception(EXCEPT_TYPE, "Tag '{}' doesn't exist".format(tag_name))
+        suggestions = indexmanager.suggest_tags(server_id, 'tags', tag_name)
+        raise bot_exception(EXCEPT_TYPE, "Tag '{}' doesn't exist{}".format(
+                tag_name, ". Did you mean: {}?".format(', '.join(suggestions)) if suggestions else ''))
 
 def get_info(server_id, tag_name):
     """Builds a string listing known information of given tag."""
@@ -62,9 +66,12 @@ def get_info(server_id, tag_name):
 ```
 Author: {author_name}
 Private: {tag_data[private]}
-Hits: {tag_data[hits]}
+Hits: {hits}
+Hits in the last {hours} hours: {recent_hits}
 Date created: {tag_data[date_created]}
-```""".format(author_name=author_name, tag_data=tag_data)
+```""".format(author_name=author_name, tag_data=tag_data,
+        hits=servermanager.get_hits(server_id, 'tags', tag_name), hours=statsmanager.get_history_hours(),
+        recent_hits=statsmanager.get_recent_hits(server_id, 'tags', tag_name))
     return to_return # Placeholder if this will be modified later
     
 def list_tags(server_id, user_id=''):
@@ -72,24 +79,49 @@ def list_tags(server_id, user_id=''):
     initial_text = "Listing all tags:"
     if user_id:
         initial_text = "Listing tags created by {}:".format(usermanager.get_name(server_id, user_id))
-    tags = servermanager.servers_data[server_id]['tags']
-    found_list = []
-    for tag_name, tag_data in tags.items():
-        if not user_id or user_id == tag_data['author_id']:
-            found_list.append(tag_data['full_name'])
+    tags = servermanager.get_records(server_id, 'tags')
+    if user_id:
+        found_list = [tags[tag_name]['full_name'] for tag_name in indexmanager.find_author_tags(server_id, 'tags', user_id)]
+    else:
+        found_list = [tag_data['full_name'] for tag_data in tags.values()]
     return process_found_list(initial_text, found_list)
     
 def search_tags(server_id, search_text):
     """Tries to find a tag that has the search text in it."""
     initial_text = "Searching tags for '{}':".format(search_text)
-    tags = servermanager.servers_data[server_id]['tags']
-    found_list = [tag_name for tag_name in tags if search_text in tag_name]
+    found_list = indexmanager.search_tags(server_id, 'tags', search_text)
     return process_found_list(initial_text, found_list)
 
+def find_tags(server_id, words, user_id):
+    """Finds the tags whose text best matches the given words, best match first."""
+    initial_text = "Tags with text matching '{}':".format(words)
+    tags = servermanager.get_records(server_id, 'tags')
+    is_admin = servermanager.is_admin(server_id, user_id)
+    found_list = [tags[tag_name]['full_name'] for tag_name in indexmanager.find_tags(server_id, words, limit=50)
+            if not tags[tag_name]['private'] or tags[tag_name]['author_id'] == user_id or is_admin][:10]
+    return process_found_list(initial_text, found_list, sort=False)
+
+def list_top_tags(server_id, user_id, trending=False):
+    """Lists the most used tags, either of all time or recently."""
+    if trending:
+        initial_text = "Trending tags:"
+        leaders = ['{} ({:.1f})'.format(tag_name, score) for tag_name, score in statsmanager.get_trending_tags(server_id, 'tags', limit=25)
+                if can_see_tag(server_id, tag_name, user_id)]
+    else:
+        initial_text = "Most used tags:"
+        leaders = ['{} ({})'.format(tag_name, hits) for tag_name, hits in statsmanager.get_top_tags(server_id, 'tags', limit=25)
+                if can_see_tag(server_id, tag_name, user_id)]
+    return process_found_list(initial_text, leaders[:10], sort=False)
+
+def can_see_tag(server_id, tag_name, user_id):
+    tag_data = servermanager.get_record(server_id, 'tags', tag_name)
+    return not tag_data['private'] or tag_data['author_id'] == user_id or servermanager.is_admin(server_id, user_id)
+
 # Helper for listing functions
-def process_found_list(initial_text, found_list):
-    """Helper function for search_tags and list_tags."""
-    found_list.sort()
+def process_found_list(initial_text, found_list, sort=True):
+    """Helper function for search_tags, find_tags, list_top_tags, and list_tags."""
+    if sort:
+        found_list.sort()
     list_string = ''
     #list_string += '{}, '.format(tag_name) for tag_name in found_list
     for tag_name in found_list:
@@ -98,12 +130,11 @@ def process_found_list(initial_text, found_list):
         list_string = "No tags found!  " # Horrible! WOSH U CODE ALREADY
     return "{initial_text}{block}{list_string}{block}".format(initial_text=initial_text, block='\n```\n', list_string=list_string[:-2])
     
-def get_random_tag(server_id, user_id):
-    """Gets a random tag for shiggles."""
-    tags = servermanager.servers_data[server_id]['tags']
-    if len(tags) == 0:
+def get_random_tag(server_id, user_id, weighted=False):
+    """Gets a random tag for shiggles. Weighted picks favor tags with more hits."""
+    tag_name = indexmanager.get_random_tag(server_id, 'tags', weighted=weighted)
+    if tag_name is None:
         return "No tags available!"
-    tag_name = random.choice(list(tags.keys()))
     return "Tag: {tag_name}\n{tag_text}".format(tag_name=tag_name, tag_text=get_tag_text(server_id, tag_name, user_id))
 
 def update_tag(server_id, tag_name, increment_hits=False, **kwargs):
@@ -121,21 +152,24 @@ def update_tag(server_id, tag_name, increment_hits=False, **kwargs):
     to_return = ''
     full_name = tag_name
     tag_name = tag_name.replace(' ', '')
-    servers_data = servermanager.servers_data
     if increment_hits: # Updating hit counter
-        servers_data[server_id]['tags'][tag_name]['hits'] += 1
+        servermanager.get_record(server_id, 'tags', tag_name) # Make sure it exists
+        servermanager.add_hit(server_id, 'tags', tag_name) # Folded into the record on the next flush
+        statsmanager.add_hit(server_id, 'tags', tag_name)
+        indexmanager.update_tag_hits(server_id, 'tags', tag_name)
     else: # Creating or modifying a tag
         try: # Modify a tag
-            tag_data = servers_data[server_id]['tags'][tag_name]
+            tag_data = servermanager.get_record(server_id, 'tags', tag_name)
             try:
                 check_tag_access(server_id, tag_data, tag_name, kwargs['user_id'], need_owner=True)
             except KeyError: # user_id not found, meant to create but tag exists
                 raise bot_exception(EXCEPT_TYPE, "Tag '{}' already exists".format(tag_name))
             del kwargs['user_id'] # Don't write user_id to updated tag
-            servers_data[server_id]['tags'][tag_name].update(kwargs)
+            servermanager.update_record(server_id, 'tags', tag_name, **kwargs)
+            indexmanager.update_tag(server_id, 'tags', tag_name)
             to_return += "Tag '{}' successfully modified!".format(full_name)
         except KeyError: # Tag doesn't exist. Create it.
-            if configmanager.config['tags_per_server'] > 0 and len(servers_data[server_id]['tags']) >= configmanager.config['tags_per_server']:
+            if configmanager.config['tags_per_server'] > 0 and len(servermanager.get_records(server_id, 'tags')) >= configmanager.config['tags_per_server']:
                 raise bot_exception(EXCEPT_TYPE, "This server has hit the tag limit of {}".format(configmanager.config['tags_per_server']))
             if 'tag_text' not in kwargs:
                 raise bot_exception(EXCEPT_TYPE, "Tag '{}' does not exist".format(tag_name))
@@ -148,18 +182,18 @@ def update_tag(server_id, tag_name, increment_hits=False, **kwargs):
                 kwargs['author_id'] = kwargs['user_id']
                 del kwargs['user_id']
             kwargs['full_name'] = full_name
-            servers_data[server_id]['tags'][tag_name] = {**kwargs, 'hits':0, 'date_created':time.strftime("%c")}
+            servermanager.set_record(server_id, 'tags', tag_name, {**kwargs, 'hits':0, 'date_created':time.strftime("%c")})
+            indexmanager.add_tag(server_id, 'tags', tag_name)
             to_return += "Tag '{}' successfully created!".format(full_name)
-    write_data()
     return to_return
 
 def remove_tag(server_id, tag_name, user_id):
     """Removes the given tag in the server."""
     tag_data = get_tag_data(server_id, tag_name)
     check_tag_access(server_id, tag_data, tag_name, user_id, need_owner=True)
-    servers_data = servermanager.servers_data
-    del servers_data[server_id]['tags'][tag_name]
-    write_data()
+    servermanager.remove_record(server_id, 'tags', tag_name)
+    indexmanager.remove_tag(server_id, 'tags', tag_name)
+    statsmanager.remove_tag(server_id, 'tags', tag_name)
     return "Tag '{}' successfully removed!".format(tag_name)
     
 def get_tag_text(server_id, tag_name, user_id):
@@ -179,65 +213,50 @@ def check_tag_access(server_id, tag_data, tag_name, user_id, need_owner=False):
         else:
             raise bot_exception(EXCEPT_TYPE, "The tag '{tag_name}' was made private by the author, {tag_author}".format(tag_name=tag_name, tag_author=tag_author))
 
-async def get_response(command, options, arguments, arguments_blocks, raw_parameters, server_id, channel_id, voice_channel_id, user_id, is_admin, is_private):
-    """Gets a response from the command and parameters."""
-    
-    to_return = ''
-    num_options = len(options)
-    num_arguments = len(arguments)
-    using_shortcut = command in commands_dictionary['shortcut_commands']
-    
-    # Get tag text
-    if (not using_shortcut and num_options == 0 and num_arguments >= 1):
-        try: # For convenience, try with both raw parameters and single argument
-            if num_arguments == 1:
-                return get_tag_text(server_id, arguments[0].lower().replace(' ', ''), user_id)
-        except bot_exception:
-            pass
-        return get_tag_text(server_id, raw_parameters.lower().replace(' ', ''), user_id)
-
-    # Create tag
-    elif (num_arguments >= 2 and ((command in ['tc'] and num_options == 0) or
-            (not using_shortcut and (num_options == 1 or (num_options == 2 and options[1] in ['p', 'private'])) and options[0] in ['c', 'create']))):
-        use_private = num_options == 2 and options[1] in ['p', 'private'] # Private tag
-        tag_text = arguments[1] if num_arguments == 2 else arguments_blocks[1]
-        return update_tag(server_id, tag_name=arguments[0].lower(), tag_text=tag_text, author_id=user_id, private=use_private)
-
-    # Remove tag
-    elif (num_arguments >= 1 and ((command in ['tr'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['r', 'remove']))):
-        tag_name = (arguments[0].lower() if num_arguments == 1 else arguments_blocks[0].lower()).replace(' ', '')
-        return remove_tag(server_id, tag_name, user_id)
-    
-    # List tags
-    elif ((command in ['tl'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['l', 'list'])):
-        user_name = arguments[0] if num_arguments == 1 else (arguments_blocks[0] if num_arguments > 1 else '')
-        return list_tags(server_id, user_id=usermanager.get_user_id(server_id, user_name) if num_arguments >= 1 else '')
-    
-    # Search tags
-    elif (num_arguments >= 1 and ((command in ['ts'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['s', 'search']))):
-        tag_name = (arguments[0].lower() if num_arguments == 1 else arguments_blocks[0].lower()).replace(' ', '')
-        return search_tags(server_id, tag_name)
-        
-    # Tag info
-    elif not using_shortcut and num_options == 1 and num_arguments >= 1 and options[0] in ['i', 'info']:
-        tag_name = (arguments[0].lower() if num_arguments == 1 else arguments_blocks[0].lower()).replace(' ', '')
-        return get_info(server_id, tag_name)
-    
-    # Edit tag
-    elif not using_shortcut and (num_options in range(1,3)) and num_arguments >= 1 and options[0] in ['e', 'edit']:
-        if num_options == 2: # Set private or public
-            tag_name = arguments[0].lower() if num_arguments == 1 else arguments_blocks[0].lower()
-            if options[1] == 'setpublic': # Explicit to follow a strict syntax
-                return update_tag(server_id, tag_name=tag_name, user_id=user_id, private=False)
-            elif options[1] == 'setprivate':
-                return update_tag(server_id, tag_name=tag_name, user_id=user_id, private=True)
-        elif num_options == 1 and num_arguments >= 2: # Modify tag text
-            tag_text = arguments[1] if num_arguments == 2 else arguments_blocks[1]
-            return update_tag(server_id, tag_name=arguments[0].lower(), user_id=user_id, tag_text=tag_text, private=False)
-
-    # Invalid command
-    raise bot_exception(EXCEPT_TYPE, "Invalid syntax", get_formatted_usage_string())
+def get_context_tag_name(context):
+    return context.get_rest(0).lower().replace(' ', '')
+
+async def respond_tag_text(context):
+    try: # For convenience, try with both raw parameters and single argument
+        if len(context.arguments) == 1:
+            return get_tag_text(context.server_id, context.arguments[0].lower().replace(' ', ''), context.user_id)
+    except bot_exception:
+        pass
+    return get_tag_text(context.server_id, context.raw_parameters.lower().replace(' ', ''), context.user_id)
+
+async def respond_create(context):
+    return update_tag(context.server_id, tag_name=context.arguments[0].lower(), tag_text=context.get_rest(1),
+            author_id=context.user_id, private=len(context.options) == 2)
+
+async def respond_remove(context):
+    return remove_tag(context.server_id, get_context_tag_name(context), context.user_id)
+
+async def respond_edit(context):
+    return update_tag(context.server_id, tag_name=context.arguments[0].lower(), user_id=context.user_id,
+            tag_text=context.get_rest(1), private=False)
+
+async def respond_set_private(context):
+    return update_tag(context.server_id, tag_name=context.get_rest(0).lower(), user_id=context.user_id, private=True)
+
+async def respond_set_public(context):
+    return update_tag(context.server_id, tag_name=context.get_rest(0).lower(), user_id=context.user_id, private=False)
+
+async def respond_list(context):
+    if context.arguments:
+        return list_tags(context.server_id, user_id=usermanager.get_user_id(context.server_id, context.get_rest(0)))
+    return list_tags(context.server_id)
+
+async def respond_search(context):
+    return search_tags(context.server_id, get_context_tag_name(context))
+
+async def respond_find(context):
+    return find_tags(context.server_id, context.get_rest(0), context.user_id)
+
+async def respond_top(context):
+    return list_top_tags(context.server_id, context.user_id)
+
+async def respond_trending(context):
+    return list_top_tags(context.server_id, context.user_id, trending=True)
 
+async def respond_info(context):
+    return get_info(context.server_id, get_context_tag_name(context))
@@ -0,0 +1,35 @@
+import os, sys, types, threading
+
+import pytest
+
+# The repository is the jshbot package itself. Register it under that name without running
+# __init__ (which pulls in every module), so each test only imports what it uses.
+package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'jshbot' not in sys.modules:
+    package = types.ModuleType('jshbot')
+    package.__path__ = [package_directory]
+    sys.modules['jshbot'] = package
+
+@pytest.fixture
+def servers(tmp_path, monkeypatch):
+    """Loads empty servers data (single backend) in a temporary directory, with server '5' added."""
+    from jshbot import configmanager, servermanager, indexmanager, statsmanager, blobmanager
+    monkeypatch.setattr(configmanager, 'config', {'owner_id':'1', 'data_backend':'single', 'write_interval':3600})
+    monkeypatch.setattr(servermanager, 'data_directory', str(tmp_path))
+    monkeypatch.setattr(blobmanager, 'data_directory', str(tmp_path))
+    monkeypatch.setattr(blobmanager, 'store', None)
+    for name in ('servers_data', 'pending_hits', 'acls'):
+        monkeypatch.setattr(servermanager, name, {})
+    monkeypatch.setattr(servermanager, 'dirty_records', set())
+    for name in ('name_indexes', 'name_tries', 'alias_indexes', 'tag_indexes', 'author_indexes',
+            'text_indexes', 'suggestion_indexes', 'samplers'):
+        monkeypatch.setattr(indexmanager, name, {})
+    monkeypatch.setattr(statsmanager, 'stats', {})
+    servermanager.load_data()
+    servermanager.update_server('5', name='Test server', force_write=False)
+    yield servermanager
+    written = threading.Event() # Let the writer finish before the directory goes away
+    servermanager.flush_data(on_written=lambda error: written.set())
+    written.wait(10)
+    if blobmanager.store is not None:
+        blobmanager.store.close()
@@ -0,0 +1,40 @@
+import asyncio
+
+from jshbot import blobmanager
+
+def test_compact(tmp_path):
+    store = blobmanager.blob_store(str(tmp_path / 'texts.blob'))
+    live, dead = store.store('live text'), store.store('dead text')
+    store.begin_compaction()
+    during = store.store('stored while compacting')
+    assert store.compact({live[2]}) > 0
+    assert store.get_text(live) == 'live text' # Old references still read fine
+    assert store.get_text(store.get_ref(during[2])) == 'stored while compacting'
+    assert dead[2] not in store.refs
+    store.close()
+    store = blobmanager.blob_store(str(tmp_path / 'texts.blob')) # Survives reopening
+    assert sorted(store.refs) == sorted([live[2], during[2]])
+    store.close()
+
+def test_missing_text(tmp_path, capsys):
+    store = blobmanager.blob_store(str(tmp_path / 'texts.blob'))
+    ref = store.get_ref('0' * 32)
+    assert store.get_text(ref) == ''
+    assert 'ERROR' in capsys.readouterr().out
+    assert 'Missing tag texts: 1' in store.get_info()
+    store.close()
+
+def test_compact_tag_texts(servers):
+    for tag_name in ('a', 'b'):
+        servers.set_record('5', 'tags', tag_name, {'tag_text':'text of ' + tag_name, 'author_id':'2',
+                'private':False, 'full_name':tag_name, 'hits':0, 'date_created':''})
+    servers.remove_record('5', 'tags', 'b')
+    loop = asyncio.new_event_loop()
+    try:
+        reclaimed = loop.run_until_complete(servers.compact_tag_texts())
+    finally:
+        loop.close()
+    assert reclaimed > 0
+    tag_data = servers.get_record('5', 'tags', 'a')
+    assert tag_data._text is blobmanager.get_store().refs[tag_data.text_hash] # Rebound
+    assert tag_data['tag_text'] == 'text of a'
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from jshbot import indexmanager
+
+def test_name_index_same_name_twice():
+    index = indexmanager.name_index()
+    index.add('2', ('bob', 'bob'))
+    index.add('2', ('bob', 'x'))
+    assert index.find('bob') == {'2'}
+    index.remove('2')
+    assert index.find('bob') == set() and index.find('x') == set()
+
+def test_nickname_same_as_name(servers):
+    servers.update_user('5', '2', name='bob', force_write=False)
+    servers.update_user('5', '2', nickname='bob', force_write=False)
+    assert indexmanager.find_user_ids('5', 'bob') == {'2'}
+    servers.update_user('5', '2', nickname='x', force_write=False)
+    assert indexmanager.find_user_ids('5', 'bob') == {'2'}
+    assert indexmanager.find_user_ids('5', 'x') == {'2'}
+
+def check_frequencies(sampler, weights, picks=20000):
+    """Checks that weighted picks land on each name about as often as its weight says."""
+    counts = dict.fromkeys(weights, 0)
+    for _ in range(picks):
+        counts[sampler.weighted_choice()] += 1
+    total = sum(weights.values())
+    for name, weight in weights.items():
+        expected = picks * weight / total
+        assert abs(counts[name] - expected) <= 5 * expected ** 0.5 + 1, (name, counts[name], expected)
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 9, 13, 17, 29, 33, 39, 64, 100])
+def test_sampler_weighted_choice(size):
+    random.seed(size)
+    weights = {'t{}'.format(index): random.randint(0, 5) + (index % 3 == 0) * 10 for index in range(size)}
+    weights['t0'] += 1 # At least one weight
+    sampler = indexmanager.tag_sampler()
+    sampler.add_all(weights.items())
+    assert sampler.get_total() == sum(weights.values())
+    check_frequencies(sampler, weights)
+
+def test_sampler_changes():
+    random.seed(1)
+    sampler = indexmanager.tag_sampler()
+    weights = {}
+    for index in range(37): # Grows the tree a few times
+        weights['t{}'.format(index)] = index % 4 + 1
+        sampler.add('t{}'.format(index), index % 4 + 1)
+    for index in range(0, 37, 5):
+        sampler.remove('t{}'.format(index))
+        del weights['t{}'.format(index)]
+    sampler.set_weight('t1', 30)
+    weights['t1'] = 30
+    assert sampler.get_total() == sum(weights.values())
+    assert sorted(sampler.names) == sorted(weights)
+    check_frequencies(sampler, weights)
+
+def is_one_edit(first, second):
+    """Whether or not the strings are exactly one insertion, deletion, substitution, or swap apart."""
+    if first == second or abs(len(first) - len(second)) > 1:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    start = 0
+    while start < len(first) and first[start] == second[start]:
+        start += 1
+    if len(first) < len(second):
+        return first[start:] == second[start + 1:]
+    return first[start + 1:] == second[start + 1:] or (
+            first[start + 2:] == second[start + 2:] and first[start:start + 2] == second[start:start + 2][::-1])
+
+def test_find_similar():
+    random.seed(2)
+    for _ in range(200):
+        names = {''.join(random.choice('abcd') for _ in range(random.randint(1, 5))) for _ in range(random.randint(1, 40))}
+        trie = indexmanager.name_trie()
+        trie.add_all((str(index), (name,)) for index, name in enumerate(names))
+        text = ''.join(random.choice('abcdz') for _ in range(random.randint(0, 5)))
+        whole = sorted(name for name in names if is_one_edit(name, text))
+        similar = trie.find_similar(text)
+        assert similar[:len(whole)] == whole, (names, text)
+        assert set(similar) == {name for name in names if any(
+                is_one_edit(name[:end], text) or name[:end] == text for end in range(len(name) + 1))}, (names, text)
+
+def test_find_similar_scale(monkeypatch):
+    """Lookups without a match only walk a few levels down, however many names there are."""
+    random.seed(1)
+    characters = 'abcdefghijklmnopqrstuvwxyz0123456789_'
+    trie = indexmanager.name_trie()
+    trie.add_all((str(index), (''.join(random.choice(characters) for _ in range(random.randint(4, 14))),))
+            for index in range(100000))
+    searches = []
+    bisect_left = indexmanager.bisect.bisect_left
+    def counted_bisect_left(*arguments):
+        searches.append(None)
+        return bisect_left(*arguments)
+    monkeypatch.setattr(indexmanager.bisect, 'bisect_left', counted_bisect_left)
+    for _ in range(100):
+        searches.clear()
+        trie.find_similar(''.join(random.choice(characters) for _ in range(random.randint(5, 12))), 5)
+        assert len(searches) < 4 * len(characters) * 4 # A few levels of children, not every edit
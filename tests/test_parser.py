@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from jshbot import parser
+from jshbot.jbce import bot_exception
+
+class old_quirk(Exception):
+    """Input where the old loop misbehaved (see split_arguments_before)."""
+
+def split_arguments_before(text):
+    """The argument loop parse used before tokenize, for comparison.
+
+    Raises old_quirk where it was broken: an empty quoted argument followed by text dropped the next
+    character, and one in a message ending in a backslash never finished.
+    """
+    arguments = []
+    arguments_blocks = []
+    original_length = len(text)
+    while text:
+        if len(arguments_blocks) < 4:
+            arguments_blocks.append(text)
+        if text.startswith('"'): # Search for end quote
+            try:
+                text = text[1:]
+                closed_quote_index = 0
+                next_quote_index = text[closed_quote_index:].index('"')
+                while text[closed_quote_index + next_quote_index - 1] == '\\': # Run until proper closed quote found
+                    closed_quote_index += next_quote_index
+                    text = text[:closed_quote_index - 1] + text[closed_quote_index:]
+                    if len(text) > original_length:
+                        raise old_quirk("Never finishes")
+                    next_quote_index = text[closed_quote_index:].index('"')
+            except ValueError:
+                raise bot_exception(parser.EXCEPT_TYPE, "An argument has an unclosed quote")
+            closed_quote_index += next_quote_index
+            if closed_quote_index > 0: # No null argument
+                to_append = text[:closed_quote_index].strip()
+                if to_append: # No empty string
+                    arguments.append(to_append)
+                text = text[closed_quote_index + 1:].strip()
+            else: # If there is a null argument, remove it
+                if len(text) > 1 and not text[1].isspace():
+                    raise old_quirk("Drops a character")
+                text = text[2:].strip()
+        else: # Search for next space
+            argument_partition, _, text = text.partition(' ')
+            arguments.append(argument_partition)
+            text = text.strip()
+    return arguments, arguments_blocks
+
+def split_arguments(text):
+    spans, block_starts = parser.tokenize(text)
+    return [parser.get_argument(text, span) for span in spans], list(parser.lazy_blocks(text, block_starts))
+
+def test_tokenize_examples():
+    assert split_arguments('a  "b c" d') == (['a', 'b c', 'd'], ['a  "b c" d', '"b c" d', 'd'])
+    assert split_arguments('"say \\"hi\\"" x\\"y') == (['say "hi"', 'x\\"y'], ['"say \\"hi\\"" x\\"y', 'x\\"y'])
+    assert split_arguments('"" "  " a b c d e')[1] == ['"" "  " a b c d e', '"  " a b c d e', 'a b c d e', 'b c d e']
+    with pytest.raises(bot_exception):
+        split_arguments('a "b')
+
+def test_tokenize_fuzz():
+    """Random messages split the same way as before, apart from the old quirks."""
+    random.seed(24)
+    alphabet = ['a', 'b', 'c', ' ', ' ', '"', '"', '\\', '\t', '\n', 'é']
+    compared = 0
+    for _ in range(50000):
+        text = ''.join(random.choice(alphabet) for _ in range(random.randint(0, 14))).strip()
+        try:
+            expected = split_arguments_before(text)
+        except old_quirk:
+            continue
+        except bot_exception:
+            with pytest.raises(bot_exception):
+                split_arguments(text)
+        else:
+            assert split_arguments(text) == expected, text
+        compared += 1
+    assert compared > 45000
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from jshbot import configmanager
+from jshbot.jbce import bot_exception
+
+def add_tag(servers, tag_name):
+    servers.set_record('5', 'tags', tag_name, {'tag_text':'text', 'author_id':'2', 'private':False,
+            'full_name':tag_name, 'hits':0, 'date_created':''})
+
+def test_fold_hits_immediate_writes(servers, monkeypatch):
+    for index in range(600):
+        add_tag(servers, 't{}'.format(index))
+    servers.flush_data()
+    monkeypatch.setitem(configmanager.config, 'write_interval', 0)
+    for index in range(600):
+        servers.add_hit('5', 'tags', 't{}'.format(index))
+    flush_count = servers.flush_count
+    servers.update_server('5', name='Renamed')
+    assert servers.flush_count == flush_count + 1 # Folding doesn't flush on its own
+    assert not servers.pending_hits and not servers.dirty_records
+    assert all(servers.get_hits('5', 'tags', 't{}'.format(index)) == 1 for index in range(600))
+
+def test_wait_for_write_failure(servers):
+    def fail(*args):
+        raise OSError("Disk full")
+    servers.backend.write = fail
+    servers.update_server('5', name='Renamed', force_write=False)
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(bot_exception):
+            loop.run_until_complete(servers.wait_for_write())
+        with pytest.raises(bot_exception): # Still not written
+            loop.run_until_complete(servers.wait_for_write())
+        del servers.backend.write
+        loop.run_until_complete(servers.wait_for_write()) # Retried
+    finally:
+        loop.close()
+    assert servers.backend.load_all()['5']['name'] == 'Renamed'
+
+def test_lazy_users_prunes_default_members(servers):
+    configmanager.config['lazy_users'] = True
+    users = {'2':{'joined':0, **servers.MEMBER_DEFAULTS}, '3':{'joined':0, **servers.MEMBER_DEFAULTS, 'nickname':'bob'}}
+    servers.load_server('6', {'name':'Lazy server', 'channels':{}, 'users':users, 'tags':{}, 'sound_tags':{}})
+    assert not servers.has_user('6', '2')
+    assert servers.has_user('6', '3')
+    assert ('6', 'users', '2') in servers.dirty_records # So the removal gets written out
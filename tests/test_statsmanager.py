@@ -0,0 +1,95 @@
+import pytest
+
+from jshbot import configmanager, statsmanager
+
+HOUR = 3600
+
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setattr(configmanager, 'config', {'trending_half_life':1, 'history_hours':3})
+
+def test_top_counter_order():
+    top = statsmanager.top_counter(size=3)
+    for name, score in [('a', 1), ('b', 5), ('c', 3), ('d', 2), ('a', 4), ('e', 1)]:
+        top.offer(name, score)
+    assert top.get_top(10) == [('b', 5), ('a', 4), ('c', 3)] # d and e never beat the lowest leader
+    top.offer('d', 6)
+    assert top.get_top(10) == [('d', 6), ('b', 5), ('a', 4)]
+    assert top.get_top(2) == [('d', 6), ('b', 5)]
+
+def test_top_counter_ties_and_stale_entries():
+    top = statsmanager.top_counter(size=2)
+    for score in range(1, 50): # Lots of stale heap entries for the same leaders
+        top.offer('a', score)
+        top.offer('b', score)
+    top.offer('c', 49)
+    assert top.get_top(10) == [('a', 49), ('b', 49)]
+    assert top.get_lowest() == (49, 'a')
+
+def test_top_counter_remove():
+    top = statsmanager.top_counter(size=2)
+    scores = {'a':3, 'b':2, 'c':1}
+    top.rebuild(scores)
+    assert top.get_top(10) == [('a', 3), ('b', 2)]
+    assert not top.remove('c')
+    assert top.remove('a')
+    del scores['a']
+    top.rebuild(scores)
+    assert top.get_top(10) == [('b', 2), ('c', 1)]
+
+def test_trending_decay(config):
+    stats = statsmanager.tag_stats()
+    stats.landmark = 0
+    stats.add_hit('old', 1, 0)
+    assert stats.get_trending(10, 0) == [('old', pytest.approx(1))]
+    assert stats.get_trending(10, HOUR) == [('old', pytest.approx(0.5))] # One half life later
+    stats.add_hit('new', 1, 2 * HOUR)
+    assert stats.get_trending(10, 2 * HOUR) == [('new', pytest.approx(1)), ('old', pytest.approx(0.25))]
+
+def test_trending_rescale(config):
+    stats = statsmanager.tag_stats()
+    stats.landmark = 0
+    stats.add_hit('old', 1, 0)
+    stats.add_hit('new', 1, 0.5 * HOUR)
+    before = stats.get_trending(10, 3 * HOUR)
+    stats.add_hit('other', 1, 3 * HOUR) # More than a half life since the landmark
+    assert stats.landmark == 3 * HOUR
+    after = dict(stats.get_trending(10, 3 * HOUR))
+    for tag_name, score in before: # Rescaling doesn't change the decayed scores
+        assert after[tag_name] == pytest.approx(score)
+    assert after['other'] == pytest.approx(1)
+    stats.add_hit('other', 2, 13 * HOUR)
+    assert [tag_name for tag_name, _ in stats.get_trending(10, 13 * HOUR)] == ['other'] # The rest faded away
+
+def test_trending_remove(config):
+    stats = statsmanager.tag_stats()
+    stats.trending_top = statsmanager.top_counter(size=1)
+    stats.add_hit('a', 1, stats.landmark)
+    stats.add_hit('a', 2, stats.landmark)
+    stats.add_hit('b', 1, stats.landmark)
+    assert [tag_name for tag_name, _ in stats.get_trending(10, stats.landmark)] == ['a']
+    stats.remove('a')
+    assert [tag_name for tag_name, _ in stats.get_trending(10, stats.landmark)] == ['b'] # Refilled
+
+def test_history_window():
+    history = statsmanager.hit_history(3)
+    history.add(10)
+    history.add(10)
+    history.add(11)
+    assert history.get_total(11) == 3
+    assert history.get_total(12) == 3
+    assert history.get_total(13) == 1 # Hour 10 is out of the window
+    assert history.get_total(20) == 0
+    history.add(20)
+    assert history.get_total(20) == 1
+
+def test_recent_hits_expire(config):
+    stats = statsmanager.tag_stats()
+    stats.landmark = 0
+    stats.add_hit('a', 1, 0)
+    stats.add_hit('a', 2, HOUR)
+    assert stats.get_recent_hits('a', 2 * HOUR) == 2
+    assert stats.get_recent_hits('a', 3 * HOUR) == 1
+    assert stats.get_recent_hits('a', 4 * HOUR) == 0
+    stats.add_hit('b', 1, 5 * HOUR) # Rescales, which drops the empty history
+    assert 'a' not in stats.histories
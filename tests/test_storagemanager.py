@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from jshbot import storagemanager
+from jshbot.jbce import bot_exception
+
+def make_server(name, tag_name=None):
+    server_data = {'name':name, 'channels':{}, 'users':{}, 'tags':{}, 'sound_tags':{}}
+    if tag_name:
+        server_data['tags'][tag_name] = {'text_hash':'0' * 32, 'author_id':'2', 'private':False,
+                'full_name':tag_name, 'hits':3, 'date_created':''}
+    return server_data
+
+def get_backend(name, directory, codec_name):
+    return storagemanager.get_backend(name, str(directory), storagemanager.data_codec(codec_name))
+
+@pytest.mark.parametrize('backend_name', ['single', 'sharded'])
+def test_switch_codec(tmp_path, backend_name):
+    servers_data = {'5':make_server('first', 'a'), '6':make_server('second')}
+    get_backend(backend_name, tmp_path, 'json-pretty').write_all(servers_data)
+    for codec_name in ('marshal+zlib', 'json', 'marshal'): # Back and forth
+        backend = get_backend(backend_name, tmp_path, codec_name)
+        assert backend.load_all() == servers_data, codec_name
+        servers_data['7'] = make_server(codec_name) # Written with the new codec
+        backend.write_all(servers_data)
+    assert get_backend(backend_name, tmp_path, 'marshal').load_all() == servers_data
+
+def test_switch_codec_journal(tmp_path):
+    backend = get_backend('journal', tmp_path, 'json-pretty')
+    backend.load_all()
+    backend.compact({'5':make_server('in the snapshot', 'a')})
+    backend.write({'6':make_server('in the journal')}, {('6', None, None)}, complete=False)
+    backend.close()
+    expected = {'5':make_server('in the snapshot', 'a'), '6':make_server('in the journal')}
+    backend = get_backend('journal', tmp_path, 'marshal+zlib')
+    assert backend.load_all() == expected
+    backend.compact(expected)
+    backend.close()
+    assert os.path.isfile(str(tmp_path / 'servers.snapshot.json.migrated'))
+    assert get_backend('journal', tmp_path, 'marshal+zlib').load_all() == expected
+
+def test_journal_without_snapshot(tmp_path):
+    backend = get_backend('journal', tmp_path, 'json')
+    backend.load_all()
+    backend.write({'6':make_server('in the journal')}, {('6', None, None)}, complete=False)
+    backend.close()
+    os.remove(str(tmp_path / 'servers.snapshot.json'))
+    with pytest.raises(bot_exception):
+        get_backend('journal', tmp_path, 'json').load_all()
+
+def test_sqlite_load_during_write(tmp_path):
+    backend = storagemanager.sqlite_backend(str(tmp_path))
+    servers_data = {'5':make_server('first', 'a')}
+    backend.write_all(servers_data)
+    with backend.lock, backend.connection: # The writer thread in the middle of a batch
+        backend.write_server('5', make_server('uncommitted'))
+        assert backend.load_server('5') == servers_data['5'] # Doesn't wait, and sees the last commit
+    assert backend.load_server('5')['name'] == 'uncommitted'
+    backend.close()
+
+def make_global_users(count):
+    global_data = {'channels':{}, 'users':{}, 'tags':{}, 'sound_tags':{}}
+    for number in range(count):
+        global_data['users'][str(number)] = {'name':'user{}'.format(number), 'avatar':'', 'discriminator':'0001',
+                'last_game':None, 'last_seen':0, 'aliases':[]}
+    return global_data
+
+@pytest.mark.parametrize('backend_name', ['single', 'sharded'])
+def test_global_user_update(tmp_path, monkeypatch, backend_name):
+    servers_data = {storagemanager.GLOBAL_ID:make_global_users(5000), '5':make_server('first', 'a')}
+    backend = get_backend(backend_name, tmp_path, 'json')
+    backend.load_all()
+    backend.write_all(servers_data)
+    table_size = len(backend.codec.encode(servers_data[storagemanager.GLOBAL_ID]))
+    written = []
+    write_atomically = storagemanager.write_atomically
+    def measured_write(path, encoded):
+        encoded = b''.join([encoded] if isinstance(encoded, bytes) else encoded)
+        written.append(len(encoded))
+        write_atomically(path, encoded)
+    monkeypatch.setattr(storagemanager, 'write_atomically', measured_write)
+
+    servers_data[storagemanager.GLOBAL_ID]['users']['42']['name'] = 'renamed'
+    changes = {(storagemanager.GLOBAL_ID, 'users', '42')}
+    snapshot = storagemanager.take_snapshot(servers_data, changes, backend.get_snapshot_scope(changes), backend.record_servers)
+    assert list(snapshot[storagemanager.GLOBAL_ID]['users']) == ['42']
+    backend.write(snapshot, changes)
+    assert sum(written) < table_size / 50 # Just the one bucket (and the small server files)
+    assert get_backend(backend_name, tmp_path, 'json').load_all() == servers_data
+
+def test_global_users_move_into_buckets(tmp_path):
+    servers_data = {storagemanager.GLOBAL_ID:make_global_users(100), '5':make_server('first')}
+    storagemanager.write_atomically(str(tmp_path / 'servers.json'), storagemanager.data_codec('json').encode(servers_data))
+    assert get_backend('single', tmp_path, 'json').load_all() == servers_data
+    assert os.path.isdir(str(tmp_path / 'global_users'))
+    assert get_backend('sharded', tmp_path, 'json').load_all() == servers_data # Migrated from servers.json
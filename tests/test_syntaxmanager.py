@@ -0,0 +1,74 @@
+import itertools
+
+import pytest
+
+from jshbot import syntaxmanager, decider
+from jshbot.jbce import bot_exception
+
+def get_old_decider_branch(command, options, num_arguments):
+    """Which branch the condition chain of decider.get_response took before command_syntaxes, or None."""
+    num_options = len(options)
+    using_shortcut = command in ['flip', 'roll', 'pick']
+    if ((command == 'flip' and num_options == 0 and num_arguments == 0) or
+            (not using_shortcut and num_options == 1 and num_arguments == 0 and options[0] in ['f', 'flip'])):
+        return 'respond_flip'
+    elif ((command == 'roll' and num_arguments <= 1) or
+            (not using_shortcut and num_options == 1 and num_arguments <= 1 and options[0] in ['r', 'roll', 'd', 'dice'])):
+        return 'respond_roll'
+    elif ((command == 'pick' and num_options == 0) or
+            (not using_shortcut and num_options == 1 and options[0] in ['p', 'pick', 'c', 'choose', 'd', 'decide', 'f', 'fluky'])):
+        return 'respond_pick'
+    elif (not using_shortcut and num_arguments == 0 and options and options[0] in ['t', 'tag'] and
+            (num_options == 1 or (num_options == 2 and options[1] in ['pop', 'popular']))):
+        return 'respond_tag'
+    elif (not using_shortcut and num_arguments == 0 and options and options[0] in ['st', 'soundtag'] and
+            (num_options == 1 or (num_options == 2 and options[1] in ['pop', 'popular']))):
+        return 'respond_sound_tag'
+    elif not using_shortcut and num_options == 0 and num_arguments in (0, 2):
+        return 'respond_number'
+    return None
+
+@pytest.fixture
+def table():
+    table = syntaxmanager.syntax_table()
+    table.compile([decider])
+    return table
+
+def test_decider_dispatch(table):
+    option_names = ['f', 'flip', 'r', 'roll', 'd', 'dice', 'p', 'pick', 'c', 'choose', 'decide', 'fluky',
+            't', 'tag', 'st', 'soundtag', 'pop', 'popular', 'x']
+    option_lists = [[]] + [[option] for option in option_names] + [list(pair) for pair in itertools.product(option_names, repeat=2)]
+    commands = ['random', 'rand', 'r', 'flip', 'roll', 'pick']
+    for command, options, num_arguments in itertools.product(commands, option_lists, [0, 1, 2, 3, 7, 50]):
+        expected = get_old_decider_branch(command, options, num_arguments)
+        if command == 'roll' and options: # Used to ignore the options, now invalid syntax
+            expected = None
+        try:
+            function, shortcut = table.find(command, options, num_arguments)
+        except bot_exception as e:
+            assert expected is None, (command, options, num_arguments)
+            assert 'Invalid syntax' in str(e)
+        else:
+            assert function.__name__ == expected, (command, options, num_arguments)
+            assert shortcut == (command in ['flip', 'roll', 'pick'])
+
+def test_options_with_values():
+    declarations = [{'command':'query', 'syntaxes':[
+        {'optional':[['results=<number>']], 'arguments':(1, None), 'usage':'<query>', 'function':'respond'}]}]
+    module = type('module', (), {'command_syntaxes':declarations, 'EXCEPT_TYPE':'Test', 'respond':staticmethod(len)})
+    table = syntaxmanager.syntax_table()
+    table.compile([module])
+    assert table.find('query', ['results=3'], 2) == (len, False)
+    assert table.find('query', [], 1) == (len, False)
+    with pytest.raises(bot_exception):
+        table.find('query', ['results'], 1)
+    with pytest.raises(bot_exception):
+        table.find('query', [], 0)
+
+def test_generated_strings():
+    assert syntaxmanager.get_usage_string(decider.command_syntaxes[0]).splitlines()[:3] == [
+        'Usage:',
+        '    !random [(<"minimum number"> <"maximum number">)]',
+        '            [-tag|t (-popular|pop)]']
+    assert decider.commands_dictionary['module_commands'] == ['random', 'rand', 'r']
+    assert decider.commands_dictionary['private_shortcut_commands'] == ['flip', 'roll', 'pick']
@@ -0,0 +1,29 @@
+import pytest
+
+from jshbot import configmanager, usermanager
+from jshbot.jbce import bot_exception
+
+def test_exact_user_id_skips_partial_names(servers):
+    servers.update_user('5', '2', name='bob', force_write=False)
+    assert usermanager.get_user_id('5', 'bo') == '2'
+    assert usermanager.get_user_id('5', 'bob', exact=True) == '2'
+    assert usermanager.get_user_id('5', '<@2>', exact=True) == '2'
+    with pytest.raises(bot_exception):
+        usermanager.get_user_id('5', 'bo', exact=True)
+
+def test_lazy_members_by_name(servers, monkeypatch):
+    from types import SimpleNamespace
+    from jshbot import botmanager
+    members = [SimpleNamespace(id=str(number), name='member{}'.format(number)) for number in range(10, 20)]
+    server = SimpleNamespace(id='5', members=members)
+    monkeypatch.setattr(botmanager.client, 'servers', [server])
+    monkeypatch.setattr(botmanager, 'member_indexes', {})
+    configmanager.config['lazy_users'] = True
+    assert usermanager.get_user_id('5', 'member12') == '12'
+    renamed = SimpleNamespace(id='12', name='renamed')
+    members[2] = renamed
+    botmanager.update_member_index(server, renamed)
+    assert botmanager.find_member_ids('5', 'member12') == []
+    assert usermanager.get_user_id('5', 'renamed') == '12'
+    botmanager.update_member_index(server, renamed, removed=True)
+    assert botmanager.find_member_ids('5', 'renamed') == []
@@ -1,26 +1,31 @@
 import json, os.path, inspect, asyncio
 
-from jshbot import configmanager, servermanager, botmanager
-from jshbot.servermanager import write_data
+from jshbot import configmanager, servermanager, botmanager, records, indexmanager, syntaxmanager
 from jshbot.jbce import bot_exception
 
-commands_dictionary = {'module_commands':['user', 'u'],
-                       'shortcut_commands':['userinfo', 'info', 'status', 'setstatus', 'nickname', 'nick', 'setnickname', 'setnick'],
-                       'private_module_commands':[],
-                       'private_shortcut_commands':[]}
+# See syntaxmanager
+command_syntaxes = [{'command':'user', 'aliases':['u'], 'syntaxes':[
+    {'optional':[['info', 'i']], 'arguments':(0, None), 'usage':'(user name)', 'shortcuts':['userinfo', 'info'],
+        'function':'respond_info'},
+    {'options':[['status', 's']], 'arguments':(0, None), 'usage':'(user name)', 'shortcuts':['status'],
+        'function':'respond_status'},
+    {'options':[['setstatus', 'ss']], 'arguments':(0, None), 'usage':'(status text)', 'shortcuts':['setstatus'],
+        'function':'respond_set_status'},
+    {'options':[['nickname', 'nick', 'n']], 'arguments':(0, None), 'usage':'(user name)', 'shortcuts':['nickname', 'nick'],
+        'function':'respond_nickname'},
+    {'options':[['setnickname', 'setnick', 'sn']], 'arguments':(0, None), 'usage':'(nickname)',
+        'shortcuts':['setnickname', 'setnick'], 'function':'respond_set_nickname'},
+    {'options':[['setcolor', 'sc']], 'arguments':(0, 1), 'usage':'(hex color)', 'function':'respond_set_color'},
+    {'options':[['updatecolor', 'uc']], 'function':'respond_update_color'},
+    {'options':[['formerly', 'f']], 'arguments':(1, None), 'usage':'<former name>', 'function':'respond_former_users'}]}]
+
+commands_dictionary = syntaxmanager.get_commands_dictionary(command_syntaxes)
 commands = []
 for command_list in list(commands_dictionary.values()):
     for command in command_list:
         commands.append(command)
 
-usage_string = """Usage:
-    !user [(-info|i) (user name)]
-          [-status|s (user name)] [-setstatus|ss (status text)]
-          [-nickname|nick|n (user name)] [-setnickname|setnick|sn (nickname)]
-          [-setcolor|sc (hex color)] [-updatecolor|uc]"""
-
-def get_formatted_usage_string():
-    return "\n```\n{}\n```".format(usage_string)
+usage_string = syntaxmanager.get_usage_string(command_syntaxes[0])
 
 help_string = """```
 Description:
@@ -45,36 +50,65 @@ Shortcuts:
 
 EXCEPT_TYPE = "User manager"
 
-def get_user_id(server_id, name):
-    """Gets the user ID from a readable name or nickname."""
-    users_data = servermanager.servers_data[server_id]['users']
+def get_unrecorded_member(server_id, user_id):
+    """Returns the member from the client cache, or None.
+
+    Only looked up with lazy_users set, since otherwise every member already has a record.
+    """
+    if not servermanager.get_lazy_users():
+        return None
+    return botmanager.get_member(server_id, user_id)
+
+def user_exists(server_id, user_id):
+    """Returns whether or not the user has a record, or is in the client cache (see lazy_users)."""
+    return servermanager.has_user(server_id, user_id) or get_unrecorded_member(server_id, user_id) is not None
+
+def get_user(server_id, user_id):
+    """Returns the user data. Users without a record are resolved from the client cache."""
+    try:
+        return servermanager.get_user(server_id, user_id)
+    except KeyError:
+        member = get_unrecorded_member(server_id, user_id)
+        if member is None:
+            raise
+        return servermanager.preview_user(**botmanager.get_user_fields(member))
+
+def get_user_id(server_id, name, exact=False):
+    """Gets the user ID from a readable name or nickname.
+
+    If nothing matches exactly, a single user whose name, nickname, or alias starts with the given
+    name (ignoring case) is used. Otherwise, the error suggests similar names.
+
+    Keyword arguments:
+    exact -- only take exact names, mentions, or IDs (for anything that changes permissions)
+    """
+    users_data = servermanager.get_records(server_id, 'users')
     name = name.strip()
     if name.startswith('<@') and name.endswith('>'): # Mention
-        try: # Check if user exists
-            users_data[name[2:-1]]
+        if user_exists(server_id, name[2:-1]):
             return name[2:-1]
-        except KeyError:
-            pass
-    discovered_already = False
-    found_id = ''
-    for user_id in users_data: # Iterate to find name or nickname
-        if users_data[user_id]['name'] == name or users_data[user_id]['nickname'] == name:
-            if not discovered_already:
-                found_id = user_id
-                discovered_already = True
-            else:
-                raise bot_exception(EXCEPT_TYPE, "Duplicate names found for '{}'! Specify user with a mention".format(name))
-    if found_id:
-        return found_id
-    try: # Raw user ID - last resort
-        users_data[name]
+    found_ids = list(indexmanager.find_user_ids(server_id, name))
+    if servermanager.get_lazy_users(): # Members without a record
+        found_ids.extend(user_id for user_id in botmanager.find_member_ids(server_id, name) if user_id not in users_data)
+    if len(found_ids) > 1:
+        raise bot_exception(EXCEPT_TYPE, "Duplicate names found for '{}'! Specify user with a mention".format(name))
+    elif found_ids:
+        return found_ids[0]
+    elif user_exists(server_id, name): # Raw user ID
         return name
-    except KeyError:
+    candidates = indexmanager.search_users(server_id, name)
+    prefix_matches = [user_id for user_id, matched in candidates if matched.startswith(name.lower())]
+    if len(prefix_matches) == 1 and not exact: # Partial name - last resort
+        return prefix_matches[0]
+    elif candidates:
+        raise bot_exception(EXCEPT_TYPE, "User '{}' was not found. Did you mean: {}?".format(
+                name, ', '.join(get_name(server_id, user_id) for user_id, _ in candidates)))
+    else:
         raise bot_exception(EXCEPT_TYPE, "User '{}' was not found".format(name))
         
 def get_info(server_id, user_id):
     """Builds a string listing known user information of given user."""
-    user_data = servermanager.servers_data[server_id]['users'][user_id]
+    user_data = get_user(server_id, user_id)
     config = configmanager.config
     permissions_text = ''
     if servermanager.is_owner(user_id): # Order important here
@@ -95,25 +129,38 @@ Nickname: {user_data[nickname]}
 Discriminator: {user_data[discriminator]}
 Aliases: {user_data[aliases]}
 Permissions: {permissions_text}
-Joined: {user_data[joined]}
-Last seen: {user_data[last_seen]}
+Joined: {joined}
+Last seen: {last_seen}
 Last played game: {user_data[last_game]}
 Color: {user_data[color]}
 Status: {user_data[status]}
+Tags: {total_tags}
+Sound tags: {total_sound_tags}
 Avatar: {user_data[avatar]}
-```""".format(user_id=user_id, user_data=user_data, permissions_text=permissions_text)
+```""".format(user_id=user_id, user_data=user_data, permissions_text=permissions_text,
+        joined=records.format_time(user_data['joined']), last_seen=records.format_time(user_data['last_seen']),
+        total_tags=indexmanager.count_author_tags(server_id, 'tags', user_id),
+        total_sound_tags=indexmanager.count_author_tags(server_id, 'sound_tags', user_id))
     return to_return # Placeholder if this will be modified later
     
 def get_name(server_id, user_id):
     """Returns the user name of the given user ID."""
     try:
-        return servermanager.servers_data[server_id]['users'][user_id]['name']
+        return get_user(server_id, user_id)['name']
     except KeyError:
         return "Non-existent"
     
+def get_former_users(server_id, alias):
+    """Builds a string listing the users that have gone by the given name."""
+    user_ids = indexmanager.find_alias_ids(server_id, alias.strip())
+    if not user_ids:
+        raise bot_exception(EXCEPT_TYPE, "Nobody has gone by '{}'".format(alias.strip()))
+    names = sorted("{} ({})".format(get_name(server_id, user_id), user_id) for user_id in user_ids)
+    return "Users that have gone by '{}':\n{}".format(alias.strip(), '\n'.join(names))
+
 def get_status(server_id, user_id):
     """Builds a string showing the status of the given user."""
-    user_data = servermanager.servers_data[server_id]['users'][user_id]
+    user_data = get_user(server_id, user_id)
     name = user_data['name']
     status = user_data['status'] if user_data['status'] else "None"
     return "{name}'s status: {status}".format(name=name, status=status)
@@ -122,14 +169,12 @@ def set_status(server_id, user_id, status_text):
     """Sets the user status as the given text."""
     if len(status_text) > 1000:
         raise bot_exception(EXCEPT_TYPE, "Status cannot be more than 1000 characters long")
-    servers_data = servermanager.servers_data
-    servers_data[server_id]['users'][user_id]['status'] = status_text
-    write_data()
+    servermanager.update_record(server_id, 'users', user_id, status=status_text)
     return "Status successfully {}!".format("set" if status_text else "cleared")
 
 def get_nickname(server_id, user_id):
     """Builds a string showing the nickname of the given user."""
-    user_data = servermanager.servers_data[server_id]['users'][user_id]
+    user_data = get_user(server_id, user_id)
     name = user_data['name']
     nickname = user_data['nickname'] if user_data['nickname'] else "None"
     return "{name}'s nickname: {nickname}".format(name=name, nickname=nickname)
@@ -138,14 +183,13 @@ def set_nickname(server_id, user_id, nickname_text):
     """Sets the user nickname as the given text."""
     if len(nickname_text) > 50:
         raise bot_exception(EXCEPT_TYPE, "Nickname cannot be more than 50 characters long")
-    servers_data = servermanager.servers_data
-    servers_data[server_id]['users'][user_id]['nickname'] = nickname_text
-    write_data()
+    servermanager.update_record(server_id, 'users', user_id, nickname=nickname_text)
+    indexmanager.update_user(server_id, user_id)
     return "Nickname successfully {}!".format("set" if nickname_text else "cleared")
 
 def get_color(server_id, user_id):
     """Returns the given user's color in hex format, starting with '#'."""
-    user_data = servermanager.servers_data[server_id]['users'][user_id]
+    user_data = get_user(server_id, user_id)
     name = user_data['name']
     color = user_data['color'] if user_data['color'] else "None"
     return "{name}'s custom color: {color}".format(name=name, color=color)
@@ -155,8 +199,7 @@ async def set_color(server_id, user_id, color):
     if not botmanager.has_role_permissions(server_id): # Check bot permissions first
         raise bot_exception(EXCEPT_TYPE, "Bot must be able to manage permissions in order to change role colors.")
     if color is None:
-        servermanager.servers_data[server_id]['users'][user_id]['color'] = ''
-        write_data()
+        servermanager.update_record(server_id, 'users', user_id, color='')
         await botmanager.update_color_role(server_id, user_id, None)
         return "Color successfully cleared!"
     if color.startswith('#'): # Just in case people just copy values over
@@ -166,15 +209,14 @@ async def set_color(server_id, user_id, color):
     except ValueError:
         raise bot_exception(EXCEPT_TYPE, "'{}' does not appear to be a valid hex color.".format(color))
     await botmanager.update_color_role(server_id, user_id, converted)
-    servermanager.servers_data[server_id]['users'][user_id]['color'] = '#{}'.format(color.upper())
-    write_data()    
+    servermanager.update_record(server_id, 'users', user_id, color='#{}'.format(color.upper()))
     return "Color successfully set!"
 
 async def update_color(server_id, user_id):
     """Refreshes the color role so that it is on top."""
     if not botmanager.has_role_permissions(server_id):
         raise bot_exception(EXCEPT_TYPE, "Bot must be able to manage permissions in order to change role colors.")
-    color = servermanager.servers_data[server_id]['users'][user_id]['color']
+    color = servermanager.get_record(server_id, 'users', user_id)['color']
     if color:
         converted = int(color[1:], 16)
         await botmanager.update_color_role(server_id, user_id, converted)
@@ -182,65 +224,32 @@ async def update_color(server_id, user_id):
         raise bot_exception(EXCEPT_TYPE, "You currently don't have a custom color!")
     return "Color successfully refreshed!"
 
-async def get_response(command, options, arguments, arguments_blocks, raw_parameters, server_id, channel_id, voice_channel_id, user_id, is_admin, is_private):
-    """Gets a response from the command and parameters."""
-    
-    to_return = ''
-    num_options = len(options)
-    num_arguments = len(arguments)
-    using_shortcut = command in commands_dictionary['shortcut_commands']
-    
-    # User information
-    if (command in ['userinfo', 'info', 'user', 'u'] and (num_options == 0 or
-            (num_options == 1 and options[0] in ['i', 'info']))):
-        if num_arguments == 0: # Self information
-            return get_info(server_id, user_id)
-        else: # Other user information
-            return get_info(server_id, get_user_id(server_id, arguments[0] if num_arguments == 1 else arguments_blocks[0]))
-
-    # User status
-    elif ((command in ['status'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['s', 'status'])):
-        if num_arguments == 0: # Self status
-            return get_status(server_id, user_id)
-        else: # Other user status
-            return get_status(server_id, get_user_id(server_id, arguments[0] if num_arguments == 1 else arguments_blocks[0]))
-
-    # User nickname
-    elif ((command in ['nickname', 'nick'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['n', 'nick', 'nickname'])):
-        if num_arguments == 0: # Self nickname
-            return get_nickname(server_id, user_id)
-        else: # Other user nickname
-            return get_nickname(server_id, get_user_id(server_id, arguments[0] if num_arguments == 1 else arguments_blocks[0]))
-
-    # Modify status
-    elif ((command in ['setstatus'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['ss', 'setstatus'])):
-        if num_arguments == 0: # Clear status
-            return set_status(server_id, user_id, '')
-        else: # Set status
-            return set_status(server_id, user_id, arguments[0] if num_arguments == 1 else arguments_blocks[0])
-
-    # Modify nickname
-    elif ((command in ['setnickname', 'setnick'] and num_options == 0) or
-            (not using_shortcut and num_options == 1 and options[0] in ['setnickname', 'setnick', 'sn'])):
-        if num_arguments == 0: # Clear nickname
-            return set_nickname(server_id, user_id, '')
-        else: # Set nickname
-            return set_nickname(server_id, user_id, arguments[0] if num_arguments == 1 else arguments_blocks[0])
-    
-    # Set role color
-    elif (not using_shortcut and num_options == 1 and options[0] in ['setcolor', 'sc'] and num_arguments <= 1):
-        if num_arguments == 0: # Clear nickname
-            return await set_color(server_id, user_id, None)
-        else: # Set nickname
-            return await set_color(server_id, user_id, arguments[0])
-
-    # Refresh color
-    elif (not using_shortcut and num_options == 1 and options[0] in ['updatecolor', 'uc'] and num_arguments == 0):
-        return await update_color(server_id, user_id)
-    
-    # Invalid command
-    raise bot_exception(EXCEPT_TYPE, "Invalid syntax", get_formatted_usage_string())
+def get_context_user_id(context):
+    """Returns the ID of the user named by the arguments, or of the user themselves if there aren't any."""
+    if context.arguments:
+        return get_user_id(context.server_id, context.get_rest(0))
+    return context.user_id
+
+async def respond_info(context):
+    return get_info(context.server_id, get_context_user_id(context))
+
+async def respond_status(context):
+    return get_status(context.server_id, get_context_user_id(context))
+
+async def respond_nickname(context):
+    return get_nickname(context.server_id, get_context_user_id(context))
+
+async def respond_set_status(context): # No arguments clears it
+    return set_status(context.server_id, context.user_id, context.get_rest(0) if context.arguments else '')
+
+async def respond_set_nickname(context):
+    return set_nickname(context.server_id, context.user_id, context.get_rest(0) if context.arguments else '')
+
+async def respond_set_color(context):
+    return await set_color(context.server_id, context.user_id, context.arguments[0] if context.arguments else None)
+
+async def respond_update_color(context):
+    return await update_color(context.server_id, context.user_id)
 
+async def respond_former_users(context):
+    return get_former_users(context.server_id, context.get_rest(0))
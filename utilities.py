@@ -1,18 +1,37 @@
 import wikipedia, wolframalpha, urllib.parse, urllib.request, json, requests, asyncio
 
-from jshbot import configmanager
+from jshbot import configmanager, syntaxmanager
 from jshbot.jbce import bot_exception
 
-commands_dictionary = {'module_commands':['wikipedia', 'wiki', 'w', 'wolframalpha',
-                                          'wolfram', 'wa', 'shorten', 'shortenurl',
-                                          'rehost', 'define', 'def', 'urbandefine',
-                                          'udef'],
-                       'shortcut_commands':['swiki', 'sw', 'swolfram', 'swa', 'sdef'],
-                       'private_module_commands':['wikipedia', 'wiki', 'w', 'wolframalpha',
-                                                  'wolfram', 'wa', 'shorten', 'shortenurl',
-                                                  'rehost', 'define', 'def', 'urbandefine',
-                                                  'udef'],
-                       'private_shortcut_commands':['swiki', 'sw', 'swolfram', 'swa', 'sdef']}
+WIKIPEDIA_EXCEPTION = "Wikipedia query"
+WOLFRAM_ALPHA_EXCEPTION = "Wolfram|Alpha query"
+URBAN_DICTIONARY_EXCEPTION = "Urban Dictionary query"
+WIKTIONARY_EXCEPTION = "Wiktionary query"
+SHORTENER_EXCEPTION = "URL shortener processor"
+REHOSTER_EXCEPTION = "Imgur rehoster"
+
+EXCEPT_TYPE = "General" # This should never be displayed
+
+# See syntaxmanager. Syntaxes without a function aren't in quite yet.
+command_syntaxes = [
+    {'command':'wikipedia', 'aliases':['wiki', 'w'], 'private':True, 'except_type':WIKIPEDIA_EXCEPTION, 'syntaxes':[
+        {'optional':[['simple', 's', 'url']], 'arguments':(1, None), 'usage':'<query>', 'shortcuts':['swiki', 'sw'],
+            'function':'respond_wikipedia'}]},
+    {'command':'wolframalpha', 'aliases':['wolfram', 'wa'], 'private':True, 'except_type':WOLFRAM_ALPHA_EXCEPTION, 'syntaxes':[
+        {'optional':[['simple', 's']], 'arguments':(1, None), 'usage':'<query>', 'shortcuts':['swolfram', 'swa'],
+            'function':'respond_wolfram_alpha'},
+        {'optional':[['results=<number of results>']], 'arguments':(1, None), 'usage':'<query>',
+            'function':'respond_wolfram_alpha'}]},
+    {'command':'urbandefine', 'aliases':['udef'], 'private':True, 'except_type':URBAN_DICTIONARY_EXCEPTION, 'syntaxes':[
+        {'arguments':(1, None), 'usage':'<word>', 'function':'respond_urban_dictionary'}]},
+    {'command':'define', 'aliases':['def'], 'private':True, 'except_type':WIKTIONARY_EXCEPTION, 'syntaxes':[
+        {'optional':[['simple', 's']], 'arguments':(1, None), 'usage':'<word>', 'shortcuts':['sdef'], 'function':None}]},
+    {'command':'shortenurl', 'aliases':['shorten'], 'private':True, 'except_type':SHORTENER_EXCEPTION, 'syntaxes':[
+        {'arguments':(1, None), 'usage':'<url>', 'function':None}]},
+    {'command':'rehost', 'private':True, 'except_type':REHOSTER_EXCEPTION, 'syntaxes':[
+        {'arguments':(1, None), 'usage':'<image url>', 'function':None}]}]
+
+commands_dictionary = syntaxmanager.get_commands_dictionary(command_syntaxes)
 commands = []
 for command_list in list(commands_dictionary.values()):
     for command in command_list:
@@ -27,29 +46,14 @@ shortener_commands = ['shortenurl', 'shorten']
 rehoster_commands = ['rehost']
 
 multi_usage_strings = {
-'wikipedia_usage_string' : """Usage:
-    !wikipedia [(-simple|s|url) <query>]""",
-
-'wolfram_alpha_usage_string' : """Usage:
-    !wolframalpha [(-simple|s) <query>]
-                  [(-results=<number of results>) <query>]""",
-
-'urban_dictionary_usage_string' : """Usage:
-    !urbandefine [<word>]""",
-
-'wiktionary_usage_string' : """Usage:
-    !define [(-simple|s) <word>]""",
-
-'shortener_usage_string' : """Usage:
-    !shortenurl [<url>]""",
-
-'rehoster_usage_string' : """Usage:
-    !rehost [<image url>]"""
+'wikipedia_usage_string' : syntaxmanager.get_usage_string(command_syntaxes[0]),
+'wolfram_alpha_usage_string' : syntaxmanager.get_usage_string(command_syntaxes[1]),
+'urban_dictionary_usage_string' : syntaxmanager.get_usage_string(command_syntaxes[2]),
+'wiktionary_usage_string' : syntaxmanager.get_usage_string(command_syntaxes[3]),
+'shortener_usage_string' : syntaxmanager.get_usage_string(command_syntaxes[4]),
+'rehoster_usage_string' : syntaxmanager.get_usage_string(command_syntaxes[5])
 }
 
-def get_formatted_usage_string(command):
-    return "\n```\n{}\n```".format(multi_usage_strings['{}_usage_string'.format(command)])
-
 multi_help_strings = {
 'wikipedia_help_string' : """```
 Description:
@@ -122,15 +126,6 @@ Description:
 ```""".format(rehoster_usage_string=multi_usage_strings['rehoster_usage_string'])
 }
 
-WIKIPEDIA_EXCEPTION = "Wikipedia query"
-WOLFRAM_ALPHA_EXCEPTION = "Wolfram|Alpha query"
-URBAN_DICTIONARY_EXCEPTION = "Urban Dictionary query"
-WIKTIONARY_EXCEPTION = "Wiktionary query"
-SHORTENER_EXCEPTION = "URL shortener processor"
-REHOSTER_EXCEPTION = "Imgur rehoster"
-
-EXCEPT_TYPE = "General" # This should never be displayed
-
 def wikipedia_query(query, simple_result=False):
     if not query:
         return "Try searching for *something* next time, knucklehead."
@@ -280,39 +275,18 @@ def get_help_string(command):
     except KeyError:
         return 'Help for command {} was not found. This shouldn\'t happen!'.format(command)
 
-async def get_response(command, options, arguments, arguments_blocks, raw_parameters, server_id, channel_id, voice_channel_id, user_id, is_admin, is_private):
-    """Gets a response from the command and parameters."""
-    
-    to_return = ''
-    num_options = len(options)
-    num_arguments = len(arguments)
-    using_shortcut = command in commands_dictionary['shortcut_commands']
-    
-    # Wikipedia query
-    if command in wikipedia_commands and ((num_options == 1 and options[0] in ['s', 'simple', 'url']) or num_options == 0):
-        simple_result = False
-        if using_shortcut or num_options == 1:
-            simple_result = True
-        return wikipedia_query(arguments[0] if num_arguments == 1 else arguments_blocks[0], simple_result=simple_result)
-    
-    # Wolfram|Alpha query
-    elif (command in wolfram_alpha_commands and num_arguments >= 1 and 
-            ((num_options == 1 and (options[0].startswith('results=') or options[0] in ['s', 'simple']) or num_options == 0))):
-        simple_result = False
-        results_limit = 2
-        if using_shortcut or (num_options == 1 and options[0] in ['s', 'simple']):
-            simple_result = True
-        elif num_options == 1: # Result number specification
-            results_limit = int(options[0][8:])
-        wolfram_query = arguments[0] if num_arguments == 1 else arguments_blocks[0]
-        return wolfram_alpha_query(wolfram_query, simple_result=simple_result, results_limit=results_limit)
-    
-    # Urban Dictionary definition
-    elif command in urban_dictionary_commands and num_arguments >= 1 and num_options == 0:
-        urban_query = arguments[0] if num_arguments == 1 else arguments_blocks[0]
-        return urban_dictionary_definition(urban_query)
-    
-    # Invalid command
-    command, EXCEPT_TYPE = get_command_info(command)
-    raise bot_exception(EXCEPT_TYPE, "Invalid syntax", get_formatted_usage_string(command))
-
+async def respond_wikipedia(context):
+    simple_result = context.shortcut or len(context.options) == 1
+    return wikipedia_query(context.get_rest(0), simple_result=simple_result)
+
+async def respond_wolfram_alpha(context):
+    simple_result = False
+    results_limit = 2
+    if context.shortcut or (context.options and context.options[0] in ['s', 'simple']):
+        simple_result = True
+    elif context.options: # Result number specification
+        results_limit = int(context.options[0][8:])
+    return wolfram_alpha_query(context.get_rest(0), simple_result=simple_result, results_limit=results_limit)
+
+async def respond_urban_dictionary(context):
+    return urban_dictionary_definition(context.get_rest(0))